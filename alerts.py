@@ -0,0 +1,226 @@
+##
+## Alert rules for sensor thresholds, rates of change and stale data
+##
+
+import time
+import logging
+
+
+# severity order, used to pick the worst active level per field
+LEVELS = {'warning': 1, 'error': 2}
+
+# Declarative rule list.  Field names match the MQTT feed names (indoor)
+# and the outdoor probe's feed keys.  Units are the displayed units.
+DEFAULT_RULES = [
+    {'name': 'voc-low', 'message': 'Air quality poor',
+     'type': 'below', 'field': 'Indoor-VOC',
+     'limit': 100_000, 'hysteresis': 5_000, 'level': 'warning'},
+    {'name': 'voc-very-low', 'message': 'Air quality very poor',
+     'type': 'below', 'field': 'Indoor-VOC',
+     'limit': 20_000, 'hysteresis': 2_000, 'level': 'error'},
+    {'name': 'indoor-hot', 'message': 'Indoor temp high',
+     'type': 'above', 'field': 'Indoor-Temp',
+     'limit': 85, 'hysteresis': 1, 'debounce': 2, 'level': 'warning'},
+    {'name': 'indoor-cold', 'message': 'Indoor temp low',
+     'type': 'below', 'field': 'Indoor-Temp',
+     'limit': 55, 'hysteresis': 1, 'debounce': 2, 'level': 'warning'},
+    {'name': 'indoor-humid', 'message': 'Indoor humidity high',
+     'type': 'above', 'field': 'Indoor-Humidity',
+     'limit': 70, 'hysteresis': 3, 'debounce': 2, 'level': 'warning'},
+    {'name': 'indoor-sensor', 'message': 'Indoor sensor fault',
+     'type': 'above', 'field': 'Indoor-Sensor',     # 1 = degraded
+     'limit': 0.5, 'level': 'error'},
+    {'name': 'outdoor-freezing', 'message': 'Freezing outside',
+     'type': 'below', 'field': 'alt-temp',
+     'limit': 33, 'hysteresis': 1, 'level': 'warning'},
+    {'name': 'outdoor-stale', 'message': 'Outdoor data stale',
+     'type': 'stale', 'field': 'alt-temp',
+     'max_age': 15*60, 'level': 'warning'},
+    {'name': 'probe-battery', 'message': 'Probe battery low',
+     'type': 'below', 'field': 'battery-charge',
+     'limit': 15, 'hysteresis': 5, 'level': 'warning'},
+    {'name': 'pressure-falling', 'message': 'Pressure falling fast',
+     'type': 'rate', 'field': 'pressure',
+     'limit': -0.06, 'window': 3*3600, 'level': 'warning'},    # in-Hg/hr
+]
+
+
+class Rule:
+    """Base class for one alert rule watching a single field."""
+
+    def __init__(self, name, field, level='warning', debounce=1,
+                 message=None):
+        self.name = name
+        self.field = field
+        self.level = level
+        self.debounce = debounce
+        self.message = message or name
+        self.active = False
+        self.count = 0          # consecutive samples past the trigger point
+
+    def check(self, value, tstamp):
+        """Return True if VALUE is past the trigger point."""
+        raise NotImplementedError
+
+    def check_clear(self, value, tstamp):
+        """Return True if VALUE is back past the clear point."""
+        return not self.check(value, tstamp)
+
+    def evaluate(self, value, tstamp):
+        """Update state with a new sample, return True if it changed."""
+        if not self.active:
+            if self.check(value, tstamp):
+                self.count += 1
+                if self.count >= self.debounce:
+                    self.active = True
+                    return True
+            else:
+                self.count = 0
+        elif self.check_clear(value, tstamp):
+            self.active = False
+            self.count = 0
+            return True
+        return False
+
+
+class ThresholdRule(Rule):
+    """Trigger above (or below) a limit, clear with some hysteresis."""
+
+    def __init__(self, name, field, limit, above=True, hysteresis=0, **kwargs):
+        super().__init__(name, field, **kwargs)
+        self.limit = limit
+        self.above = above
+        self.hysteresis = hysteresis
+
+    def check(self, value, tstamp):
+        if self.above:
+            return value > self.limit
+        return value < self.limit
+
+    def check_clear(self, value, tstamp):
+        if self.above:
+            return value < self.limit - self.hysteresis
+        return value > self.limit + self.hysteresis
+
+
+class RateRule(Rule):
+    """Trigger when the change per hour over WINDOW seconds passes LIMIT.
+
+    A negative LIMIT means "falling faster than", positive "rising faster".
+    """
+
+    def __init__(self, name, field, limit, window=3600, **kwargs):
+        super().__init__(name, field, **kwargs)
+        self.limit = limit
+        self.window = window
+        self.samples = []
+        self.rate = 0.0
+
+    def check(self, value, tstamp):
+        if not self.samples or self.samples[-1][0] != tstamp:
+            self.samples.append((tstamp, value))
+            while self.samples[0][0] < tstamp - self.window:
+                self.samples.pop(0)
+            t0, v0 = self.samples[0]
+            if tstamp > t0:
+                self.rate = (value - v0) / (tstamp - t0) * 3600
+        if self.limit < 0:
+            return self.rate < self.limit
+        return self.rate > self.limit
+
+
+class StaleRule(Rule):
+    """Trigger when a field hasn't been updated for MAX_AGE seconds."""
+
+    def __init__(self, name, field, max_age, **kwargs):
+        super().__init__(name, field, **kwargs)
+        self.max_age = max_age
+        self.last_update = 0
+        self.active = True      # no data at all counts as stale
+
+    def check(self, value, tstamp):
+        # a new sample arrived - VALUE is None for periodic age checks
+        if value is not None:
+            self.last_update = tstamp
+        return tstamp - self.last_update > self.max_age
+
+
+def make_rule(spec):
+    """Build a Rule from one of the dicts in DEFAULT_RULES."""
+    spec = dict(spec)
+    kind = spec.pop('type')
+    if kind in ('above', 'below'):
+        return ThresholdRule(above=(kind == 'above'), **spec)
+    elif kind == 'rate':
+        return RateRule(**spec)
+    elif kind == 'stale':
+        return StaleRule(**spec)
+    raise ValueError(f'Unknown alert rule type: {kind}')
+
+
+class AlertEngine:
+    """Evaluate rules incrementally as each new sample arrives.
+
+    Rules are indexed by field, so a new sample only touches the rules
+    that watch that field.  LISTENERS are called as fn(rule, active)
+    whenever a rule raises or clears.
+    """
+
+    def __init__(self, rules=None):
+        self.logger = logging.getLogger(__name__)
+        if rules is None:
+            rules = [make_rule(spec) for spec in DEFAULT_RULES]
+        self.rules = rules
+        self.by_field = {}
+        self.stale_rules = []
+        for rule in rules:
+            self.by_field.setdefault(rule.field, []).append(rule)
+            if isinstance(rule, StaleRule):
+                self.stale_rules.append(rule)
+        self.listeners = []
+        # bumped on every raise/clear, so the display knows to redraw
+        self.version = 0
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def update(self, field, value, tstamp=None):
+        if tstamp is None:
+            tstamp = time.time()
+        for rule in self.by_field.get(field, ()):
+            if rule.evaluate(value, tstamp):
+                self.notify(rule)
+
+    def update_values(self, values, tstamp=None):
+        """Feed a list of (field, value) pairs sharing one timestamp."""
+        if tstamp is None:
+            tstamp = time.time()
+        for field, value in values:
+            self.update(field, value, tstamp)
+
+    def check_stale(self, now=None):
+        """Periodic check for data that has stopped arriving."""
+        if now is None:
+            now = time.time()
+        for rule in self.stale_rules:
+            if rule.evaluate(None, now):
+                self.notify(rule)
+
+    def notify(self, rule):
+        self.version += 1
+        state = 'raised' if rule.active else 'cleared'
+        self.logger.info('Alert %s: %s (%s)', state, rule.name, rule.level)
+        for fn in self.listeners:
+            fn(rule, rule.active)
+
+    def get_level(self, *fields):
+        """Return the worst active level for any of FIELDS, or None."""
+        level = None
+        for field in fields:
+            for rule in self.by_field.get(field, ()):
+                if rule.active and LEVELS[rule.level] > LEVELS.get(level, 0):
+                    level = rule.level
+        return level
+
+    def get_active(self):
+        return [rule for rule in self.rules if rule.active]
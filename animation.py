@@ -0,0 +1,254 @@
+##
+## Widget animations - per-widget frame rates, drawn into their own rects
+##
+
+import os
+import math
+import time
+import logging
+
+import pygame as pg
+
+
+ICON_FONT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'meteocons.ttf')
+
+
+class Animation:
+    """Base class for one animated widget on a page.
+
+    The page surface holds the widget's still image; while active(), the
+    Animator restores the widget's rect from the page surface and calls
+    draw() on the display, FPS times a second.  When it stops being
+    active, the rect is restored one last time.
+    """
+    FPS = 10
+
+    def __init__(self, app, fps=None):
+        self.app = app
+        self.fps = fps or self.FPS
+
+    def active(self, now):
+        """Does this need frames right now?"""
+        return True
+
+    def get_rect(self):
+        """Area of the display this draws in (None: nothing to draw)."""
+        raise NotImplementedError
+
+    def next_frame(self, now):
+        """Time the frame after one drawn at NOW is due."""
+        return now + 1 / self.fps
+
+    def draw(self, surface, rect, now):
+        raise NotImplementedError
+
+
+class BlinkingColon(Animation):
+    """The clock's colon, hidden for the second half of each second."""
+    FPS = 2
+
+    def __init__(self, app, slot, y):
+        super().__init__(app)
+        self.slot = slot
+        self.y = y
+
+    def get_rect(self):
+        app = self.app
+        timestr, _ = app.get_time_strings()
+        colon = timestr.find(':')
+        if colon < 0:
+            return None
+        # same positioning as the page's text, from cached advance widths
+        x = (app.center_x(self.slot, timestr) +
+             app.fontmgr.text_width(self.slot, timestr[:colon]))
+        return pg.Rect(x, self.y, app.fontmgr.text_width(self.slot, ':'),
+                       app.fontmgr.slots[self.slot]['height'])
+
+    def next_frame(self, now):
+        # on the half-second, so the blink keeps an even beat
+        return (math.floor(now * 2) + 1) / 2
+
+    def draw(self, surface, rect, now):
+        if now % 1 >= 0.5:
+            surface.fill(self.app.BGCOLOR, rect)
+
+
+class ValueTween(Animation):
+    """Slide a displayed number smoothly from its old value to a new one.
+
+    GET_VALUE returns the current value (None while there's no data, so
+    the first reading doesn't slide up from nothing); FORMAT and
+    GET_COLOR give the text and color the page would use.  RECT must
+    cover the page's own rendering of the value, which is hidden while
+    the intermediate values are drawn.
+    """
+    FPS = 15
+    DURATION = 1.0              # seconds
+
+    def __init__(self, app, rect, slot, get_value, format, get_color):
+        super().__init__(app)
+        self.rect = pg.Rect(rect)
+        self.slot = slot
+        self.get_value = get_value
+        self.format = format
+        self.get_color = get_color
+        self.value = None
+        self.start_value = None
+        self.start_time = 0
+
+    def active(self, now):
+        value = self.get_value()
+        if value != self.value:
+            if self.value is None or value is None:
+                self.start_value = value
+                self.start_time = 0
+            else:
+                self.start_value = self.current(now)
+                self.start_time = now
+            self.value = value
+        return now - self.start_time < self.DURATION
+
+    def current(self, now):
+        t = min(1.0, (now - self.start_time) / self.DURATION)
+        t = t * t * (3 - 2 * t)         # ease in and out
+        return self.start_value + (self.value - self.start_value) * t
+
+    def get_rect(self):
+        return self.rect
+
+    def draw(self, surface, rect, now):
+        surface.fill(self.app.BGCOLOR, rect)
+        text = self.app.raster.get(self.slot, self.format(self.current(now)),
+                                   self.get_color())
+        surface.blit(text, rect.topleft)
+
+
+class WeatherIcon(Animation):
+    """The current conditions icon (meteocons.ttf), gently bobbing."""
+    FPS = 10
+    PERIOD = 4.0                # seconds per bob
+    AMPLITUDE = 6               # pixels
+
+    def __init__(self, app, rect, get_weather, size=160):
+        super().__init__(app)
+        self.rect = pg.Rect(rect)
+        self.get_weather = get_weather
+        self.size = size
+        self.font = None
+        self.glyphs = {}        # (icon, color) -> Surface
+
+    def get_icon(self):
+        weather = self.get_weather()
+        return getattr(weather, 'icon', None)
+
+    def active(self, now):
+        return self.get_icon() is not None
+
+    def get_rect(self):
+        return self.rect
+
+    def glyph(self, icon):
+        key = (icon, tuple(self.app.FGCOLOR))
+        if key not in self.glyphs:
+            if self.font is None:
+                self.font = pg.font.Font(ICON_FONT, self.size)
+            self.glyphs[key] = self.font.render(
+                icon, True, self.app.FGCOLOR).convert_alpha()
+        return self.glyphs[key]
+
+    def draw_still(self, surface):
+        """The icon at rest (part of the page itself)."""
+        icon = self.get_icon()
+        if icon is not None:
+            self.blit(surface, self.glyph(icon), 0)
+
+    def draw(self, surface, rect, now):
+        phase = 2 * math.pi * now / self.PERIOD
+        offset = round(self.AMPLITUDE * math.sin(phase))
+        surface.fill(self.app.BGCOLOR, rect)
+        self.blit(surface, self.glyph(self.get_icon()), offset)
+
+    def blit(self, surface, glyph, offset):
+        pos = glyph.get_rect(center=self.rect.center).move(0, offset)
+        surface.blit(glyph, pos)
+
+
+class Animator:
+    """Draw the current page's animations, each at its own frame rate.
+
+    Only the animations' rects are redrawn (from the cached page surface),
+    and the main loop only needs to wake for the next frame due.  Drawing
+    is held to MAX_CPU of the time: after spending N seconds on a frame,
+    the next waits at least N / MAX_CPU, which lowers the frame rates of
+    everything that's animating if it gets expensive.
+    """
+    MAX_CPU = 0.25
+
+    def __init__(self, max_cpu=MAX_CPU):
+        self.logger = logging.getLogger(__name__)
+        self.max_cpu = max_cpu
+        self.enabled = True
+        self.due = {}           # Animation -> time of its next frame
+        self.shown = {}         # Animation -> rect drawn over the page
+        self.not_before = 0     # CPU budget: no frames until then
+        self.frames = 0
+        self.throttled = 0
+
+    def reset(self):
+        """The display was redrawn from scratch (e.g. a page switch)."""
+        self.due = {}
+        self.shown = {}
+
+    def get_active(self, animations, now):
+        if not self.enabled:
+            return []
+        return [anim for anim in animations if anim.active(now)]
+
+    def time_to_frame(self, animations, now):
+        """Seconds until one of ANIMATIONS needs a frame (inf if none)."""
+        active = self.get_active(animations, now)
+        if any(anim not in active for anim in self.shown):
+            return 0            # one has stopped, and needs its rect restored
+        if not active:
+            return math.inf
+        due = min(self.due.get(anim, 0) for anim in active)
+        return max(0, due - now, self.not_before - now)
+
+    def render(self, display, page_surface, animations, now, full=False):
+        """Draw the frames that are due (all of them if FULL, i.e. the page
+        was just blitted), returning the rects of DISPLAY that changed."""
+        active = self.get_active(animations, now)
+        rects = []
+        # put back the still image of anything that stopped animating
+        for anim in [anim for anim in self.shown if anim not in active]:
+            rect = self.shown.pop(anim)
+            self.due.pop(anim, None)
+            if not full:
+                display.blit(page_surface, rect, rect)
+                rects.append(rect)
+        due = [anim for anim in active if full or now >= self.due.get(anim, 0)]
+        if not due:
+            return rects
+        if not full and now < self.not_before:
+            self.throttled += 1
+            return rects
+        start = time.perf_counter()
+        for anim in due:
+            rect = anim.get_rect()
+            old = self.shown.pop(anim, None)
+            if old is not None and old != rect and not full:
+                display.blit(page_surface, old, old)
+                rects.append(old)
+            self.due[anim] = max(anim.next_frame(now), now)
+            if rect is None:
+                continue
+            if not full:
+                display.blit(page_surface, rect, rect)
+            anim.draw(display, rect, now)
+            self.shown[anim] = rect
+            rects.append(rect)
+        self.frames += 1
+        elapsed = time.perf_counter() - start
+        self.not_before = now + elapsed / self.max_cpu
+        return rects
@@ -0,0 +1,212 @@
+##
+## Per-sensor calibration profiles, stored in a local JSON file
+##
+
+import os
+import sys
+import json
+import bisect
+import socket
+import logging
+import argparse
+
+
+CALIBRATION_FILE = os.path.expanduser('~/.config/weatherclock/calibration.json')
+
+# Used for any sensor without its own entry in the file.  temp_offset is
+# handed to the BME680 driver (it also feeds the driver's humidity and
+# pressure compensation); 'fields' are corrections applied afterwards.
+DEFAULT_PROFILE = {
+    'temp_offset': -3.0,
+    'fields': {},
+}
+
+
+def sensor_id(kind, bus_number, addr):
+    """Identity for a sensor, e.g. 'kitchen-clock/bme680@1:0x77'."""
+    return f'{socket.gethostname()}/{kind}@{bus_number}:{addr:#04x}'
+
+
+def make_poly(coeffs):
+    """Polynomial correction, coefficients highest power first."""
+    coeffs = [float(c) for c in coeffs]
+
+    def correct(values):
+        results = []
+        for x in values:
+            y = 0.0
+            for c in coeffs:
+                y = y * x + c
+            results.append(y)
+        return results
+    return correct
+
+
+def make_points(points):
+    """Piecewise-linear correction through (raw, true) points.
+
+    Outside the calibrated range the first/last segment is extended.
+    """
+    points = sorted((float(raw), float(true)) for raw, true in points)
+    if not points:
+        raise ValueError('no calibration points')
+    xs = [raw for raw, _ in points]
+    if len(set(xs)) != len(xs):
+        raise ValueError(f'duplicate raw values in calibration points: {points}')
+    if len(points) == 1:
+        offset = points[0][1] - points[0][0]
+        return lambda values: [x + offset for x in values]
+    # precompute slope/intercept for each segment
+    segments = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        slope = (y1 - y0) / (x1 - x0)
+        segments.append((slope, y0 - slope * x0))
+    last = len(segments) - 1
+
+    def correct(values):
+        results = []
+        for x in values:
+            i = min(max(bisect.bisect_right(xs, x) - 1, 0), last)
+            slope, intercept = segments[i]
+            results.append(slope * x + intercept)
+        return results
+    return correct
+
+
+def make_correction(spec):
+    if 'poly' in spec:
+        return make_poly(spec['poly'])
+    elif 'points' in spec:
+        return make_points(spec['points'])
+    raise ValueError(f'Unknown calibration spec: {spec}')
+
+
+class Profile:
+    """Compiled corrections for one sensor."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.temp_offset = spec.get('temp_offset', 0.0)
+        self.corrections = {field: make_correction(fspec)
+                            for field, fspec in spec.get('fields', {}).items()}
+
+    def apply(self, field, values):
+        """Correct a whole batch of samples for FIELD at once."""
+        correct = self.corrections.get(field)
+        if correct is None or not values:
+            return values
+        return correct(values)
+
+
+class CalibrationStore:
+    """Load/save calibration profiles, re-reading the file when it changes.
+
+    This is how calibration is set at runtime: edit the file (or use
+    'python calibration.py set ...') and the clock picks it up on its
+    next sensor cycle.
+    """
+
+    def __init__(self, path=CALIBRATION_FILE):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.mtime = None
+        self.data = {}
+        self.profiles = {}
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        self.data = {}
+        if mtime is not None:
+            try:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                self.logger.warning('Bad calibration file %s: %s', self.path, e)
+        self.profiles = {}
+        self.logger.info('Calibration loaded: %d profile(s)', len(self.data))
+        return True
+
+    def get_profile(self, ident):
+        self.reload_if_changed()
+        profile = self.profiles.get(ident)
+        if profile is None:
+            spec = self.data.get(ident, DEFAULT_PROFILE)
+            try:
+                profile = Profile(spec)
+            except (ValueError, TypeError, ZeroDivisionError) as e:
+                self.logger.warning('Bad calibration for %s: %s', ident, e)
+                profile = Profile(DEFAULT_PROFILE)
+            self.profiles[ident] = profile
+        return profile
+
+    def set(self, ident, field=None, spec=None, temp_offset=None):
+        """Update one sensor's profile and save the file."""
+        self.reload_if_changed()
+        entry = self.data.setdefault(ident, json.loads(json.dumps(DEFAULT_PROFILE)))
+        if temp_offset is not None:
+            entry['temp_offset'] = temp_offset
+        if field is not None:
+            # (a hand-edited entry may only have a temp_offset)
+            fields = entry.setdefault('fields', {})
+            if spec is None:
+                fields.pop(field, None)
+            else:
+                make_correction(spec)       # validate before saving
+                fields[field] = spec
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)
+        self.profiles = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Edit sensor calibration')
+    parser.add_argument('--file', default=CALIBRATION_FILE)
+    parser.add_argument('--sensor', default=sensor_id('bme680', 1, 0x77),
+                        help='sensor identity (default: %(default)s)')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('show')
+    p = sub.add_parser('offset', help='driver temperature offset (deg C)')
+    p.add_argument('value', type=float)
+    p = sub.add_parser('poly', help='polynomial, highest power first')
+    p.add_argument('field')
+    p.add_argument('coeffs', type=float, nargs='+')
+    p = sub.add_parser('points', help='piecewise-linear RAW:TRUE points')
+    p.add_argument('field')
+    p.add_argument('points', nargs='+')
+    p = sub.add_parser('clear', help='remove the correction for a field')
+    p.add_argument('field')
+    args = parser.parse_args()
+
+    store = CalibrationStore(args.file)
+    try:
+        if args.cmd == 'show':
+            store.reload_if_changed()
+            json.dump(store.data, sys.stdout, indent=2)
+            print()
+        elif args.cmd == 'offset':
+            store.set(args.sensor, temp_offset=args.value)
+        elif args.cmd == 'poly':
+            store.set(args.sensor, args.field, {'poly': args.coeffs})
+        elif args.cmd == 'points':
+            points = [[float(v) for v in pt.split(':')] for pt in args.points]
+            store.set(args.sensor, args.field, {'points': points})
+        elif args.cmd == 'clear':
+            store.set(args.sensor, args.field, None)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__" :
+    main()
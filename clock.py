@@ -4,16 +4,42 @@
 ##
 
 
-import pygame as pg
+import os
 import time
-import datetime
+PROCESS_START = time.perf_counter()     # reference point for startup timing
+
+# no banner on stdout - 'clock.py export' may be writing data there
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame as pg
+PYGAME_IMPORTED = time.perf_counter()
+import math
 import asyncio
 import logging
+import signal
+import argparse
 
+# The heavy subsystem modules (mqtt -> paho/ssl/secrets, sensor ->
+# smbus2/bme680) are imported lazily by App.start_subsystems(), after
+# the first frame is on screen.
 #from secrets import secrets
 #from weather import OpenWeather
-from mqtt import MQTT_Listener
-from sensor import BME_Probe
+from history import History, open_store
+import export
+from power import PowerManager
+from alerts import AlertEngine
+from metrics import Metrics, MetricsServer, Summary
+from mirror import FrameMirror
+from watchdog import TaskSupervisor, SystemdWatchdog, sd_notify
+from touch import GestureRecognizer
+from logsetup import setup_logging
+from startup import StartupProfile
+from fonts import FontManager
+from raster import TextRasterizer, benchmark
+from units import UnitSystem
+from clocksource import MinuteClock
+from config import Config, ConfigError, OPTIONS, add_arguments, from_args
+from pages import (PageManager, ClockPage, IndoorPage, OutdoorPage,
+                   ForecastPage, HistoryPage)
 
 
 def run_once(loop):
@@ -22,23 +48,37 @@ def run_once(loop):
     loop.run_forever()
 
 
-def get_time_strings():
-    """Wrapper function to convert current time/date into a pair of strings."""
-    USE_AMPM = True
-    now = datetime.datetime.now()
-    if USE_AMPM:
-        timestr = now.strftime('%l:%M %P')
-    else:
-        timestr = now.strftime('%H:%M')
-    #datestr = now.strftime('%a, %b %e, %Y')
-    # 'Tue, Dec 7, 2024'
-    datestr = now.strftime('%A, %B %e, %Y')
-    # 'Tuesday, December 7, 2024'
+class BackgroundLoop(asyncio.SelectorEventLoop):
+    """The App's bgloop, which only runs when the main loop calls run_once().
+
+    So that the main loop can sleep in pg.event.wait() rather than poll,
+    work handed over from other threads (executor results, MQTT updates)
+    posts WAKE_EVENT, and next_wait() says when the next timer is due.
+    (Sockets - the metrics and mirror servers - still need polling.)
+    """
+    WAKE_EVENT = pg.event.custom_type()
+
+    def call_soon_threadsafe(self, callback, *args, context=None):
+        handle = super().call_soon_threadsafe(callback, *args, context=context)
+        try:
+            pg.event.post(pg.event.Event(self.WAKE_EVENT))
+        except pg.error:
+            pass            # no display (yet, or any more) - nobody to wake
+        return handle
 
-    return timestr, datestr
+    def next_wait(self):
+        """Seconds until a callback or timer is due (inf if none)."""
+        # _ready/_scheduled are asyncio's own, but this is our subclass
+        if self._ready:
+            return 0
+        if self._scheduled:
+            return max(0, self._scheduled[0].when() - self.time())
+        return math.inf
 
 
 class App:
+    # Defaults only - the settings come from config.py (TOML file, env
+    # and command line), and are copied over these by apply_config()
     WIDTH = 1024
     HEIGHT = 600
     #BGCOLOR = (30, 0, 40)    # dark purple
@@ -48,106 +88,656 @@ class App:
     FGWARNING = (255, 255, 0)  # yellow
     FGERROR = (255, 0 , 0)     # red
     MQTT_SERVER = "io.adafruit.com"
+    MQTT_PERSIST = True         # persistent session, see MQTT_Listener
+    MQTT_CLIENT_ID = None
     UPDATE_INTERVAL = 5 * 60
-
-    def __init__(self):
-        self.logger = logging.getLogger()
+    UPDATE_STALL = 2            # update intervals before an update is stalled
+    USE_AMPM = True
+    BUS_NUMBER = 1              # I2C bus of the BME680 (and extra devices)
+    SENSOR_ADDR = 0x77
+    SENSOR_SOURCE = 'i2c'       # or 'shared': readings from the sensor daemon
+    BOOT_FPS = 10               # loop rate until the subsystems are up
+    PAGE_TRANSITION = 'slide'   # or 'fade'
+    METRICS_PORT = None         # e.g. 9105 to serve /metrics on localhost
+    METRICS_SOCKET = None       # or a Unix socket path
+    MIRROR_PORT = None          # e.g. 8080 to mirror the screen over HTTP
+    MIRROR_HOST = '127.0.0.1'
+    # extra devices sharing the BME680's I2C bus, as (type, address)
+    I2C_DEVICES = []            # e.g. [('bh1750', 0x23), ('bme680', 0x76)]
+    UNITS = 'imperial'          # display units: 'imperial' or 'metric'
+    PUBLISH_ADAFRUIT = True     # indoor readings/alerts to the Adafruit feeds
+    HA_SERVER = None            # ... and/or a Home Assistant MQTT broker
+    HA_PORT = 1883
+    HA_PREFIX = 'homeassistant'
+    HA_NODE_ID = None           # default: the hostname
+    HISTORY_PATH = None         # SQLite file for all readings (see export.py)
+    HISTORY_RETENTION = 400     # days
+    # font slot -> (name, size)
+    FONTS = {'CLOCK': ('freesans', 200), 'LARGE': ('freesans', 120),
+             'MEDIUM': ('freesans', 48), 'SMALL': ('freesans', 32)}
+
+    def __init__(self, profile=None, config=None):
+        self.logger = logging.getLogger(__name__)
+        if profile is None:
+            profile = StartupProfile()
+        self.profile = profile
         self.running = True
         self.display = None
         self.fonts = None
+        self.fontmgr = None
+        self.raster = None
         self.size = (self.WIDTH, self.HEIGHT)
         self.next_update = 0
-        self.bgloop = asyncio.new_event_loop()
+        self.bgloop = BackgroundLoop()
+        self.tasks = TaskSupervisor(self.bgloop)
+        self.watchdog = SystemdWatchdog()
         # self.weather = OpenWeather()
-        self.mqtt = MQTT_Listener(host=self.MQTT_SERVER, secure=True)
-        self.sensor = BME_Probe()
-
-    def on_init(self):
-        pg.init()
-
-        # print out some info
-        fb_size = (pg.display.Info().current_w,
-                   pg.display.Info().current_h)
-        self.logger.info("Default Framebuffer size: %d x %d" %
-                         (fb_size[0], fb_size[1]))
-        self.logger.info(f'Chosen window size: {self.size}')
-
-        # Use pygame.FULLSCREEN for kiosk mode
-        if fb_size[1] > self.size[1] + 100:
-            self.display = pg.display.set_mode(self.size, pg.SHOWN)
+        # created in the background by start_subsystems()
+        self.mqtt = None
+        self.publishers = None
+        self.sensor = None
+        self.i2c = None
+        self.i2c_sched = None
+        self.sensor_super = None
+        self.boot_timestr = None
+        self.history = History()
+        self.pages = None
+        self.last_outdoor = 0
+        self.power = PowerManager()
+        self.dim_overlay = None
+        self.alerts = AlertEngine()
+        self.alerts.add_listener(self.on_alert)
+        self.next_stale_check = 0
+        self.frame_stats = Summary()
+        self.sensor_stats = Summary()
+        self.metrics_server = None
+        self.mirror = None
+        self.touch = None
+        self.touch_wakes = False
+        self.next_frame = 0
+        self.woke_event = None
+        self.reload_pending = False
+        # time/date strings, re-formatted only once a minute
+        self.clocksrc = MinuteClock(on_prepare=self.prefetch_time)
+        if config is None:
+            config = Config()
+        self.config = config
+        self.apply_config(config)
+
+    def apply_config(self, config, changed=None):
+        """Copy CONFIG's settings onto the App and its subsystems.
+
+        With CHANGED (setting names, after a reload) only the parts of the
+        app those settings belong to are updated or re-initialized.
+        """
+        groups = config.groups(changed)
+        if changed is None:
+            self.WIDTH = config['display.width']
+            self.HEIGHT = config['display.height']
+            self.size = (self.WIDTH, self.HEIGHT)
+            self.BUS_NUMBER = config['sensor.bus_number']
+            self.SENSOR_SOURCE = config['sensor.source']
+            self.I2C_DEVICES = config['i2c.devices']
+            self.HISTORY_PATH = config['history.path']
+        elif 'restart' in groups:
+            self.logger.warning('Restart needed to apply: %s', ', '.join(
+                sorted(name for name in changed
+                       if OPTIONS[name].group == 'restart')))
+
+        if 'colors' in groups:
+            self.BGCOLOR = config['colors.background']
+            self.FGCOLOR = config['colors.foreground']
+            self.FGWARNING = config['colors.warning']
+            self.FGERROR = config['colors.error']
+            if self.raster:
+                self.raster.set_background(self.BGCOLOR)
+        if 'clock' in groups:
+            self.USE_AMPM = config['clock.use_ampm']
+            self.clocksrc.use_ampm = self.USE_AMPM
+            self.clocksrc.reset()
+            self.boot_timestr = None
+        if 'units' in groups:
+            self.UNITS = config['display.units']
+            self.units = UnitSystem(self.UNITS)
+        if 'render' in groups:
+            self.BOOT_FPS = config['render.boot_fps']
+            self.PAGE_TRANSITION = config['render.page_transition']
+            if self.pages:
+                self.configure_pages(self.pages)
+
+        if 'sampling' in groups:
+            self.UPDATE_INTERVAL = config['sensor.update_interval']
+            self.next_update = min(self.next_update,
+                                   time.time() + self.UPDATE_INTERVAL)
+            if self.sensor:
+                self.configure_sensor(self.sensor)
+        if 'sensor' in groups:
+            self.SENSOR_ADDR = config['sensor.address']
+            if self.sensor and self.sensor.addr != self.SENSOR_ADDR:
+                # the supervisor does the actual re-probe, off-thread
+                self.sensor.set_address(self.SENSOR_ADDR)
+                self.sensor_super.retry_now()
+
+        if 'power' in groups:
+            self.power.configure(config['power.schedule'],
+                                 config['power.inactivity_timeout'],
+                                 config['power.wake_time'],
+                                 config['power.dim_level'])
+        if 'mqtt' in groups:
+            self.MQTT_SERVER = config['mqtt.server']
+            self.MQTT_PERSIST = config['mqtt.persist']
+            self.MQTT_CLIENT_ID = config['mqtt.client_id']
+            if self.mqtt:
+                self.tasks.run('mqtt-reconnect', self.reconnect_mqtt)
+        if 'publish' in groups:
+            self.PUBLISH_ADAFRUIT = config['publish.adafruit']
+            self.HA_SERVER = config['homeassistant.server']
+            self.HA_PORT = config['homeassistant.port']
+            self.HA_PREFIX = config['homeassistant.prefix']
+            self.HA_NODE_ID = config['homeassistant.node_id']
+            if self.publishers:
+                self.tasks.run('publishers', self.restart_publishers)
+        if 'metrics' in groups:
+            self.METRICS_PORT = config['metrics.port']
+            self.METRICS_SOCKET = config['metrics.socket']
+            if self.pages:
+                self.tasks.run('metrics', self.restart_metrics)
+        if 'mirror' in groups:
+            self.MIRROR_PORT = config['mirror.port']
+            self.MIRROR_HOST = config['mirror.host']
+            if self.pages:
+                self.tasks.run('mirror', self.restart_mirror)
+        if 'history' in groups:
+            self.HISTORY_RETENTION = config['history.retention_days']
+            if self.history.store:
+                self.history.store.retention_days = self.HISTORY_RETENTION
+        if 'logging' in groups:
+            logging.getLogger().setLevel(config['log.level'])
+
+        if self.display and groups & {'colors', 'power'}:
+            self.update_dim_overlay()
+        if self.pages and groups & {'colors', 'clock', 'units', 'render'}:
+            self.pages.invalidate()
+            self.pages.prefetch()
+
+    def on_sighup(self, signum, frame):
+        # just flag it - the reload runs from the main loop
+        self.reload_pending = True
+
+    def reload_config(self):
+        """Re-read the config (on SIGHUP), keeping the old one if it's bad."""
+        self.reload_pending = False
+        try:
+            config = self.config.reload()
+        except ConfigError as e:
+            self.logger.error('Config reload failed, keeping old settings:\n%s', e)
+            return False
+        changed = config.changed(self.config)
+        self.config = config
+        if changed:
+            self.logger.info('Config reloaded, changed: %s',
+                             ', '.join(sorted(changed)))
+            self.apply_config(config, changed)
         else:
-            self.display = pg.display.set_mode(self.size, pg.FULLSCREEN)
-
-        self.logger.info(f'PyGame driver = {pg.display.get_driver()}')
+            self.logger.info('Config reloaded, no changes')
+        return True
+
+    def configure_pages(self, pages):
+        pages.transition = self.PAGE_TRANSITION
+        pages.IDLE_FPS = self.config['render.idle_fps']
+        pages.animator.enabled = self.config['render.animations']
+        pages.animator.max_cpu = self.config['render.max_cpu']
+        pages.TRANSITION_FPS = self.config['render.transition_fps']
+
+    def configure_sensor(self, probe):
+        probe.NUM_PTS = self.config['sensor.num_points']
+        probe.INTVL = self.config['sensor.sample_interval']
+        probe.PAUSE_TIME = self.config['sensor.pause_time']
+        probe.HEATER_SEQUENCE = tuple(self.config['sensor.heater_sequence'])
+
+    def update_dim_overlay(self):
+        # used to fake DIM mode if there's no backlight control
+        self.dim_overlay = pg.Surface(self.size).convert()
+        self.dim_overlay.fill(self.BGCOLOR)
+        self.dim_overlay.set_alpha(int(255 * (1 - self.power.DIM_LEVEL)))
 
-        # Initialise font support
-        pg.font.init()
-        self.fonts = {}
-        self.fonts['CLOCK'] = pg.font.SysFont('freesans', 200)
-        self.fonts['LARGE'] = pg.font.SysFont('freesans', 120)
-        self.fonts['MEDIUM'] = pg.font.SysFont('freesans', 48)
-        self.fonts['SMALL'] = pg.font.SysFont('freesans', 32)
-        #self.fonts['SMALL'] = pg.font.SysFont('freesans', 16, bold=True)
-        #self.fonts['ICON'] = pg.font.Font('meteocons.ttf', 48)
-
-        # Hide mouse cursor:
-        pg.mouse.set_visible(False)
-
-        self.clock = pg.time.Clock()
+    def on_init(self):
+        ## Stage 1: display
+        with self.profile.stage('display'):
+            pg.init()
+
+            # print out some info
+            fb_size = (pg.display.Info().current_w,
+                       pg.display.Info().current_h)
+            self.logger.info('Default Framebuffer size: %d x %d',
+                             fb_size[0], fb_size[1])
+            self.logger.info('Chosen window size: %s', self.size)
+
+            # Use pygame.FULLSCREEN for kiosk mode
+            if fb_size[1] > self.size[1] + 100:
+                self.display = pg.display.set_mode(self.size, pg.SHOWN)
+            else:
+                self.display = pg.display.set_mode(self.size, pg.FULLSCREEN)
+
+            self.logger.info('PyGame driver = %s', pg.display.get_driver())
+
+            # Hide mouse cursor:
+            pg.mouse.set_visible(False)
+            time.sleep(0.1)       # brief delay to let driver init settle
+
+        ## Stage 2: fonts
+        with self.profile.stage('fonts'):
+            pg.font.init()
+            # paths and metrics come from a disk cache after the first run
+            self.fontmgr = FontManager()
+            self.fonts = {slot: self.fontmgr.load(slot, name, size)
+                          for slot, (name, size) in self.FONTS.items()}
+            #self.fonts['SMALL'] = self.fontmgr.load('SMALL', 'freesans', 16, bold=True)
+            #self.fonts['ICON'] = pg.font.Font('meteocons.ttf', 48)
+            self.fontmgr.save_cache()
+            self.raster = TextRasterizer(self.fonts, background=self.BGCOLOR)
+            self.prefetch_time(*self.clocksrc.upcoming)
+
+        ## Stage 3: get the time on screen as soon as possible
+        with self.profile.stage('first-frame'):
+            self.draw_boot_frame()
+        self.profile.mark('first-frame')
+
+        self.update_dim_overlay()
+
+        ## Stage 4: everything else, in the background
+        self.tasks.run('startup', self.start_subsystems)
+
+        self.touch = GestureRecognizer(on_press=self.on_touch_press,
+                                       on_release=self.on_touch_release,
+                                       on_gesture=self.on_gesture)
         self.running = True
-        time.sleep(0.1)           # brief delay to let driver init settle
         return self.running
+
+    def draw_boot_frame(self):
+        """Plain clock screen, shown until the subsystems are up."""
+        timestr, datestr = self.get_time_strings()
+        if timestr == self.boot_timestr:
+            return
+        self.boot_timestr = timestr
+        self.display.fill(self.BGCOLOR)
+        # through the rasterizer: prefetches may be using the fonts already
+        surface = self.raster.get('CLOCK', timestr, self.FGCOLOR)
+        self.display.blit(surface, (self.center_x('CLOCK', timestr), 50))
+        surface = self.raster.get('MEDIUM', datestr, self.FGCOLOR)
+        self.display.blit(surface, (self.center_x('MEDIUM', datestr), 270))
+        surface = self.raster.get('SMALL', 'Starting...', self.FGCOLOR)
+        self.display.blit(surface, (65, 400))
+        pg.display.update()
+
+    def init_mqtt(self):
+        mqtt = self.profile.import_module('mqtt')
+        with self.profile.stage('mqtt-connect'):
+            return mqtt.MQTT_Listener(host=self.MQTT_SERVER, secure=True,
+                                      persist=self.MQTT_PERSIST,
+                                      client_id=self.MQTT_CLIENT_ID)
+
+    def init_sensor(self):
+        if self.SENSOR_SOURCE == 'shared':
+            sensorshm = self.profile.import_module('sensorshm')
+            return sensorshm.SharedSensor()
+        sensor = self.profile.import_module('sensor')
+        i2cbus = self.profile.import_module('i2cbus')
+        with self.profile.stage('sensor-probe'):
+            # one SMBus handle shared by the BME680 and any extra devices
+            self.i2c = i2cbus.open_bus(self.BUS_NUMBER)
+            probe = sensor.BME_Probe(bus=self.i2c, addr=self.SENSOR_ADDR,
+                                     bus_number=self.BUS_NUMBER)
+            self.configure_sensor(probe)
+            if self.i2c and self.I2C_DEVICES:
+                devices = [i2cbus.DEVICE_TYPES[kind](self.i2c, addr)
+                           for kind, addr in self.I2C_DEVICES]
+                self.i2c_sched = i2cbus.BusScheduler(
+                    self.i2c, devices, on_reading=self.on_i2c_reading)
+            return probe
+
+    def init_history(self):
+        if not self.HISTORY_PATH:
+            return
+        with self.profile.stage('history-load'):
+            self.history.store = open_store(self.HISTORY_PATH,
+                                            self.HISTORY_RETENTION)
+            if self.history.store:
+                # the last day again, so the history page survives restarts
+                self.history.load()
+
+    async def start_subsystems(self):
+        """Import and create the MQTT and sensor subsystems off-thread."""
+        loop = asyncio.get_running_loop()
+        with self.profile.stage('subsystems'):
+            try:
+                self.mqtt, self.sensor, _ = await asyncio.gather(
+                    loop.run_in_executor(None, self.init_mqtt),
+                    loop.run_in_executor(None, self.init_sensor),
+                    loop.run_in_executor(None, self.init_history))
+            except Exception:
+                # same outcome as failing in __init__ used to have:
+                # exit and let systemd restart us
+                self.logger.exception('Subsystem startup failed')
+                self.running = False
+                return
+
+            self.hook_mqtt(loop)
+            await self.restart_publishers()
+            if self.mqtt.get_curr_values():
+                self.on_outdoor_update(dict(self.mqtt.get_curr_values()))
+
+            pages = [ClockPage(self), IndoorPage(self), OutdoorPage(self),
+                     ForecastPage(self), HistoryPage(self)]
+            self.pages = PageManager(self, pages)
+            self.configure_pages(self.pages)
+            self.pages.prefetch()
+
+            if self.i2c_sched:
+                self.tasks.run('i2c-devices', self.i2c_sched.run, restart=True)
+
+            sensor = self.profile.import_module('sensor')
+            self.sensor_super = sensor.SensorSupervisor(
+                self.sensor, on_change=self.on_sensor_health)
+            self.tasks.run('sensor-supervisor', self.sensor_super.run,
+                           restart=True)
+
+            await self.start_metrics()
+            await self.start_mirror()
+        self.profile.mark('subsystems-ready')
+        sd_notify('READY=1')
+        self.next_update = 0
+        self.profile.report()
+
+    def hook_mqtt(self, loop):
+        # outdoor samples arrive on the paho thread - hand them to bgloop
+        self.mqtt.on_update = lambda values: loop.call_soon_threadsafe(
+            self.on_outdoor_update, values)
+
+    async def reconnect_mqtt(self):
+        """New connection for a changed server; the old one is kept on failure."""
+        loop = asyncio.get_running_loop()
+        try:
+            mqtt = await loop.run_in_executor(None, self.init_mqtt)
+        except Exception:
+            self.logger.exception('MQTT reconnect to %s failed', self.MQTT_SERVER)
+            return
+        old, self.mqtt = self.mqtt, mqtt
+        mqtt.values.update(old.values)
+        self.hook_mqtt(loop)
+        await loop.run_in_executor(None, old.close)
+
+    def init_publishers(self):
+        publish = self.profile.import_module('publish')
+        backends = []
+        if self.PUBLISH_ADAFRUIT:
+            backends.append(publish.AdafruitPublisher(lambda: self.mqtt))
+        if self.HA_SERVER:
+            backends.append(publish.HomeAssistantPublisher(
+                self.HA_SERVER, self.HA_PORT, self.HA_PREFIX, self.HA_NODE_ID))
+        return publish.Publishers(backends)
+
+    async def restart_publishers(self):
+        loop = asyncio.get_running_loop()
+        try:
+            publishers = await loop.run_in_executor(None, self.init_publishers)
+        except Exception:
+            self.logger.exception('Publisher setup failed')
+            return
+        old, self.publishers = self.publishers, publishers
+        if old:
+            await loop.run_in_executor(None, old.close)
+
+    async def start_metrics(self):
+        if self.METRICS_PORT or self.METRICS_SOCKET:
+            self.metrics_server = MetricsServer(
+                Metrics(self), port=self.METRICS_PORT,
+                path=self.METRICS_SOCKET)
+            await self.metrics_server.start()
+
+    async def start_mirror(self):
+        if self.MIRROR_PORT:
+            self.mirror = FrameMirror(self.display, port=self.MIRROR_PORT,
+                                      host=self.MIRROR_HOST,
+                                      max_fps=self.config['mirror.max_fps'])
+            await self.mirror.start()
+
+    async def restart_mirror(self):
+        if self.mirror:
+            self.mirror.close()
+            self.mirror = None
+        await self.start_mirror()
+
+    async def restart_metrics(self):
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        await self.start_metrics()
  
     def on_event(self, event):
         if event.type == pg.QUIT:
             self.running = False
         elif event.type == pg.KEYDOWN:
+            self.power.wake('keypress')
             keys = pg.key.get_pressed()
             if keys[pg.K_q]:
                 self.running = False
-        # Could maybe use mouse-presses for UI buttons (someday)...
+            elif self.pages is None:
+                pass
+            elif keys[pg.K_RIGHT]:
+                self.pages.next_page()
+            elif keys[pg.K_LEFT]:
+                self.pages.prev_page()
+        elif self.touch:
+            self.touch.handle(event)
+
+    def on_touch_press(self, pos):
+        # when dimmed or blanked, a touch only wakes the display up
+        self.touch_wakes = self.power.is_low_power()
+        self.power.wake('touch')
+        if self.pages and not self.touch_wakes:
+            self.update_rect(self.pages.press(self.display, pos))
+
+    def on_touch_release(self):
+        if self.pages:
+            self.update_rect(self.pages.release(self.display))
+
+    def on_gesture(self, gesture):
+        if self.pages and not self.touch_wakes:
+            self.pages.on_gesture(gesture)
+
+    def update_rect(self, rect):
+        """Show just RECT now (touch feedback), without a full frame."""
+        if rect:
+            pg.display.update(rect)
+            if self.mirror:
+                self.mirror.mark_dirty()
 
     def on_loop(self):
+        if self.reload_pending:
+            self.reload_config()
+
         now = time.time()
-        if now > self.next_update:
+        self.clocksrc.tick(now)
+        # (sensor_super is the last thing start_subsystems() sets up that
+        # an update needs - the sensor itself comes well before that)
+        if self.sensor_super and now > self.next_update:
             self.do_update()
             self.next_update = now + self.UPDATE_INTERVAL
 
+        if now > self.next_stale_check:
+            self.alerts.check_stale(now)
+            self.next_stale_check = now + 60
+
+        if self.mirror:
+            self.mirror.poll(now)
+
+        # only while both loops are making progress
+        self.watchdog.check(self.tasks.stalled(now), now)
+
         # run any BG tasks
         run_once(self.bgloop)
 
-        # waiting too long hurts keypress latency
-        #pg.time.wait(100)       # in msec
-        self.clock.tick(1)
+        if self.power.update() and self.pages:
+            # mode changed - force a full redraw (or blank the screen)
+            self.pages.invalidate()
+            self.pages.rotate = not self.power.is_low_power()
+            self.pages.animate = not self.power.is_low_power()
+            if self.power.is_blanked():
+                self.display.fill(self.BGCOLOR)
+                pg.display.update()
+                if self.mirror:
+                    self.mirror.mark_dirty()
+
+        now = time.time()
+        if self.power.is_low_power():
+            # sleep until an event arrives or there's work to do
+            self.wait_for_event(min(self.power.get_wait_time(),
+                                    self.idle_wait(now)))
+        else:
+            # only run at a steady rate while a page transition is running
+            # (and while starting up, so subsystems come up promptly);
+            # animations wake us for just the frames they need
+            fps = self.pages.get_fps() if self.pages else self.BOOT_FPS
+            if fps:
+                if now >= self.next_frame:
+                    self.next_frame = now + 1 / fps
+                else:
+                    self.next_frame = min(self.next_frame, now + 1 / fps)
+                wait = self.next_frame - now
+            else:
+                wait = self.idle_wait(now)
+            if self.pages:
+                wait = min(wait, self.pages.time_to_frame(now))
+            # sleep until the next frame is due, but wake up at once for
+            # input (so touches don't need a higher frame rate), and right
+            # at the minute flip rather than up to a frame later
+            self.wait_for_event(min(wait, self.clocksrc.time_to_flip()))
+
+    def idle_wait(self, now):
+        """Seconds the main loop may sleep with nothing to draw: until
+        background work is due (or another thread wakes it)."""
+        wait = min(self.bgloop.next_wait(), self.next_stale_check - now,
+                   self.watchdog.time_to_ping(now))
+        if self.sensor_super:
+            wait = min(wait, self.next_update - now)
+        if self.metrics_server:
+            wait = min(wait, self.metrics_server.MAX_LATENCY)
+        if self.mirror:
+            wait = min(wait, self.mirror.MAX_LATENCY)
+        return wait
+
+    def wait_for_event(self, wait):
+        """Sleep up to WAIT seconds, returning early if an event arrives."""
+        if wait <= 0:
+            return      # pg.event.wait(0) would block until the next event
+        event = pg.event.wait(max(1, int(wait * 1000)))
+        if event.type != pg.NOEVENT:
+            # handled first next time round (re-posting it would put it
+            # behind anything that arrived since, e.g. a button-up)
+            self.woke_event = event
+
+    def get_events(self):
+        events = pg.event.get()
+        if self.woke_event:
+            events.insert(0, self.woke_event)
+            self.woke_event = None
+        return events
 
 
     async def update_start(self):
-        #start = time.perf_counter()
-        #start = time.time()
+        start = time.perf_counter()
 
         results = await self.sensor.read_loop()
 
-        #stop = time.time()
-        #duration = (stop - start) * 1000
-
+        self.sensor_stats.observe(time.perf_counter() - start)
         return results
 
-    async def update_end(self, task):
-        # wait for the BME680 update task to finish
-        await task
+    async def update(self):
+        results = await self.update_start()
+        if results is None or not self.sensor.last_update:
+            # nothing read (e.g. no sensor daemon yet): the last values are
+            # placeholders, not readings - don't publish, record or alert
+            self.sensor_super.check()
+            return
+        self.update_end()
+
+    def update_end(self):
         values = [('Indoor-Temp', self.sensor.get_last_temp()),
                   ('Indoor-Humidity', self.sensor.get_last_humidity()),
                   ('Indoor-Pressure', self.sensor.get_last_barom()),
                   ('Indoor-VOC', self.sensor.get_last_voc()),
                   ]
         # in theory, this should be an async publish
-        self.mqtt.publish_indoor(values)
+        self.publishers.publish_indoor(values)
+        self.record_history(values)
+        self.alerts.update_values(values)
+        self.sensor_super.check()
+        # get the new value strings rasterized before the next redraw
+        self.pages.prefetch()
+
+    def on_outdoor_update(self, values):
+        tstamp = values.pop('timestamp', None)
+        self.alerts.update_values(values.items(), tstamp)
+        if self.pages:
+            self.pages.prefetch()
+
+    def on_sensor_health(self, healthy):
+        # shows up like any other alert (color, banner, MQTT)
+        self.alerts.update('Indoor-Sensor', 0 if healthy else 1)
+        if self.pages:
+            self.pages.prefetch()
+
+    def on_i2c_reading(self, device, values):
+        self.history.add_values(values)
+        self.alerts.update_values(values)
+
+    def on_alert(self, rule, active):
+        if self.publishers:
+            self.publishers.publish_alert(rule.name, rule.level, rule.message,
+                                          active)
+        if active:
+            self.power.wake(f'alert {rule.name}')
+
+    def get_alert_color(self, *fields):
+        level = self.alerts.get_level(*fields)
+        if level == 'error':
+            return self.FGERROR
+        elif level == 'warning':
+            return self.FGWARNING
+        return self.FGCOLOR
+
+    def record_history(self, indoor_values):
+        self.history.add_values(indoor_values)
+        # outdoor values only get recorded if the probe has sent new data
+        probe_vals = self.mqtt.get_curr_values()
+        tstamp = probe_vals.get('timestamp', 0)
+        if tstamp > self.last_outdoor:
+            self.last_outdoor = tstamp
+            self.history.add_values(
+                [(key, val) for key, val in probe_vals.items()
+                 if key != 'timestamp'], tstamp)
+
+    def get_time_strings(self):
+        return self.clocksrc.get_strings()
+
+    def prefetch_time(self, timestr, datestr):
+        # get the next minute's clock text rendered ahead of the flip
+        if self.raster:
+            self.raster.prefetch('CLOCK', timestr, self.FGCOLOR)
+            self.raster.prefetch('MEDIUM', datestr, self.FGCOLOR)
+
+    def center_x(self, slot, text):
+        """X position that centers TEXT, from cached font metrics."""
+        return (self.WIDTH - self.fontmgr.text_width(slot, text)) // 2
 
     def do_update(self):
         self.logger.debug('do_update() called...')
 
-        task = self.bgloop.create_task(self.update_start())
-        self.bgloop.create_task(self.update_end(task))
+        # (a cycle still running from last time gets cancelled, and a
+        # failed one is retried with backoff - see TaskSupervisor)
+        self.tasks.run('update', self.update, restart=True,
+                       timeout=self.UPDATE_STALL * self.UPDATE_INTERVAL)
 
         #     self.weather.update_weather(self.weather.get_weather_info())
         #     self.logger.info(
@@ -158,152 +748,113 @@ class App:
 
 
     def on_render(self):
-        self.display.fill(self.BGCOLOR)
-
-        timestr, datestr = get_time_strings()
-        surface = self.fonts['CLOCK'].render(
-            timestr,
-            True, 
-            self.FGCOLOR)
-        self.display.blit(surface, (80, 50))
-        surface = self.fonts['MEDIUM'].render(
-            datestr,
-            True, 
-            self.FGCOLOR)
-        self.display.blit(surface, (260, 270))
-
-        # surface = self.fonts['MEDIUM'].render(
-        #     self.weather.city_name,
-        #     True,
-        #     self.FGCOLOR)
-        # self.display.blit(surface, (50, 190))
-        # surface = self.fonts['ICON'].render(
-        #     self.weather.icon,
-        #     True,
-        #     self.FGCOLOR)
-        # self.display.blit(surface, (50, 230))
-        # surface = self.fonts['MEDIUM'].render(
-        #     self.weather.temperature,
-        #     True,
-        #     self.FGCOLOR)
-        # self.display.blit(surface, (120, 230))
-        # surface = self.fonts['SMALL'].render(
-        #     self.weather.description,
-        #     True,
-        #     self.FGCOLOR)
-        # self.display.blit(surface, (120, 260))
-
-        ## Outdoor block
-        block_x = 780
-        probe_vals = self.mqtt.get_curr_values()
-        is_current = self.mqtt.is_data_current()
-        surface = self.fonts['SMALL'].render(
-            'Outdoor:',
-            True, 
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x+15, 400))
-        temp = probe_vals.get('alt-temp', 0)
-        if is_current:
-            color = self.FGCOLOR
-        else:
-            color = self.FGWARNING
-        surface = self.fonts['LARGE'].render(
-            f'{temp:.0f}°',
-            True, 
-            color)
-        self.display.blit(surface, (block_x, 450))
-        block_x = 560
-        humid = probe_vals.get('alt-humidity', 0)
-        surface = self.fonts['SMALL'].render(
-            f'Hum:  {humid:.0f} %',
-            True, 
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x, 400))
-        bar = probe_vals.get('pressure', 0)
-        surface = self.fonts['SMALL'].render(
-            f'Bar:  {bar:.1f} in',
-            True, 
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x, 460))
-        batt = probe_vals.get('battery-charge', 0)
-        surface = self.fonts['SMALL'].render(
-            f'Bat:  {batt:.0f} %',
-            True, 
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x, 520))
-
-        ## Indoor block
-        block_x = 50
-        surface = self.fonts['SMALL'].render(
-            'Indoor:',
-            True,
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x+15, 400))
-        temp = self.sensor.get_last_temp()
-        surface = self.fonts['LARGE'].render(
-            f'{temp:.0f}°',
-            True,
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x, 450))
-        block_x = 290
-        humid = self.sensor.get_last_humidity()
-        surface = self.fonts['SMALL'].render(
-            f'Hum:  {humid:.0f} %',
-            True,
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x, 400))
-        barom = self.sensor.get_last_barom()
-        surface = self.fonts['SMALL'].render(
-            f'Bar:  {barom:.1f} in',
-            True,
-            self.FGCOLOR)
-        self.display.blit(surface, (block_x, 460))
-        voc = self.sensor.get_last_voc()/1000
-        if voc < 20:
-            color = self.FGERROR
-        elif voc < 100:
-            color = self.FGWARNING
-        else:
-            color = self.FGCOLOR
-        surface = self.fonts['SMALL'].render(
-            f'VOC:  {voc:.0f} kΩ',
-            True,
-            color)
-        self.display.blit(surface, (block_x, 520))
-
-        pad = 10
-        rect = (pad, pad, self.WIDTH-2*pad, self.HEIGHT-2*pad)
-        pg.draw.rect(self.display, self.FGCOLOR, rect, width=1)
-
-        pg.display.update()
+        if self.power.is_blanked():
+            return
+        if self.pages is None:
+            self.draw_boot_frame()
+            return
+        rects = self.pages.render(self.display)
+        if rects:
+            if self.power.needs_software_dim():
+                for rect in rects:
+                    self.display.blit(self.dim_overlay, rect, rect)
+            pg.display.update(rects)
+            if self.mirror:
+                self.mirror.mark_dirty()
 
 
     def on_cleanup(self):
+        sd_notify('STOPPING=1')
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.mirror:
+            self.mirror.close()
+        if self.raster:
+            self.raster.shutdown()
+        if self.history.store:
+            self.history.store.close()
+        if self.publishers:
+            self.publishers.close()
         pg.quit()
 
     def on_execute(self):
+        signal.signal(signal.SIGHUP, self.on_sighup)
         if self.on_init() == False:
             self.running = False
  
         while( self.running ):
-            for event in pg.event.get():
+            for event in self.get_events():
                 self.on_event(event)
             self.on_loop()
+            start = time.perf_counter()
             self.on_render()
+            self.frame_stats.observe(time.perf_counter() - start)
 
         self.on_cleanup()
 
 
-def main():
-    logging.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s',
-                        level=logging.INFO)
+def run_benchmark(config, blits):
+    """Print the cost of blitting each font's text, in each surface
+    format, onto a page-like surface in the display's format."""
+    pg.init()
+    size = (config['display.width'], config['display.height'])
+    pg.display.set_mode(size)
+    page = pg.Surface(size).convert()
+    page.fill(config['colors.background'])
+    print(f'driver {pg.display.get_driver()}, '
+          f'display {pg.display.get_surface().get_bitsize()} bits/pixel')
+    fontmgr = FontManager()
+    for slot, (name, font_size) in App.FONTS.items():
+        font = fontmgr.load(slot, name, font_size)
+        print(f'{slot} ({name} {font_size}):')
+        for fmt, bits, secs in benchmark(
+                page, font, '12:34 pm', config['colors.foreground'],
+                config['colors.background'], blits):
+            print(f'  {fmt:<26} {bits:2d} bpp  {secs * 1e6:8.1f} us/blit')
+    pg.quit()
+
 
-    theApp = App()
+def main():
+    parser = argparse.ArgumentParser(description='Weather clock display')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='log per-stage and per-import startup timing')
+    add_arguments(parser)
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    export_parser = commands.add_parser(
+        'export', help='export the reading history and exit')
+    export.add_arguments(export_parser)
+    bench_parser = commands.add_parser(
+        'benchmark', help='time text blits in each surface format and exit')
+    bench_parser.add_argument('--blits', type=int, default=500,
+                              help='blits per format (default: %(default)s)')
+    args = parser.parse_args()
+    try:
+        config = from_args(args)
+    except ConfigError as e:
+        parser.exit(2, f'{parser.prog}: bad configuration:\n{e}\n')
+
+    setup_logging(level=config['log.level'], use_json=config['log.json'])
+
+    if args.command == 'export':
+        if not config['history.path']:
+            parser.exit(2, f'{parser.prog}: history.path is not set\n')
+        try:
+            export.run(args, config['history.path'])
+        except export.ExportError as e:
+            parser.exit(2, f'{parser.prog} export: {e}\n')
+        return
+    if args.command == 'benchmark':
+        run_benchmark(config, args.blits)
+        return
+
+    profile = StartupProfile(t0=PROCESS_START, enabled=args.startup_profile)
+    profile.imports.append(('pygame', PYGAME_IMPORTED - PROCESS_START,
+                            'MainThread'))
+    theApp = App(profile=profile, config=config)
     theApp.on_execute()
 
-    
+
 if __name__ == "__main__" :
-    # Any use for argv's?
     main()
 
 
@@ -0,0 +1,126 @@
+##
+## Minute-aligned clock source - time/date strings that flip on the minute
+##
+
+import os
+import time
+import logging
+
+
+class MinuteClock:
+    """The current time and date strings, swapped at each minute boundary.
+
+    The strings for the coming minute are formatted right after each flip
+    (and passed to ON_PREPARE, so their surfaces can be rendered ahead of
+    time), which leaves tick() with nothing to do per frame but compare
+    against time.time().
+
+    The boundary is taken on the epoch, and the strings come from
+    localtime() of that instant, so DST transitions come out right by
+    themselves.  A timezone change (TZ or /etc/localtime) is noticed at
+    the next flip, and a step of the wall clock (e.g. NTP at boot, as the
+    Pi has no RTC) causes a full recompute.
+    """
+    LOCALTIME = '/etc/localtime'
+    #TIME_FORMAT = '%H:%M'
+    TIME_FORMAT = '%l:%M %P'    # ' 9:05 pm' - fixed width
+    #DATE_FORMAT = '%a, %b %e, %Y'
+    # 'Tue, Dec 7, 2024'
+    DATE_FORMAT = '%A, %B %e, %Y'
+    # 'Tuesday, December 7, 2024'
+
+    def __init__(self, use_ampm=True, on_prepare=None):
+        self.logger = logging.getLogger(__name__)
+        self.use_ampm = use_ampm
+        self.on_prepare = on_prepare
+        self.tz_key = None
+        self.current = None     # (timestr, datestr) shown now
+        self.upcoming = None    # ... and from the next boundary on
+        self.boundary = 0
+        self.version = 0        # bumped whenever current changes
+        self.reset()
+
+    def format(self, tstamp):
+        local = time.localtime(tstamp)
+        time_format = self.TIME_FORMAT if self.use_ampm else '%H:%M'
+        return (time.strftime(time_format, local),
+                time.strftime(self.DATE_FORMAT, local))
+
+    def get_tz_key(self):
+        try:
+            localtime = (os.path.realpath(self.LOCALTIME),
+                         os.stat(self.LOCALTIME).st_mtime)
+        except OSError:
+            localtime = None
+        return (os.environ.get('TZ'), localtime)
+
+    def reset(self, now=None):
+        """Recompute everything from the current time and timezone."""
+        tz_key = self.get_tz_key()
+        if tz_key != self.tz_key:
+            if self.tz_key is not None:
+                self.logger.info('Timezone changed: %s', tz_key)
+            self.tz_key = tz_key
+            time.tzset()
+        if now is None:
+            now = time.time()
+        minute = now // 60 * 60
+        strings = self.format(minute)
+        if strings != self.current:
+            self.current = strings
+            self.version += 1
+        self.boundary = minute + 60
+        self.prepare()
+
+    def prepare(self):
+        self.upcoming = self.format(self.boundary)
+        if self.on_prepare:
+            self.on_prepare(*self.upcoming)
+
+    def tick(self, now=None):
+        """Flip to the precomputed strings once the boundary has passed.
+
+        Returns True if the strings changed.
+        """
+        if now is None:
+            now = time.time()
+        if self.boundary - 60 <= now < self.boundary:
+            return False
+        version = self.version
+        if (self.boundary <= now < self.boundary + 60 and
+                self.get_tz_key() == self.tz_key):
+            self.current = self.upcoming
+            self.version += 1
+            self.boundary += 60
+            self.prepare()
+        else:
+            # missed a minute, the clock was stepped, or a new timezone
+            self.logger.info('Clock source reset (%.0fs from the boundary)',
+                             now - self.boundary)
+            self.reset(now)
+        return self.version != version
+
+    def time_to_flip(self, now=None):
+        """Seconds until the next minute boundary."""
+        if now is None:
+            now = time.time()
+        return self.boundary - now
+
+    def get_strings(self):
+        return self.current
+
+
+def test():
+    logging.basicConfig(level=logging.INFO)
+    clock = MinuteClock(on_prepare=lambda *strings: print('prepared', strings))
+    print('now', clock.get_strings())
+    # spring forward in the US: 1:59 am is followed by 3:00 am
+    os.environ['TZ'] = 'America/Los_Angeles'
+    clock.reset(1741514340)     # 2025-03-09 01:59 PST
+    print('before', clock.get_strings())
+    clock.tick(clock.boundary)
+    print('after ', clock.get_strings())
+
+
+if __name__ == "__main__" :
+    test()
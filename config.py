@@ -0,0 +1,373 @@
+##
+## App configuration - TOML file, environment variables and command line
+##
+
+import os
+import sys
+import tomllib
+import argparse
+import datetime
+
+from history import HISTORY_FILE
+
+
+CONFIG_FILE = os.path.expanduser('~/.config/weatherclock/clock.toml')
+# e.g. CLOCK_MQTT_SERVER for 'mqtt.server', CLOCK_LOG_JSON for 'log.json'
+ENV_PREFIX = 'CLOCK_'
+
+
+class ConfigError(ValueError):
+    """Invalid configuration (the message lists every problem found)."""
+
+
+## Checkers: take a value as parsed from TOML, return the value the app
+## uses, or raise ValueError/TypeError.
+
+def to_int(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f'expected an integer, got {value!r}')
+    return value
+
+
+def to_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f'expected a number, got {value!r}')
+    return float(value)
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ('yes', 'no', 'on', 'off'):
+        return value.lower() in ('yes', 'on')
+    raise TypeError(f'expected true/false, got {value!r}')
+
+
+def to_str(value):
+    if not isinstance(value, str):
+        raise TypeError(f'expected a string, got {value!r}')
+    return value
+
+
+def to_color(value):
+    """'#rrggbb' or [r, g, b] -> (r, g, b)"""
+    if isinstance(value, str) and len(value) == 7 and value[0] == '#':
+        value = [int(value[i:i+2], 16) for i in (1, 3, 5)]
+    if (not isinstance(value, (list, tuple)) or len(value) != 3 or
+            not all(isinstance(c, int) and 0 <= c <= 255 for c in value)):
+        raise ValueError(f'expected "#rrggbb" or [r, g, b], got {value!r}')
+    return tuple(value)
+
+
+def to_time(value):
+    if isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(to_str(value))
+
+
+def to_schedule(value):
+    """[["22:30", "06:00", "dim"], ...] -> [(time, time, mode), ...]"""
+    schedule = []
+    for entry in value:
+        start, end, mode = entry
+        if mode not in ('dim', 'blank'):
+            raise ValueError(f'schedule mode must be dim or blank: {mode!r}')
+        schedule.append((to_time(start), to_time(end), mode))
+    return schedule
+
+
+# the keys of i2cbus.DEVICE_TYPES (bme680 is added there by sensor.py) -
+# named here so that loading the config doesn't import the I2C drivers
+DEVICE_TYPES = ('bh1750', 'bme680')
+
+
+def to_devices(value):
+    """[["bh1750", 0x23], ...] -> [(type, address), ...]"""
+    devices = []
+    for kind, addr in value:
+        devices.append((one_of(*DEVICE_TYPES)(to_str(kind)),
+                        in_range(to_int, 0x03, 0x77)(addr)))
+    return devices
+
+
+def list_of(check, max_len):
+    def check_list(value):
+        if not isinstance(value, (list, tuple)) or len(value) > max_len:
+            raise ValueError(f'expected a list of up to {max_len}, got {value!r}')
+        return [check(v) for v in value]
+    return check_list
+
+
+def in_range(check, lo, hi):
+    def check_range(value):
+        value = check(value)
+        if not lo <= value <= hi:
+            raise ValueError(f'{value} is not in the range {lo}..{hi}')
+        return value
+    return check_range
+
+
+def one_of(*choices):
+    def check_choice(value):
+        if value not in choices:
+            raise ValueError(
+                f'expected one of {", ".join(map(str, choices))}: {value!r}')
+        return value
+    return check_choice
+
+
+class Option:
+    """One setting, named 'section.key' as it appears in the TOML file.
+
+    GROUP is the part of the app that has to be updated when the value
+    changes on a reload ('restart' if that can't be done on the fly).
+    """
+
+    def __init__(self, name, check, default, group, optional=False,
+                 dump=None, help=''):
+        self.name = name
+        self.check = check
+        self.default = default
+        self.group = group
+        self.optional = optional
+        self.dump = dump
+        self.help = help
+
+    def env_name(self):
+        return ENV_PREFIX + self.name.replace('.', '_').upper()
+
+    def validate(self, value):
+        if value is None or (self.optional and value in ('', 'none')):
+            if self.optional:
+                return None
+            raise ValueError('a value is required')
+        return self.check(value)
+
+
+OPTIONS = {opt.name: opt for opt in [
+    Option('display.width', in_range(to_int, 320, 4096), 1024, 'restart'),
+    Option('display.height', in_range(to_int, 240, 4096), 600, 'restart'),
+    Option('display.units', one_of('imperial', 'metric'), 'imperial', 'units'),
+    Option('colors.background', to_color, (0, 0, 0), 'colors'),
+    Option('colors.foreground', to_color, (178, 235, 242), 'colors'),
+    Option('colors.warning', to_color, (255, 255, 0), 'colors'),
+    Option('colors.error', to_color, (255, 0, 0), 'colors'),
+    Option('clock.use_ampm', to_bool, True, 'clock'),
+    Option('render.boot_fps', in_range(to_int, 1, 60), 10, 'render'),
+    Option('render.idle_fps', in_range(to_int, 0, 60), 0, 'render',
+           help='frame rate with nothing animating (0 = only on changes)'),
+    Option('render.transition_fps', in_range(to_int, 1, 60), 30, 'render'),
+    Option('render.page_transition', one_of('slide', 'fade'), 'slide', 'render'),
+    Option('render.animations', to_bool, True, 'render',
+           help='blinking colon, sliding values, moving weather icons'),
+    Option('render.max_cpu', in_range(to_float, 0.01, 1), 0.25, 'render',
+           help='fraction of the CPU animations may use before slowing down'),
+    Option('sensor.update_interval', in_range(to_float, 60, 3600), 5 * 60,
+           'sampling', help='seconds between indoor readings'),
+    Option('sensor.num_points', in_range(to_int, 1, 20), 5, 'sampling',
+           help='measurements averaged into a reading'),
+    Option('sensor.sample_interval', in_range(to_float, 0, 30), 2, 'sampling',
+           help='seconds between measurements (0 = back-to-back burst)'),
+    Option('sensor.pause_time', in_range(to_float, 0, 120), 20, 'sampling',
+           help='seconds between the temperature and VOC measurements'),
+    # (9: the sensor has 10 heater profiles, one is the VOC feed's)
+    Option('sensor.heater_sequence', list_of(in_range(to_int, 200, 400), 9),
+           [], 'sampling',
+           help='heater temperatures for a VOC fingerprint, [] for none'),
+    Option('sensor.source', one_of('i2c', 'shared'), 'i2c', 'restart',
+           help='"shared" reads the sensor daemon (sensorshm.py) instead'),
+    Option('sensor.bus_number', in_range(to_int, 0, 31), 1, 'restart'),
+    Option('sensor.address', one_of(0x76, 0x77), 0x77, 'sensor', dump=hex),
+    Option('i2c.devices', to_devices, [], 'restart',
+           help='extra devices on the sensor bus, as [type, address]'),
+    Option('history.path', to_str, HISTORY_FILE, 'restart', optional=True,
+           help='SQLite file keeping all readings for export, "none" to not'),
+    Option('history.retention_days', in_range(to_int, 1, 10000), 400,
+           'history'),
+    Option('mqtt.server', to_str, 'io.adafruit.com', 'mqtt'),
+    Option('mqtt.persist', to_bool, True, 'mqtt',
+           help='keep the session (and queued messages) across restarts'),
+    Option('mqtt.client_id', to_str, None, 'mqtt', optional=True,
+           help='default: derived from the hostname and machine-id'),
+    Option('publish.adafruit', to_bool, True, 'publish',
+           help='publish indoor readings and alerts to the Adafruit IO feeds'),
+    Option('homeassistant.server', to_str, None, 'publish', optional=True,
+           help='broker to publish to with Home Assistant MQTT discovery'),
+    Option('homeassistant.port', in_range(to_int, 1, 65535), 1883, 'publish'),
+    Option('homeassistant.prefix', to_str, 'homeassistant', 'publish',
+           help='discovery prefix'),
+    Option('homeassistant.node_id', to_str, None, 'publish', optional=True,
+           help='default: the hostname'),
+    Option('power.schedule', to_schedule,
+           [(datetime.time(22, 30), datetime.time(6, 0), 'dim')], 'power'),
+    Option('power.inactivity_timeout', in_range(to_float, 1, 86400), None,
+           'power', optional=True),
+    Option('power.wake_time', in_range(to_float, 1, 3600), 60, 'power'),
+    Option('power.dim_level', in_range(to_float, 0, 1), 0.2, 'power'),
+    Option('metrics.port', in_range(to_int, 1, 65535), None, 'metrics',
+           optional=True),
+    Option('metrics.socket', to_str, None, 'metrics', optional=True),
+    Option('mirror.port', in_range(to_int, 1, 65535), None, 'mirror',
+           optional=True, help='serve the screen at http://HOST:PORT/'),
+    Option('mirror.host', to_str, '127.0.0.1', 'mirror'),
+    Option('mirror.max_fps', in_range(to_float, 0.1, 30), 5, 'mirror'),
+    Option('log.level', one_of('DEBUG', 'INFO', 'WARNING', 'ERROR'), 'INFO',
+           'logging'),
+    Option('log.json', to_bool, False, 'restart'),
+]}
+
+
+def parse_text(text):
+    """Parse an env/command-line value like a TOML value ('0x77', 'true',
+    '[1, 2]'), falling back to the plain string ('#b2ebf2', '22:30')."""
+    try:
+        return tomllib.loads(f'v = {text}')['v']
+    except tomllib.TOMLDecodeError:
+        return text
+
+
+def flatten(table, prefix=''):
+    """{'mqtt': {'server': 'x'}} -> {'mqtt.server': 'x'}"""
+    values = {}
+    for key, value in table.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            values.update(flatten(value, name + '.'))
+        else:
+            values[name] = value
+    return values
+
+
+class Config:
+    """Validated settings: defaults < config file < environment < --set.
+
+    Read-only once built; reload() re-reads the same sources and returns
+    a new Config (or raises ConfigError, leaving this one in use).
+    """
+
+    def __init__(self, path=None, overrides=(), environ=None):
+        self.path = path
+        self.overrides = list(overrides)
+        self.sources = {}
+        raw = {name: opt.default for name, opt in OPTIONS.items()}
+        errors = []
+
+        if path is not None and (path != CONFIG_FILE or os.path.exists(path)):
+            try:
+                with open(path, 'rb') as f:
+                    self.merge(raw, flatten(tomllib.load(f)), path, errors)
+            except (OSError, tomllib.TOMLDecodeError) as e:
+                errors.append(f'{path}: {e}')
+
+        if environ is None:
+            environ = os.environ
+        env = {name: parse_text(environ[opt.env_name()])
+               for name, opt in OPTIONS.items() if opt.env_name() in environ}
+        self.merge(raw, env, 'environment', errors)
+
+        cli = {}
+        for override in self.overrides:
+            name, sep, text = override.partition('=')
+            if not sep:
+                errors.append(f'--set {override}: expected SECTION.KEY=VALUE')
+                continue
+            cli[name.strip()] = parse_text(text.strip())
+        self.merge(raw, cli, 'command line', errors)
+
+        self.values = {}
+        for name, value in raw.items():
+            try:
+                self.values[name] = OPTIONS[name].validate(value)
+            except (ValueError, TypeError) as e:
+                errors.append(f'{name} (from {self.sources.get(name, "defaults")}): {e}')
+        if errors:
+            raise ConfigError('\n'.join(errors))
+
+    def merge(self, raw, values, source, errors):
+        for name, value in values.items():
+            if name not in OPTIONS:
+                errors.append(f'{source}: unknown setting {name}')
+                continue
+            raw[name] = value
+            self.sources[name] = source
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def reload(self):
+        return Config(self.path, self.overrides)
+
+    def changed(self, other):
+        """Names of the settings that differ from OTHER."""
+        return {name for name in OPTIONS if self[name] != other[name]}
+
+    def groups(self, names=None):
+        """The groups (parts of the app) that NAMES belong to, default all."""
+        if names is None:
+            names = OPTIONS
+        return {OPTIONS[name].group for name in names}
+
+    def to_toml(self):
+        lines = []
+        section = None
+        for name, opt in OPTIONS.items():
+            sect, key = name.split('.')
+            if sect != section:
+                section = sect
+                lines.append(f'\n[{section}]')
+            if opt.help:
+                lines.append(f'# {opt.help}')
+            value = self[name]
+            if value is None:
+                lines.append(f'#{key} =')
+            else:
+                lines.append(f'{key} = {format_value(value, opt.dump)}')
+        return '\n'.join(lines).lstrip() + '\n'
+
+
+def format_value(value, dump=None):
+    if dump is not None and not isinstance(value, (list, tuple)):
+        return dump(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, datetime.time):
+        return f'"{value:%H:%M}"'
+    if isinstance(value, tuple) and len(value) == 3 and \
+       all(isinstance(c, int) for c in value):
+        return '"#{:02x}{:02x}{:02x}"'.format(*value)
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(format_value(v) for v in value) + ']'
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def add_arguments(parser):
+    parser.add_argument('--config', default=CONFIG_FILE, metavar='PATH',
+                        help='TOML config file (default: %(default)s)')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='SECTION.KEY=VALUE',
+                        help='override a config setting (repeatable)')
+
+
+def from_args(args):
+    return Config(args.config, args.set)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check the clock config and print the effective settings')
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        config = from_args(args)
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(config.to_toml())
+
+
+if __name__ == "__main__" :
+    main()
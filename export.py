@@ -0,0 +1,262 @@
+##
+## Export historical readings - CSV, JSON Lines or a columnar binary format
+##
+
+import io
+import os
+import sys
+import csv
+import json
+import math
+import time
+import array
+import struct
+import argparse
+import datetime
+import urllib.parse
+
+from history import HistoryStore, HISTORY_FILE
+
+
+class ExportError(ValueError):
+    """Bad export parameters."""
+
+
+## Columnar format: MAGIC, a u32 length + JSON header, then blocks of
+## u32 row count followed by each column as that many little-endian
+## float64s (timestamp first, NaN where a field has no value); a block
+## of 0 rows ends the stream.  np.frombuffer() reads the columns as is.
+MAGIC = b'WCHIST1\n'
+BLOCK_ROWS = 4096
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60,
+                  'w': 7 * 24 * 60 * 60}
+
+
+def parse_duration(text):
+    """'90', '15m', '6h', '30d' -> seconds"""
+    text = text.strip()
+    scale = DURATION_UNITS.get(text[-1:], None)
+    try:
+        if scale is None:
+            return float(text)
+        return float(text[:-1]) * scale
+    except ValueError:
+        raise ExportError(f'bad duration: {text!r}') from None
+
+
+def parse_time(text, now=None):
+    """Epoch seconds, an ISO date/time (local unless it has an offset),
+    or a duration ago like '7d'."""
+    if now is None:
+        now = time.time()
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if text[-1:] in DURATION_UNITS and text[:-1].replace('.', '', 1).isdigit():
+        return now - parse_duration(text)
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise ExportError(f'bad time: {text!r}') from None
+
+
+def rows(records, step=None):
+    """Merge (tstamp, field, value) records, in time order, into rows of
+    (tstamp, {field: value}).  With STEP (seconds), each field is
+    averaged over STEP-long buckets, stamped with the bucket start."""
+    current = None
+    values = {}
+    for tstamp, field, value in records:
+        key = tstamp // step * step if step else tstamp
+        if key != current:
+            if values:
+                yield current, finish(values, step)
+            current, values = key, {}
+        if step:
+            total = values.setdefault(field, [0.0, 0])
+            total[0] += value
+            total[1] += 1
+        else:
+            values[field] = value
+    if values:
+        yield current, finish(values, step)
+
+
+def finish(values, step):
+    if not step:
+        return values
+    return {field: total / count for field, (total, count) in values.items()}
+
+
+def format_time(tstamp):
+    return datetime.datetime.fromtimestamp(tstamp).astimezone().isoformat(
+        timespec='seconds')
+
+
+def to_csv(rows, fields, chunk=1000):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(['timestamp', 'time'] + fields)
+    for n, (tstamp, values) in enumerate(rows, 1):
+        writer.writerow([tstamp, format_time(tstamp)] +
+                        [values.get(field, '') for field in fields])
+        if n % chunk == 0:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+
+def to_jsonl(rows, fields, chunk=1000):
+    lines = []
+    for tstamp, values in rows:
+        lines.append(json.dumps({'timestamp': tstamp, **values}))
+        if len(lines) >= chunk:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def to_columns(rows, fields, chunk=BLOCK_ROWS):
+    header = json.dumps({'columns': ['timestamp'] + fields,
+                         'dtype': '<f8'}).encode('utf-8')
+    yield MAGIC + struct.pack('<I', len(header)) + header
+    columns = [array.array('d') for _ in range(len(fields) + 1)]
+    for tstamp, values in rows:
+        columns[0].append(tstamp)
+        for field, column in zip(fields, columns[1:]):
+            column.append(values.get(field, math.nan))
+        if len(columns[0]) >= chunk:
+            yield encode_block(columns)
+            columns = [array.array('d') for _ in columns]
+    if columns[0]:
+        yield encode_block(columns)
+    yield struct.pack('<I', 0)
+
+
+def encode_block(columns):
+    if sys.byteorder == 'big':
+        for column in columns:
+            column.byteswap()
+    return struct.pack('<I', len(columns[0])) + b''.join(
+        column.tobytes() for column in columns)
+
+
+def read_columns(stream):
+    """Read a columnar export back in, as {column: array('d')}."""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ExportError('not a columnar history export')
+    length, = struct.unpack('<I', stream.read(4))
+    names = json.loads(stream.read(length))['columns']
+    columns = {name: array.array('d') for name in names}
+    while True:
+        count, = struct.unpack('<I', stream.read(4))
+        if not count:
+            break
+        for name in names:
+            column = array.array('d', stream.read(8 * count))
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name].extend(column)
+    return columns
+
+
+FORMATS = {
+    'csv': (to_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (to_jsonl, 'application/x-ndjson'),
+    'columns': (to_columns, 'application/octet-stream'),
+}
+
+
+def export(store, fmt='csv', fields=None, start=None, end=None, step=None):
+    """Return (content type, generator of bytes) for an export.
+
+    Parameters are checked here, before anything is generated; the
+    readings are then streamed from the store as the generator is run.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f'format must be one of {", ".join(FORMATS)}')
+    if fields is None:
+        fields = store.fields()
+    else:
+        unknown = [field for field in fields if field not in store.fields()]
+        if unknown:
+            raise ExportError(f'unknown fields: {", ".join(unknown)}')
+    if step is not None and step <= 0:
+        raise ExportError('step must be positive')
+    encoder, ctype = FORMATS[fmt]
+    records = store.query(fields, start, end)
+    return ctype, encoder(rows(records, step), list(fields))
+
+
+def parse_query(query, now=None):
+    """Export parameters from a URL query string, e.g.
+    'format=jsonl&fields=Indoor-Temp,Temp&start=7d&step=1h'"""
+    params = urllib.parse.parse_qs(query)
+    args = {key: values[-1] for key, values in params.items()}
+    unknown = set(args) - {'format', 'fields', 'start', 'end', 'step'}
+    if unknown:
+        raise ExportError(f'unknown parameters: {", ".join(sorted(unknown))}')
+    return {
+        'fmt': args.get('format', 'csv'),
+        'fields': args['fields'].split(',') if args.get('fields') else None,
+        'start': parse_time(args['start'], now) if 'start' in args else None,
+        'end': parse_time(args['end'], now) if 'end' in args else None,
+        'step': parse_duration(args['step']) if 'step' in args else None,
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--fields', metavar='FIELD,...',
+                        help='fields to export (default: all)')
+    parser.add_argument('--start', metavar='TIME',
+                        help='epoch seconds, ISO date/time, or e.g. 30d ago')
+    parser.add_argument('--end', metavar='TIME')
+    parser.add_argument('--step', metavar='DURATION',
+                        help='average over e.g. 15m or 1h buckets')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='write here instead of to stdout')
+
+
+def run(args, path):
+    """Run an export for the parsed command line ARGS."""
+    if not os.path.exists(path):
+        raise ExportError(f'no history at {path}')
+    store = HistoryStore(path)
+    try:
+        _, chunks = export(
+            store, args.format,
+            args.fields.split(',') if args.fields else None,
+            parse_time(args.start) if args.start else None,
+            parse_time(args.end) if args.end else None,
+            parse_duration(args.step) if args.step else None)
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the reading history')
+    parser.add_argument('--db', default=HISTORY_FILE,
+                        help='history database (default: %(default)s)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        run(args, args.db)
+    except ExportError as e:
+        parser.exit(2, f'{parser.prog}: {e}\n')
+
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,104 @@
+##
+## Font manager - cache resolved font paths and metrics on disk
+##
+
+import os
+import json
+import string
+import logging
+
+import pygame as pg
+
+
+class FontManager:
+    """Load fonts by name without a fontconfig scan on every start.
+
+    SysFont() asks fontconfig for the whole font list each time it is
+    called; on the Pi that is by far the slowest part of loading a font.
+    Resolved paths, plus the per-size metrics we need for layout, are kept
+    in a small JSON file and re-used as long as the font file is unchanged.
+    """
+    CACHE_FILE = os.path.expanduser('~/.cache/weatherclock/fonts.json')
+    # characters whose advance widths get cached for text_width()
+    CHARSET = string.digits + string.ascii_letters + string.punctuation + ' °'
+
+    def __init__(self, cache_file=CACHE_FILE):
+        self.logger = logging.getLogger(__name__)
+        self.cache_file = cache_file
+        self.cache = {'paths': {}, 'metrics': {}}
+        self.dirty = False
+        self.slots = {}         # slot name -> metrics dict
+        self.load_cache()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+            if 'paths' in cache and 'metrics' in cache:
+                self.cache = cache
+        except (OSError, ValueError) as e:
+            self.logger.debug('No font cache loaded: %s', e)
+
+    def save_cache(self):
+        if not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp = self.cache_file + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp, self.cache_file)
+            self.dirty = False
+        except OSError as e:
+            self.logger.warning('Could not save font cache: %s', e)
+
+    def resolve(self, name, bold=False, italic=False):
+        """Return the font file path for NAME, or None for pygame's default."""
+        key = f'{name}:{int(bold)}:{int(italic)}'
+        path = self.cache['paths'].get(key)
+        if path and os.path.exists(path):
+            return path
+        path = pg.font.match_font(name, bold=bold, italic=italic)
+        if path:
+            self.logger.info('Font %s resolved to %s', key, path)
+            self.cache['paths'][key] = path
+            self.dirty = True
+        else:
+            self.logger.warning('Font %s not found, using default', name)
+        return path
+
+    def get_metrics(self, font, path, size):
+        """Return ascent/descent/height and advance widths for CHARSET."""
+        mtime = os.path.getmtime(path) if path else 0
+        key = f'{path}:{size}'
+        metrics = self.cache['metrics'].get(key)
+        if metrics and metrics.get('mtime') == mtime:
+            return metrics
+        advances = {}
+        for char, info in zip(self.CHARSET, font.metrics(self.CHARSET)):
+            if info is not None:
+                advances[char] = info[4]
+        metrics = {'mtime': mtime,
+                   'ascent': font.get_ascent(),
+                   'descent': font.get_descent(),
+                   'height': font.get_height(),
+                   'advances': advances}
+        self.cache['metrics'][key] = metrics
+        self.dirty = True
+        return metrics
+
+    def load(self, slot, name, size, bold=False, italic=False):
+        """Load a Font for SLOT (e.g. 'CLOCK'), caching path and metrics."""
+        path = self.resolve(name, bold, italic)
+        font = pg.font.Font(path, size)
+        self.slots[slot] = self.get_metrics(font, path, size)
+        return font
+
+    def text_width(self, slot, text):
+        """Width of TEXT in pixels from cached advances (no rendering).
+
+        Ignores kerning, which is close enough for positioning text.
+        """
+        advances = self.slots[slot]['advances']
+        default = advances.get('0', 0)
+        return sum(advances.get(char, default) for char in text)
@@ -0,0 +1,170 @@
+##
+## History of indoor/outdoor readings - in memory, and optionally on disk
+##
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+import collections
+
+
+HISTORY_FILE = os.path.expanduser('~/.local/share/weatherclock/history.db')
+
+
+class HistoryStore:
+    """All readings, kept in a SQLite file for export (see export.py).
+
+    One row per value, with the field names stored once in their own
+    table.  Readings only arrive every few minutes, so each batch is
+    simply committed as it comes in; rows older than RETENTION_DAYS are
+    dropped about once a day.
+    """
+    RETENTION_DAYS = 400
+    PRUNE_INTERVAL = 24 * 60 * 60
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS fields (
+            id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+        CREATE TABLE IF NOT EXISTS readings (
+            tstamp REAL NOT NULL, field INTEGER NOT NULL, value REAL);
+        CREATE INDEX IF NOT EXISTS readings_tstamp ON readings (tstamp);
+    """
+
+    def __init__(self, path=HISTORY_FILE, retention_days=RETENTION_DAYS):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.retention_days = retention_days
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # written from the bgloop, read by exports on executor threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            # WAL lets an export read while new readings are written
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.executescript(self.SCHEMA)
+        self.field_ids = dict(self.db.execute('SELECT name, id FROM fields'))
+        self.next_prune = 0
+
+    def close(self):
+        self.db.close()
+
+    def get_field_id(self, name):
+        if name not in self.field_ids:
+            cursor = self.db.execute('INSERT INTO fields (name) VALUES (?)',
+                                     (name,))
+            self.field_ids[name] = cursor.lastrowid
+        return self.field_ids[name]
+
+    def add_values(self, values, tstamp):
+        try:
+            with self.lock, self.db:
+                self.db.executemany(
+                    'INSERT INTO readings VALUES (?, ?, ?)',
+                    [(tstamp, self.get_field_id(field), value)
+                     for field, value in values])
+            if tstamp >= self.next_prune:
+                self.prune(tstamp)
+        except sqlite3.Error as e:
+            self.logger.warning('History store write failed: %s', e)
+
+    def prune(self, now):
+        self.next_prune = now + self.PRUNE_INTERVAL
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                'DELETE FROM readings WHERE tstamp < ?',
+                (now - self.retention_days * 24 * 60 * 60,))
+        if cursor.rowcount:
+            self.logger.info('History store: pruned %d old readings',
+                             cursor.rowcount)
+
+    def fields(self):
+        return list(self.field_ids)
+
+    def query(self, fields=None, start=None, end=None, batch=1000):
+        """Yield (tstamp, field, value) in time order, for FIELDS (default
+        all) with START <= tstamp < END.
+
+        Each query has its own connection, and rows are fetched BATCH at
+        a time, so any range can be read (on any thread) in constant
+        memory without holding up new readings.
+        """
+        names = {id: name for name, id in self.field_ids.items()}
+        sql = 'SELECT tstamp, field, value FROM readings WHERE tstamp >= ?'
+        args = [start if start is not None else 0]
+        if end is not None:
+            sql += ' AND tstamp < ?'
+            args.append(end)
+        if fields is not None:
+            ids = [self.field_ids[f] for f in fields if f in self.field_ids]
+            sql += f' AND field IN ({", ".join("?" * len(ids))})'
+            args += ids
+        sql += ' ORDER BY tstamp'
+        db = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True,
+                             check_same_thread=False)
+        try:
+            cursor = db.execute(sql, args)
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                for tstamp, field, value in rows:
+                    yield tstamp, names[field], value
+        finally:
+            db.close()
+
+
+def open_store(path, retention_days=HistoryStore.RETENTION_DAYS):
+    """Return a HistoryStore, or None (logged) if it can't be opened."""
+    try:
+        return HistoryStore(path, retention_days)
+    except (OSError, sqlite3.Error) as e:
+        logging.getLogger(__name__).warning(
+            'History store %s not available: %s', path, e)
+        return None
+
+
+class History:
+    """Keep a fixed-length ring buffer of (timestamp, value) per field."""
+    MAX_POINTS = 288            # 24 hours at the 5 minute update interval
+
+    def __init__(self, max_points=MAX_POINTS, store=None):
+        self.max_points = max_points
+        self.store = store      # optional HistoryStore, for keeping everything
+        self.series = {}
+        # bumped on every change, so consumers can cheaply detect new data
+        self.version = 0
+
+    def add(self, field, value, tstamp=None):
+        if tstamp is None:
+            tstamp = time.time()
+        if field not in self.series:
+            self.series[field] = collections.deque(maxlen=self.max_points)
+        self.series[field].append((tstamp, value))
+        self.version += 1
+
+    def add_values(self, values, tstamp=None):
+        """Add a list of (field, value) pairs sharing one timestamp."""
+        if tstamp is None:
+            tstamp = time.time()
+        for field, value in values:
+            self.add(field, value, tstamp)
+        if self.store:
+            self.store.add_values(values, tstamp)
+
+    def load(self, since=None):
+        """Fill the ring buffers from the store (e.g. after a restart)."""
+        if since is None:
+            since = time.time() - 24 * 60 * 60
+        for tstamp, field, value in self.store.query(start=since):
+            self.add(field, value, tstamp)
+
+    def get(self, field):
+        return list(self.series.get(field, ()))
+
+    def get_values(self, field):
+        return [val for _, val in self.series.get(field, ())]
+
+    def fields(self):
+        return list(self.series.keys())
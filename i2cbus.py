@@ -0,0 +1,222 @@
+##
+## Shared I2C bus manager - one SMBus handle, serialized access, polling
+##
+
+import time
+import asyncio
+import logging
+import threading
+import contextlib
+
+import smbus2
+
+
+class I2CBus:
+    """A single shared SMBus handle for every device on the bus.
+
+    It has the SMBus methods the Pimoroni bme680 driver uses, so it can be
+    passed as its i2c_device.  Every access holds a (re-entrant) lock, and
+    transaction() holds it across a multi-step device operation so that
+    nothing else gets onto the bus in between.
+    """
+
+    # registers closer than this get read in one block (reading a few
+    # unused bytes is cheaper than another start/address/register cycle)
+    MAX_GAP = 4
+
+    def __init__(self, bus_number=1):
+        self.logger = logging.getLogger(__name__)
+        self.bus_number = bus_number
+        self.bus = smbus2.SMBus(bus_number)
+        self.lock = threading.RLock()
+        self.transfers = 0
+        self.errors = 0
+
+    def close(self):
+        with self.lock:
+            self.bus.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            yield self
+
+    def call(self, fn, *args):
+        with self.lock:
+            self.transfers += 1
+            try:
+                return fn(*args)
+            except OSError:
+                self.errors += 1
+                raise
+
+    ## SMBus-compatible interface (for bme680.BME680(i2c_device=...))
+    def read_byte_data(self, addr, register):
+        return self.call(self.bus.read_byte_data, addr, register)
+
+    def write_byte_data(self, addr, register, value):
+        return self.call(self.bus.write_byte_data, addr, register, value)
+
+    def read_i2c_block_data(self, addr, register, length):
+        # i2c_rdwr does the register write + read as one combined
+        # transaction, and isn't limited to SMBus' 32 byte blocks
+        write = smbus2.i2c_msg.write(addr, [register])
+        read = smbus2.i2c_msg.read(addr, length)
+        self.i2c_rdwr(write, read)
+        return list(read)
+
+    def write_i2c_block_data(self, addr, register, data):
+        return self.call(self.bus.write_i2c_block_data, addr, register, data)
+
+    def write_byte(self, addr, value):
+        return self.call(self.bus.write_byte, addr, value)
+
+    def i2c_rdwr(self, *msgs):
+        return self.call(self.bus.i2c_rdwr, *msgs)
+
+    def read_registers(self, addr, registers):
+        """Read a set of registers with as few block transfers as possible.
+
+        Registers are grouped into contiguous runs, and all the runs are
+        sent in a single i2c_rdwr() call.  Returns {register: value}.
+        """
+        runs = []
+        for reg in sorted(set(registers)):
+            if runs and reg - (runs[-1][0] + runs[-1][1]) < self.MAX_GAP:
+                runs[-1][1] = reg - runs[-1][0] + 1
+            else:
+                runs.append([reg, 1])
+        msgs = []
+        reads = []
+        for start, length in runs:
+            read = smbus2.i2c_msg.read(addr, length)
+            msgs.append(smbus2.i2c_msg.write(addr, [start]))
+            msgs.append(read)
+            reads.append((start, read))
+        self.i2c_rdwr(*msgs)
+        values = {}
+        for start, read in reads:
+            for offset, value in enumerate(read):
+                values[start + offset] = value
+        return {reg: values[reg] for reg in registers}
+
+
+def open_bus(bus_number=1):
+    """Return a shared I2CBus, or None if the bus can't be opened."""
+    try:
+        return I2CBus(bus_number)
+    except (OSError, PermissionError) as e:
+        logging.getLogger(__name__).warning(
+            'I2C bus %d not available: %s', bus_number, e)
+        return None
+
+
+class I2CDevice:
+    """Base class for a simple polled device on the shared bus."""
+    NAME = 'device'
+    ADDR = None
+    INTERVAL = 60               # seconds between polls
+
+    def __init__(self, bus, addr=None, interval=None):
+        self.logger = logging.getLogger(__name__)
+        self.bus = bus
+        self.addr = addr if addr is not None else self.ADDR
+        self.interval = interval or self.INTERVAL
+        self.values = {}
+
+    def setup(self):
+        """One-time device configuration."""
+        pass
+
+    def poll(self):
+        """Read the device, return a list of (field, value)."""
+        raise NotImplementedError
+
+
+class BH1750(I2CDevice):
+    """BH1750 ambient light sensor."""
+    NAME = 'bh1750'
+    ADDR = 0x23
+    INTERVAL = 30
+    CONT_HIRES_MODE = 0x10
+
+    def setup(self):
+        self.bus.write_byte(self.addr, self.CONT_HIRES_MODE)
+
+    def poll(self):
+        read = smbus2.i2c_msg.read(self.addr, 2)
+        self.bus.i2c_rdwr(read)
+        hi, lo = list(read)
+        return [('Indoor-Light', ((hi << 8) | lo) / 1.2)]
+
+
+DEVICE_TYPES = {
+    'bh1750': BH1750,
+}
+
+
+class BusScheduler:
+    """Poll the extra I2C devices in staggered, non-overlapping slots.
+
+    Each device gets an initial offset within the shortest poll interval
+    so their reads don't bunch up, and polls are run one at a time from a
+    single task, so two devices never compete for the bus.
+    """
+    SLOT_SPACING = 0.5          # seconds between initial device slots
+
+    def __init__(self, bus, devices=(), on_reading=None):
+        self.logger = logging.getLogger(__name__)
+        self.bus = bus
+        self.devices = []
+        self.next_due = {}
+        self.on_reading = on_reading
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        try:
+            device.setup()
+        except (OSError, RuntimeError) as e:
+            # (RuntimeError: e.g. the bme680 driver's chip ID check)
+            self.logger.warning('I2C device %s@0x%02x setup failed: %s',
+                                device.NAME, device.addr, e)
+            return False
+        offset = len(self.devices) * self.SLOT_SPACING
+        self.devices.append(device)
+        self.next_due[device] = time.time() + offset
+        return True
+
+    async def poll_due(self, now=None):
+        """Poll every device that is due, returns seconds until the next.
+
+        Each poll() runs on an executor thread - reads can include a
+        conversion delay, which mustn't stall the event loop.  Devices
+        take the bus per transfer (or per transaction()) themselves, so
+        the main sensor isn't locked out while one of them waits.
+        """
+        if now is None:
+            now = time.time()
+        loop = asyncio.get_running_loop()
+        for device in self.devices:
+            if self.next_due[device] > now:
+                continue
+            # keep the original phase, even if we were late
+            while self.next_due[device] <= now:
+                self.next_due[device] += device.interval
+            try:
+                values = await loop.run_in_executor(None, device.poll)
+            except OSError as e:
+                self.logger.warning('I2C device %s@0x%02x read failed: %s',
+                                    device.NAME, device.addr, e)
+                continue
+            device.values = dict(values)
+            if self.on_reading:
+                self.on_reading(device, values)
+        if not self.devices:
+            return None
+        return max(0, min(self.next_due.values()) - time.time())
+
+    async def run(self):
+        while self.devices:
+            wait = await self.poll_due()
+            await asyncio.sleep(wait)
@@ -0,0 +1,117 @@
+##
+## Logging setup - non-blocking queue handoff, JSON output, rate limiting
+##
+
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s: %(name)s: %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON object per line (for journald/jq)."""
+    FIELDS = ('name', 'levelname', 'module', 'lineno', 'threadName')
+
+    def format(self, record):
+        entry = {'time': record.created,
+                 'msg': record.getMessage()}
+        for field in self.FIELDS:
+            entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        return json.dumps(entry)
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of the same warning within INTERVAL seconds.
+
+    Records are keyed by logger name + the formatted message, so only
+    true repeats are dropped (two different alerts, or two tasks failing,
+    both get through), or by an explicit extra={'key': ...} for messages
+    that differ each time but should still count as one.  The next record
+    let through reports how many were suppressed in between.  INFO and
+    below are never limited.
+    """
+    INTERVAL = 60
+    MIN_LEVEL = logging.WARNING
+    MAX_KEYS = 1000             # forget expired keys beyond this many
+
+    def __init__(self, interval=INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.seen = {}          # key -> [last emit time, suppressed count]
+
+    def filter(self, record):
+        if record.levelno < self.MIN_LEVEL:
+            return True
+        key = getattr(record, 'key', None) or (record.name, record.getMessage())
+        now = record.created
+        entry = self.seen.get(key)
+        if entry and now - entry[0] < self.interval:
+            entry[1] += 1
+            return False
+        record.suppressed = entry[1] if entry else 0
+        if record.suppressed:
+            # keep the text formatter's output self-explanatory too
+            record.msg = f'{record.msg} (suppressed {record.suppressed} similar)'
+        if len(self.seen) >= self.MAX_KEYS:
+            self.expire(now)
+        self.seen[key] = [now, 0]
+        return True
+
+    def expire(self, now):
+        self.seen = {key: entry for key, entry in self.seen.items()
+                     if now - entry[0] < self.interval or entry[1]}
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+
+    The stock prepare() formats every record in the caller's thread; the
+    queue here never leaves the process, so the record can be passed as-is.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, use_json=False, rate_limit=True,
+                  stream=None):
+    """Route all logging through a QueueHandler.
+
+    The calling thread (render loop, paho network thread, ...) only puts
+    the record on a queue; a QueueListener thread does the formatting and
+    the actual I/O.  Returns the listener, which is also stopped at exit.
+    """
+    if stream is None:
+        stream = sys.stderr
+    handler = logging.StreamHandler(stream)
+    if use_json:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
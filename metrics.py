@@ -0,0 +1,247 @@
+##
+## Prometheus-style metrics endpoint (HTTP over TCP or a Unix socket)
+##
+
+import os
+import time
+import asyncio
+import logging
+import resource
+import urllib.parse
+
+import export
+
+
+class Summary:
+    """Running count/sum/max of a duration, cheap enough for every frame."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+
+def get_rss_bytes():
+    """Current resident set size, from /proc if we have it."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak (in KB on Linux), but better than nothing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics:
+    """Collect metrics from the App at scrape time.
+
+    Counters live on the objects that own them (e.g. sensor.i2c_errors,
+    mqtt.msgs_in), so the hot paths only do an integer increment and all
+    formatting happens when someone actually asks for /metrics.
+    """
+    PREFIX = 'clock'
+
+    def __init__(self, app):
+        self.app = app
+        self.start_time = time.time()
+
+    def collect(self):
+        """Return a list of (name, type, help, value-or-dict-of-labels)."""
+        app = self.app
+        now = time.time()
+        sensor = app.sensor
+        mqtt = app.mqtt
+        outdoor_tstamp = mqtt.get_curr_values().get('timestamp', 0)
+        metrics = [
+            ('uptime_seconds', 'gauge', 'Seconds since process start',
+             now - self.start_time),
+            ('frame_seconds', 'summary', 'Render time per frame',
+             app.frame_stats),
+            ('sensor_cycle_seconds', 'summary', 'Duration of sensor read_loop',
+             app.sensor_stats),
+            ('i2c_errors_total', 'counter', 'I2C errors talking to the BME680',
+             sensor.i2c_errors),
+            ('mqtt_messages_received_total', 'counter', 'MQTT messages received',
+             mqtt.msgs_in),
+            ('mqtt_messages_sent_total', 'counter', 'MQTT messages published',
+             app.publishers.sent_counts() if app.publishers else {}),
+            ('mqtt_connects_total', 'counter', 'MQTT (re)connections',
+             mqtt.connects),
+            ('mqtt_messages_duplicate_total', 'counter',
+             'Replayed MQTT messages dropped', mqtt.msgs_dup),
+            ('data_age_seconds', 'gauge', 'Seconds since last reading',
+             {'source="indoor"': now - sensor.last_update
+                 if sensor.last_update else -1,
+              'source="outdoor"': now - outdoor_tstamp
+                 if outdoor_tstamp else -1}),
+            ('text_raster_total', 'counter', 'Text surface lookups',
+             {'result="prefetched"': app.raster.hits,
+              'result="sync"': app.raster.misses}),
+            ('animation_frames_total', 'counter',
+             'Animation frames drawn, and ones put off by the CPU budget',
+             {'result="drawn"': app.pages.animator.frames,
+              'result="throttled"': app.pages.animator.throttled}),
+            ('task_failures_total', 'counter',
+             'Background task runs that raised an exception',
+             {f'task="{name}"': state.failures
+              for name, state in app.tasks.tasks.items()}),
+            ('task_restarts_total', 'counter',
+             'Background tasks restarted after failing',
+             {f'task="{name}"': state.restarts
+              for name, state in app.tasks.tasks.items()}),
+            ('task_overlaps_total', 'counter',
+             'Background tasks cancelled for still running when restarted',
+             {f'task="{name}"': state.overlaps
+              for name, state in app.tasks.tasks.items()}),
+            ('alerts_active', 'gauge', 'Number of active alerts',
+             len(app.alerts.get_active())),
+            ('memory_rss_bytes', 'gauge', 'Resident set size',
+             get_rss_bytes()),
+        ]
+        if sensor.gas_fingerprint:
+            metrics.append(
+                ('gas_resistance_ohms', 'gauge',
+                 'Indoor gas resistance at each heater temperature',
+                 {f'heater="{temp}"': value
+                  for temp, value in sensor.gas_fingerprint.items()}))
+        if app.mirror:
+            metrics += [
+                ('mirror_viewers', 'gauge', 'Connected display mirror viewers',
+                 len(app.mirror.clients)),
+                ('mirror_sent_bytes_total', 'counter',
+                 'Bytes of frames sent to mirror viewers',
+                 app.mirror.bytes_sent),
+            ]
+        return metrics
+
+    def render(self):
+        """Format all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, kind, helptext, value in self.collect():
+            name = f'{self.PREFIX}_{name}'
+            lines.append(f'# HELP {name} {helptext}')
+            lines.append(f'# TYPE {name} {kind}')
+            if isinstance(value, Summary):
+                lines.append(f'{name}_sum {value.total:.6f}')
+                lines.append(f'{name}_count {value.count}')
+                # max isn't part of a summary, so export it as its own gauge
+                lines.append(f'# TYPE {name}_max gauge')
+                lines.append(f'{name}_max {value.max:.6f}')
+            elif isinstance(value, dict):
+                for labels, val in value.items():
+                    lines.append(f'{name}{{{labels}}} {val:.3f}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Tiny HTTP server for /metrics, running on the App's bgloop.
+
+    Also serves GET /export?format=csv&fields=...&start=...&end=...&step=...
+    from the history store (parameters as for 'clock.py export').
+    """
+    MAX_LATENCY = 5             # seconds the main loop may leave us waiting
+
+    def __init__(self, metrics, port=None, host='127.0.0.1', path=None):
+        self.logger = logging.getLogger(__name__)
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.path = path
+        self.server = None
+
+    async def start(self):
+        if self.path:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = await asyncio.start_unix_server(
+                self.handle, path=self.path)
+            self.logger.info('Metrics server on unix:%s', self.path)
+        else:
+            self.server = await asyncio.start_server(
+                self.handle, host=self.host, port=self.port)
+            self.logger.info('Metrics server on %s:%s', self.host, self.port)
+
+    def close(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            # skip the rest of the headers
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            parts = request.decode('latin-1').split()
+            url = urllib.parse.urlsplit(parts[1] if len(parts) >= 2 else '')
+            if len(parts) >= 2 and parts[0] == 'GET' and url.path == '/export':
+                await self.handle_export(writer, url.query)
+                return
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1] == '/metrics':
+                status = '200 OK'
+                body = self.metrics.render().encode('utf-8')
+                ctype = 'text/plain; version=0.0.4'
+            else:
+                status = '404 Not Found'
+                body = b'Not found\n'
+                ctype = 'text/plain'
+            writer.write(f'HTTP/1.0 {status}\r\n'
+                         f'Content-Type: {ctype}\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError) as e:
+            self.logger.debug('Metrics request failed: %s', e)
+        finally:
+            writer.close()
+
+    async def handle_export(self, writer, query):
+        """Stream an export: chunks are generated on an executor thread
+        (SQLite reads), and each is drained before asking for the next."""
+        store = self.metrics.app.history.store
+        try:
+            if store is None:
+                raise export.ExportError('no history store (history.path)')
+            ctype, chunks = export.export(store, **export.parse_query(query))
+        except export.ExportError as e:
+            body = f'{e}\n'.encode('utf-8')
+            writer.write(f'HTTP/1.0 400 Bad Request\r\n'
+                         f'Content-Type: text/plain\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+            return
+        writer.write(f'HTTP/1.0 200 OK\r\n'
+                     f'Content-Type: {ctype}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1'))
+        loop = asyncio.get_running_loop()
+        pending = None
+        try:
+            while True:
+                # shielded: a cancel can't stop next() on the executor thread
+                pending = loop.run_in_executor(None, next, chunks, None)
+                chunk = await asyncio.shield(pending)
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            # let a next() still running finish before closing the generator
+            # (which closes its SQLite connection), and close it there too
+            if pending is not None and not pending.done():
+                await asyncio.wait([pending])
+            await loop.run_in_executor(None, chunks.close)
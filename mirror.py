@@ -0,0 +1,334 @@
+##
+## Remote display mirror - stream changed parts of the screen to a browser
+##
+
+import io
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import logging
+
+import pygame as pg
+
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><title>WeatherClock mirror</title>
+<style>body { background: #222; margin: 0; }
+canvas { max-width: 100vw; max-height: 100vh; display: block; margin: auto; }
+</style></head>
+<body><canvas id="screen" width="%(width)d" height="%(height)d"></canvas>
+<script>
+const ctx = document.getElementById('screen').getContext('2d');
+function connect() {
+  const ws = new WebSocket(`ws://${location.host}/ws`);
+  ws.binaryType = 'arraybuffer';
+  ws.onmessage = async (event) => {
+    // count, then (x, y, w, h, length, PNG bytes) for each rectangle
+    const view = new DataView(event.data);
+    let pos = 2;
+    for (let i = 0; i < view.getUint16(0); i++) {
+      const x = view.getUint16(pos), y = view.getUint16(pos + 2);
+      const len = view.getUint32(pos + 8);
+      const png = new Blob([event.data.slice(pos + 12, pos + 12 + len)],
+                           {type: 'image/png'});
+      pos += 12 + len;
+      ctx.drawImage(await createImageBitmap(png), x, y);
+    }
+  };
+  ws.onclose = () => setTimeout(connect, 2000);
+}
+connect();
+</script></body></html>
+"""
+
+
+def ws_frame(payload, opcode=0x2):
+    """A single unmasked (server to client) WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class FrameMirror:
+    """Serve the display to browsers as delta-encoded frames.
+
+    The App calls poll() after each frame.  Nothing at all is done unless
+    a viewer is connected and the display changed; then (at most MAX_FPS
+    times a second) the screen is compared to the last frame sent, tile by
+    tile, and only the changed tiles are PNG-compressed and sent.  New
+    viewers, and ones that fall too far behind, get a full keyframe.
+
+    GET / is a small viewer page, /ws the WebSocket it uses, and
+    /frame.png a one-off screenshot.
+    """
+    TILE = 64                   # pixels, square
+    MAX_FPS = 5
+    MAX_BUFFERED = 1 << 20      # bytes queued for a viewer before resyncing it
+    MAX_LATENCY = 5             # max main loop sleep, so new viewers get served
+    WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+    def __init__(self, surface, port, host='127.0.0.1', max_fps=MAX_FPS):
+        self.logger = logging.getLogger(__name__)
+        self.surface = surface
+        self.size = surface.get_size()
+        self.port = port
+        self.host = host
+        self.max_fps = max_fps
+        self.server = None
+        self.loop = None
+        self.clients = {}       # StreamWriter -> needs a keyframe
+        self.prev = None        # RGB bytes of the last frame sent
+        self.dirty = False
+        self.busy = False
+        self.next_send = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(
+            self.handle, host=self.host, port=self.port)
+        self.logger.info('Display mirror on http://%s:%s/', self.host, self.port)
+
+    def close(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+        for writer in self.clients:
+            writer.close()
+        self.clients = {}
+
+    def mark_dirty(self):
+        """The display contents changed (call after pg.display.update())."""
+        self.dirty = True
+
+    def poll(self, now=None):
+        """Queue a frame for the viewers, if there is anything to send."""
+        if not self.clients or self.busy:
+            return
+        if not self.dirty and not any(self.clients.values()):
+            return
+        if now is None:
+            now = time.time()
+        if now < self.next_send:
+            return
+        self.next_send = now + 1 / self.max_fps
+        self.dirty = False
+        self.busy = True
+        frame = pg.image.tobytes(self.surface, 'RGB')
+        self.loop.create_task(self.send_frame(frame))
+
+    def diff(self, old, new):
+        """Rectangles that changed between two RGB frames.
+
+        Tile rows that are unchanged are skipped with one comparison; in
+        the others, dirty tiles next to each other are merged.
+        """
+        width, height = self.size
+        if old is None:
+            return [(0, 0, width, height)]
+        stride = width * 3
+        tile = self.TILE
+        cols = range(0, width, tile)
+        rects = []
+        for y0 in range(0, height, tile):
+            y1 = min(y0 + tile, height)
+            if old[y0*stride:y1*stride] == new[y0*stride:y1*stride]:
+                continue
+            dirty = [False] * len(cols)
+            for y in range(y0, y1):
+                row = y * stride
+                for i, x in enumerate(cols):
+                    if dirty[i]:
+                        continue
+                    a = row + x*3
+                    b = row + min(x + tile, width)*3
+                    if old[a:b] != new[a:b]:
+                        dirty[i] = True
+                if all(dirty):
+                    break
+            start = None
+            for i, x in enumerate(list(cols) + [width]):
+                if i < len(cols) and dirty[i]:
+                    if start is None:
+                        start = x
+                elif start is not None:
+                    rects.append((start, y0, x - start, y1 - y0))
+                    start = None
+        return rects
+
+    def encode(self, frame, rects):
+        """Message with each rect of FRAME as a PNG."""
+        surface = pg.image.frombuffer(frame, self.size, 'RGB')
+        parts = [struct.pack('>H', len(rects))]
+        for rect in rects:
+            buf = io.BytesIO()
+            pg.image.save(surface.subsurface(rect), buf, 'png')
+            png = buf.getvalue()
+            parts.append(struct.pack('>HHHHI', *rect, len(png)))
+            parts.append(png)
+        return b''.join(parts)
+
+    async def send_frame(self, frame):
+        try:
+            # diff and compress off the main thread
+            rects = await self.loop.run_in_executor(
+                None, self.diff, self.prev, frame)
+            delta = keyframe = None
+            if rects and not all(self.clients.values()):
+                delta = ws_frame(await self.loop.run_in_executor(
+                    None, self.encode, frame, rects))
+            if any(self.clients.values()):
+                keyframe = ws_frame(await self.loop.run_in_executor(
+                    None, self.encode, frame, [(0, 0, *self.size)]))
+            for writer, needs_key in list(self.clients.items()):
+                msg = keyframe if needs_key else delta
+                if msg is None:
+                    continue
+                if writer.transport.get_write_buffer_size() > self.MAX_BUFFERED:
+                    # slow viewer - drop deltas and resync it later
+                    self.clients[writer] = True
+                    continue
+                writer.write(msg)
+                self.clients[writer] = False
+                self.frames_sent += 1
+                self.bytes_sent += len(msg)
+            self.prev = frame
+        except Exception:
+            self.logger.exception('Display mirror frame failed')
+        finally:
+            self.busy = False
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            path = request[1] if len(request) >= 2 else ''
+            if path == '/ws' and 'sec-websocket-key' in headers:
+                await self.handle_ws(reader, writer, headers['sec-websocket-key'])
+                return
+            if path == '/':
+                body = (VIEWER_HTML % {'width': self.size[0],
+                                       'height': self.size[1]}).encode('utf-8')
+                status, ctype = '200 OK', 'text/html; charset=utf-8'
+            elif path == '/frame.png':
+                frame = pg.image.tobytes(self.surface, 'RGB')
+                body = await self.loop.run_in_executor(
+                    None, self.encode_png, frame)
+                status, ctype = '200 OK', 'image/png'
+            else:
+                body = b'Not found\n'
+                status, ctype = '404 Not Found', 'text/plain'
+            writer.write(f'HTTP/1.0 {status}\r\n'
+                         f'Content-Type: {ctype}\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, UnicodeDecodeError) as e:
+            self.logger.debug('Mirror request failed: %s', e)
+        finally:
+            writer.close()
+
+    def encode_png(self, frame):
+        buf = io.BytesIO()
+        pg.image.save(pg.image.frombuffer(frame, self.size, 'RGB'), buf, 'png')
+        return buf.getvalue()
+
+    async def handle_ws(self, reader, writer, key):
+        accept = base64.b64encode(
+            hashlib.sha1((key + self.WS_GUID).encode('latin-1')).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                     b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        self.clients[writer] = True
+        self.logger.info('Mirror viewer connected (%d)', len(self.clients))
+        try:
+            # the viewer never sends anything but pings and close - read
+            # and discard frames until it goes away
+            while True:
+                head = await reader.readexactly(2)
+                opcode = head[0] & 0x0f
+                length = head[1] & 0x7f
+                if length == 126:
+                    length, = struct.unpack('>H', await reader.readexactly(2))
+                elif length == 127:
+                    length, = struct.unpack('>Q', await reader.readexactly(8))
+                if head[1] & 0x80:
+                    length += 4             # masking key
+                await reader.readexactly(length)
+                if opcode == 0x8:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+            self.logger.info('Mirror viewer disconnected (%d)', len(self.clients))
+
+
+async def read_ws_message(reader):
+    """Read one (unmasked) server frame, for test()."""
+    head = await reader.readexactly(2)
+    length = head[1] & 0x7f
+    if length == 126:
+        length, = struct.unpack('>H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('>Q', await reader.readexactly(8))
+    return await reader.readexactly(length)
+
+
+def test():
+    """Headless check: run with SDL_VIDEODRIVER=dummy."""
+    logging.basicConfig(level=logging.INFO)
+    pg.init()
+    display = pg.display.set_mode((320, 240))
+    mirror = FrameMirror(display, port=0)
+
+    async def run():
+        await mirror.start()
+        port = mirror.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /ws HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\n'
+                     b'Connection: Upgrade\r\nSec-WebSocket-Version: 13\r\n'
+                     b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n')
+        print((await reader.readuntil(b'\r\n\r\n')).decode().splitlines()[0])
+        await asyncio.sleep(0.1)
+        for step in range(3):
+            if step == 1:
+                pg.draw.rect(display, (255, 0, 0), (100, 70, 20, 20))
+                mirror.mark_dirty()
+            mirror.next_send = 0
+            mirror.poll()
+            await asyncio.sleep(0.2)
+        while True:
+            try:
+                msg = await asyncio.wait_for(read_ws_message(reader), 0.5)
+            except asyncio.TimeoutError:
+                break
+            count, = struct.unpack('>H', msg[:2])
+            print(f'message: {len(msg)} bytes, {count} rect(s):',
+                  struct.unpack('>HHHH', msg[2:10]))
+        writer.close()
+        await asyncio.sleep(0.1)
+        mirror.close()
+
+    asyncio.run(run())
+    pg.quit()
+
+
+if __name__ == "__main__" :
+    test()
@@ -5,25 +5,65 @@
 import paho.mqtt.client as mqtt
 import time
 import json
+import socket
+import hashlib
 import logging
 
 from secrets import secrets
+from logsetup import setup_logging
+
+
+def device_client_id(prefix='clock'):
+    """A client ID that is stable across restarts, and unique per device
+    (from the hostname and machine-id), short enough for any broker."""
+    try:
+        with open('/etc/machine-id') as f:
+            machine_id = f.read().strip()
+    except OSError:
+        machine_id = ''
+    digest = hashlib.sha1(f'{socket.gethostname()}/{machine_id}'.encode())
+    return f'{prefix}-{digest.hexdigest()[:12]}'
 
 
 class MQTT_Listener:
-    """Wrapper for subscribing to weather updates from an MQTT feed."""
+    """Wrapper for subscribing to weather updates from an MQTT feed.
+
+    With PERSIST, the broker keeps our session (and subscription) across
+    restarts, and queues QoS 1 messages sent while we're away.  Either
+    way, the latest value is asked for on connect (Adafruit IO's /get;
+    other brokers send retained messages on subscribe), so the outdoor
+    values come back within seconds rather than at the probe's next
+    publish.  Replays of a message already seen are dropped.
+    """
+    QOS = 1
+    DEDUP_WINDOW = 5 * 60       # seconds a message is remembered for
+    REPLAY_WINDOW = 60          # seconds after connecting that replays arrive
+    # the message's own time, if the probe sends one
+    STAMP_FIELDS = ('created_at', 'timestamp')
 
-    def __init__(self, host, secure=False, persist=False):
-        self.logger = logging.getLogger()
+    def __init__(self, host, secure=False, persist=False, client_id=None):
+        self.logger = logging.getLogger(__name__)
         self.values = {}
+        # optional fn(values) called (in the paho thread) on each new message
+        self.on_update = None
+        # simple counters for the metrics endpoint
+        self.msgs_in = 0
+        self.msgs_out = 0
+        self.msgs_dup = 0
+        self.connects = 0
+        self.recent = {}        # message key -> time received
+        self.connected_at = 0
         self.username=secrets["AIO_USERNAME"]
+        self.topic = f"{self.username}/groups/Porch/json"
         # Initialize a new MQTT Client object
         if persist:
-            # use persistent conn and queued messages
-            client_id = 'Clock_123'
+            # use persistent conn and queued messages - needs an ID that
+            # is the same after a restart, but not shared with another clock
+            if client_id is None:
+                client_id = device_client_id()
             cleanup = False
         else:
-            client_id = ''
+            client_id = client_id or ''
             cleanup = True
         # Paho 2.1 now deprecates the v1 API, but RPi has 1.6.1
         mqttc = mqtt.Client(
@@ -58,16 +98,55 @@ class MQTT_Listener:
     # For v2, use this signature:
     #def on_connect(self, client, userdata, flags, reason_code, properties):
     def on_connect(self, client, userdata, flags, reason_code):
-        # Subscribe to Group
-        client.subscribe(f"{self.username}/groups/Porch/json")
+        self.connects += 1
+        self.connected_at = time.time()
+        session = flags.get('session present', 0)
+        self.logger.info('MQTT connected (%s), session present: %s',
+                         reason_code, session)
+        # Subscribe to Group (again - harmless if the session kept it)
+        client.subscribe(self.topic, qos=self.QOS)
+        if not self.values:
+            # nothing yet - ask for the last value the probe sent
+            client.publish(f'{self.topic}/get', '', qos=self.QOS)
+
+    def is_duplicate(self, data, payload, now):
+        """True if the message was already seen (e.g. queued for our session,
+        and also sent by /get) within DEDUP_WINDOW.
+
+        Messages are told apart by their own timestamp, so the same reading
+        sent again is still new.  Without one, only an identical PAYLOAD
+        within REPLAY_WINDOW of connecting counts as a replay.
+        """
+        self.recent = {key: tstamp for key, tstamp in self.recent.items()
+                       if now - tstamp < self.DEDUP_WINDOW}
+        stamp = next((data[field] for field in self.STAMP_FIELDS
+                      if field in data), None)
+        if stamp is not None:
+            key = ('stamp', str(stamp))
+        elif now - self.connected_at < self.REPLAY_WINDOW:
+            key = ('payload', hashlib.sha1(payload).digest())
+        else:
+            return False
+        if key in self.recent:
+            return True
+        self.recent[key] = now
+        return False
 
     def on_message(self, client, userdata, msg):
-        self.logger.debug(f"MQTT msg: {msg.topic} {str(msg.payload)}")
+        self.msgs_in += 1
+        self.logger.debug('MQTT msg: %s %s (retain=%s)', msg.topic, msg.payload,
+                          msg.retain)
         data = json.loads(msg.payload.decode('utf-8'))
+        if self.is_duplicate(data, msg.payload, time.time()):
+            self.msgs_dup += 1
+            self.logger.debug('MQTT msg: duplicate dropped')
+            return
         for key,val in data['feeds'].items():
             #logger.info(f'MQTT update: {key} = {val}')
             self.values[key] = float(val)
         self.values['timestamp'] = time.time()
+        if self.on_update:
+            self.on_update(dict(self.values))
 
     def get_curr_values(self):
         return self.values
@@ -84,7 +163,21 @@ class MQTT_Listener:
         BASE = f"{self.username}/feeds"
         for topic,payload in values:
             result = self.mqtt_client.publish(f'{BASE}/{topic}', payload)
-            self.logger.debug(f"MQTT publish: {topic} {str(payload)} -> {result.rc}")
+            self.msgs_out += 1
+            self.logger.debug('MQTT publish: %s %s -> %s', topic, payload, result.rc)
+
+    def publish_alert(self, name, level, message, active):
+        topic = f"{self.username}/feeds/Clock-Alerts"
+        payload = json.dumps({'name': name, 'level': level,
+                              'message': message, 'active': active,
+                              'timestamp': time.time()})
+        result = self.mqtt_client.publish(topic, payload)
+        self.msgs_out += 1
+        self.logger.debug('MQTT alert: %s -> %s', payload, result.rc)
+
+    def close(self):
+        self.mqtt_client.disconnect()
+        self.mqtt_client.loop_stop()
 
 
 def test_publ():
@@ -112,7 +205,6 @@ def test_recv():
 if __name__ == "__main__" :
     #level = logging.INFO
     level = logging.DEBUG
-    logging.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s',
-                        level=level)
+    setup_logging(level=level)
     #test_publ()
     test_recv()
@@ -0,0 +1,523 @@
+##
+## Page manager - rotate between pre-rendered display pages
+##
+
+import time
+import logging
+
+import pygame as pg
+
+from touch import HitIndex, Gesture
+from animation import Animator, BlinkingColon, ValueTween, WeatherIcon
+
+
+def indoor_temp(app):
+    """The indoor temperature, or None before the first reading."""
+    sensor = app.sensor
+    return sensor.get_last_temp() if sensor.last_update else None
+
+
+class Page:
+    """Base class for one full-screen page.
+
+    Each page draws into its own offscreen surface, and is only re-drawn
+    when the value returned by data_key() changes.  Anything that moves
+    in between is an Animation (see make_animations()).
+    """
+    NAME = 'page'
+    DWELL = 15                  # seconds to show this page when rotating
+    WIDGETS = ()                # touchable areas, as (name, (x, y, w, h))
+
+    def __init__(self, app):
+        self.app = app
+        self.surface = None
+        self.key = None
+        self.prefetching = False
+        self.scratch = None
+        self.hit_index = None
+        self.animations = None
+
+    def make_animations(self):
+        """The page's animated widgets (see animation.py)."""
+        return []
+
+    def get_animations(self):
+        if self.animations is None:
+            self.animations = self.make_animations()
+        return self.animations
+
+    def data_key(self):
+        """Return a hashable summary of everything draw() depends on."""
+        return None
+
+    def draw(self, surface):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self.key = None
+        self.surface = None
+
+    def get_widgets(self):
+        """Touchable areas as (name, Rect), bottom to top."""
+        return [(name, pg.Rect(rect)) for name, rect in self.WIDGETS]
+
+    def get_hit_index(self):
+        # built on first use; set hit_index = None if the layout changes
+        if self.hit_index is None:
+            self.hit_index = HitIndex(self.get_widgets())
+        return self.hit_index
+
+    def on_tap(self, widget):
+        """Handle a tap on WIDGET (a name, or None), True if handled."""
+        return False
+
+    def get_surface(self):
+        """Return the cached page surface, re-drawing it only if stale."""
+        key = self.data_key()
+        if self.surface is None or key != self.key:
+            if self.surface is None:
+                # display format, so blitting it every frame is a plain copy
+                self.surface = pg.Surface(self.app.size).convert()
+            self.surface.fill(self.app.BGCOLOR)
+            self.draw(self.surface)
+            self.draw_border(self.surface)
+            self.key = key
+            return self.surface, True
+        return self.surface, False
+
+    def draw_border(self, surface):
+        pad = 10
+        rect = (pad, pad, self.app.WIDTH-2*pad, self.app.HEIGHT-2*pad)
+        pg.draw.rect(surface, self.app.FGCOLOR, rect, width=1)
+
+    def text(self, surface, font, msg, pos, color=None):
+        if color is None:
+            color = self.app.FGCOLOR
+        if self.prefetching:
+            self.app.raster.prefetch(font, msg, color)
+            return pg.Rect(pos, (0, 0))
+        rendered = self.app.raster.get(font, msg, color)
+        surface.blit(rendered, pos)
+        return rendered.get_rect(topleft=pos)
+
+    def prefetch(self):
+        """Queue renders for all the text draw() would use right now.
+
+        Runs draw() against a 1x1 scratch surface with text() only
+        submitting jobs to the rasterizer, so the strings (and colors)
+        are worked out exactly the same way as in a real redraw.
+        """
+        if self.scratch is None:
+            self.scratch = pg.Surface((1, 1))
+        self.prefetching = True
+        try:
+            self.draw(self.scratch)
+        finally:
+            self.prefetching = False
+
+
+class ClockPage(Page):
+    """The original clock + indoor/outdoor summary screen."""
+    NAME = 'clock'
+    DWELL = 60
+    WIDGETS = (('time', (20, 20, 984, 310)),
+               ('alerts', (20, 330, 984, 55)),
+               ('indoor', (20, 390, 520, 190)),
+               ('outdoor', (540, 390, 464, 190)))
+    # tapping a summary block opens its detail page
+    TAP_PAGES = {'indoor': 'indoor', 'outdoor': 'outdoor', 'alerts': 'history'}
+
+    def data_key(self):
+        app = self.app
+        return (app.clocksrc.version,
+                tuple(sorted(app.mqtt.get_curr_values().items())),
+                app.alerts.version,
+                tuple(sorted(app.sensor.last_readings.items())))
+
+    def make_animations(self):
+        app = self.app
+        height = app.fontmgr.slots['LARGE']['height']
+        return [
+            BlinkingColon(app, 'CLOCK', 50),
+            ValueTween(app, (50, 450, 230, height), 'LARGE',
+                       lambda: indoor_temp(app),
+                       lambda value: app.units.format('Indoor-Temp', value),
+                       lambda: app.get_alert_color('Indoor-Temp',
+                                                   'Indoor-Sensor')),
+            ValueTween(app, (780, 450, 220, height), 'LARGE',
+                       lambda: app.mqtt.get_curr_values().get('alt-temp'),
+                       lambda value: app.units.format('alt-temp', value),
+                       lambda: app.get_alert_color('alt-temp')),
+        ]
+
+    def on_tap(self, widget):
+        if widget in self.TAP_PAGES:
+            return self.app.pages.show_page(self.TAP_PAGES[widget])
+        return False
+
+    def draw(self, surface):
+        app = self.app
+        timestr, datestr = app.get_time_strings()
+        # the time string is fixed-width ('%l' pads the hour), so centering
+        # it from cached advance widths keeps the digits from jumping around
+        self.text(surface, 'CLOCK', timestr, (app.center_x('CLOCK', timestr), 50))
+        self.text(surface, 'MEDIUM', datestr, (app.center_x('MEDIUM', datestr), 270))
+
+        ## Outdoor block
+        block_x = 780
+        probe_vals = app.mqtt.get_curr_values()
+        fmt = app.units.format
+        self.text(surface, 'SMALL', 'Outdoor:', (block_x+15, 400))
+        temp = probe_vals.get('alt-temp', 0)
+        color = app.get_alert_color('alt-temp')
+        self.text(surface, 'LARGE', fmt('alt-temp', temp), (block_x, 450), color)
+        block_x = 560
+        humid = probe_vals.get('alt-humidity', 0)
+        self.text(surface, 'SMALL', f'Hum:  {fmt("alt-humidity", humid)}',
+                  (block_x, 400))
+        bar = probe_vals.get('pressure', 0)
+        self.text(surface, 'SMALL', f'Bar:  {fmt("pressure", bar)}',
+                  (block_x, 460), app.get_alert_color('pressure'))
+        batt = probe_vals.get('battery-charge', 0)
+        self.text(surface, 'SMALL', f'Bat:  {fmt("battery-charge", batt)}',
+                  (block_x, 520), app.get_alert_color('battery-charge'))
+
+        ## Indoor block
+        block_x = 50
+        self.text(surface, 'SMALL', 'Indoor:', (block_x+15, 400))
+        temp = app.sensor.get_last_temp()
+        self.text(surface, 'LARGE', fmt('Indoor-Temp', temp), (block_x, 450),
+                  app.get_alert_color('Indoor-Temp', 'Indoor-Sensor'))
+        block_x = 290
+        humid = app.sensor.get_last_humidity()
+        self.text(surface, 'SMALL', f'Hum:  {fmt("Indoor-Humidity", humid)}',
+                  (block_x, 400),
+                  app.get_alert_color('Indoor-Humidity', 'Indoor-Sensor'))
+        barom = app.sensor.get_last_barom()
+        self.text(surface, 'SMALL', f'Bar:  {fmt("Indoor-Pressure", barom)}',
+                  (block_x, 460), app.get_alert_color('Indoor-Sensor'))
+        voc = app.sensor.get_last_voc()
+        self.text(surface, 'SMALL', f'VOC:  {fmt("Indoor-VOC", voc)}',
+                  (block_x, 520),
+                  app.get_alert_color('Indoor-VOC', 'Indoor-Sensor'))
+
+        ## Active alerts (worst first) between the date and the data blocks
+        active = sorted(app.alerts.get_active(),
+                        key=lambda rule: rule.level != 'error')
+        if active:
+            msg = '  ·  '.join(rule.message for rule in active[:3])
+            color = app.get_alert_color(active[0].field)
+            self.text(surface, 'SMALL', msg, (50, 340), color)
+
+
+class IndoorPage(Page):
+    """Detailed indoor readings from the BME680."""
+    NAME = 'indoor'
+
+    def make_animations(self):
+        app = self.app
+        rect = (50, 120, app.WIDTH - 100, app.fontmgr.slots['LARGE']['height'])
+        return [ValueTween(app, rect, 'LARGE', lambda: indoor_temp(app),
+                           lambda value: app.units.format('Indoor-Temp', value,
+                                                          'long'),
+                           lambda: app.get_alert_color('Indoor-Temp',
+                                                       'Indoor-Sensor'))]
+
+    def data_key(self):
+        return (tuple(sorted(self.app.sensor.last_readings.items())),
+                self.app.alerts.version)
+
+    def draw(self, surface):
+        sensor = self.app.sensor
+        fmt = self.app.units.format
+        self.text(surface, 'MEDIUM', 'Indoor', (50, 40))
+        self.text(surface, 'LARGE',
+                  fmt('Indoor-Temp', sensor.get_last_temp(), 'long'), (50, 120),
+                  self.app.get_alert_color('Indoor-Temp', 'Indoor-Sensor'))
+        if sensor.is_dummy():
+            self.text(surface, 'SMALL', 'Sensor offline - retrying',
+                      (50, 500), self.app.FGERROR)
+        self.text(surface, 'SMALL', 'Humidity:  ' +
+                  fmt('Indoor-Humidity', sensor.get_last_humidity(), 'long'),
+                  (50, 320))
+        self.text(surface, 'SMALL', 'Pressure:  ' +
+                  fmt('Indoor-Pressure', sensor.get_last_barom(), 'long'),
+                  (50, 380))
+        self.text(surface, 'SMALL', 'VOC:  ' +
+                  fmt('Indoor-VOC', sensor.get_last_voc(), 'long'), (50, 440))
+
+
+class OutdoorPage(Page):
+    """Detailed readings from the outdoor probe (via MQTT)."""
+    NAME = 'outdoor'
+
+    def make_animations(self):
+        app = self.app
+        rect = (50, 120, app.WIDTH - 100, app.fontmgr.slots['LARGE']['height'])
+        return [ValueTween(app, rect, 'LARGE',
+                           lambda: app.mqtt.get_curr_values().get('alt-temp'),
+                           lambda value: app.units.format('alt-temp', value,
+                                                          'long'),
+                           lambda: app.get_alert_color('alt-temp'))]
+
+    def data_key(self):
+        return (tuple(sorted(self.app.mqtt.get_curr_values().items())),
+                self.app.alerts.version)
+
+    def draw(self, surface):
+        app = self.app
+        vals = app.mqtt.get_curr_values()
+        fmt = app.units.format
+        color = app.get_alert_color('alt-temp')
+        self.text(surface, 'MEDIUM', 'Outdoor', (50, 40))
+        self.text(surface, 'LARGE',
+                  fmt('alt-temp', vals.get('alt-temp', 0), 'long'),
+                  (50, 120), color)
+        self.text(surface, 'SMALL', 'Humidity:  ' +
+                  fmt('alt-humidity', vals.get('alt-humidity', 0), 'long'),
+                  (50, 320))
+        self.text(surface, 'SMALL', 'Pressure:  ' +
+                  fmt('pressure', vals.get('pressure', 0), 'long'), (50, 380))
+        self.text(surface, 'SMALL', 'Battery:  ' +
+                  fmt('battery-charge', vals.get('battery-charge', 0), 'long'),
+                  (50, 440))
+        tstamp = vals.get('timestamp')
+        if tstamp:
+            updated = time.strftime('%l:%M %P', time.localtime(tstamp))
+            self.text(surface, 'SMALL', f'Updated: {updated}', (50, 500), color)
+
+
+class ForecastPage(Page):
+    """Current conditions from OpenWeather (if the App has one)."""
+    NAME = 'forecast'
+    ICON_RECT = (700, 120, 260, 260)
+
+    def make_animations(self):
+        return [WeatherIcon(self.app, self.ICON_RECT,
+                            lambda: getattr(self.app, 'weather', None))]
+
+    def data_key(self):
+        weather = getattr(self.app, 'weather', None)
+        if weather is None:
+            return None
+        return (weather.city_name, weather.temperature, weather.description,
+                weather.icon)
+
+    def draw(self, surface):
+        weather = getattr(self.app, 'weather', None)
+        self.text(surface, 'MEDIUM', 'Forecast', (50, 40))
+        if weather is None or weather.temperature is None:
+            self.text(surface, 'SMALL', 'No forecast available', (50, 140),
+                      self.app.FGWARNING)
+            return
+        self.text(surface, 'MEDIUM', weather.city_name, (50, 140))
+        self.text(surface, 'LARGE', weather.temperature, (50, 220))
+        self.text(surface, 'SMALL', weather.description, (50, 380))
+        if not self.prefetching:
+            icon, = self.get_animations()
+            icon.draw_still(surface)
+
+
+class HistoryPage(Page):
+    """Simple line plots of recent indoor and outdoor temperatures."""
+    NAME = 'history'
+    PLOTS = (('Indoor-Temp', 'Indoor'),
+             ('alt-temp', 'Outdoor'))
+
+    def data_key(self):
+        return self.app.history.version
+
+    def draw(self, surface):
+        self.text(surface, 'MEDIUM', 'History', (50, 40))
+        top = 120
+        height = 200
+        for field, label in self.PLOTS:
+            rect = pg.Rect(50, top, self.app.WIDTH - 100, height)
+            self.draw_plot(surface, rect, field, label)
+            top += height + 30
+
+    def draw_plot(self, surface, rect, field, label):
+        app = self.app
+        pg.draw.rect(surface, app.FGCOLOR, rect, width=1)
+        values = app.history.get_values(field)
+        if len(values) < 2:
+            self.text(surface, 'SMALL', f'{label}: no data',
+                      (rect.x + 10, rect.y + 10), app.FGWARNING)
+            return
+        lo = min(values)
+        hi = max(values)
+        span = (hi - lo) or 1.0
+        step = rect.width / (len(values) - 1)
+        points = [(rect.x + i*step,
+                   rect.bottom - (val - lo) / span * (rect.height - 1))
+                  for i, val in enumerate(values)]
+        pg.draw.lines(surface, app.FGCOLOR, False, points)
+        fmt = app.units.formatter(field)
+        self.text(surface, 'SMALL', f'{label}: {fmt(lo)} - {fmt(hi)}',
+                  (rect.x + 10, rect.y + 10))
+
+
+class PageManager:
+    """Rotate between pages, using cached surfaces and cheap transitions."""
+    IDLE_FPS = 0                # 0: only draw when something changes
+    TRANSITION_FPS = 30
+    TRANSITION_TIME = 0.6       # seconds
+    TRANSITIONS = ('slide', 'fade')
+
+    def __init__(self, app, pages, transition='slide', rotate=True):
+        self.logger = logging.getLogger(__name__)
+        self.app = app
+        self.pages = pages
+        self.transition = transition
+        self.rotate = rotate
+        self.held = False       # rotation paused from the touchscreen
+        self.pressed = None     # rect of the widget being touched
+        self.index = 0
+        self.prev_index = None
+        self.trans_start = 0
+        self.next_switch = time.time() + self.current().DWELL
+        self.animator = Animator()
+        self.animate = True     # off in low-power modes
+
+    def current(self):
+        return self.pages[self.index]
+
+    def in_transition(self):
+        return self.prev_index is not None
+
+    def get_fps(self):
+        """Steady frame rate needed right now (raised only during a
+        transition; animations are paced by time_to_frame())."""
+        if self.in_transition():
+            return self.TRANSITION_FPS
+        return self.IDLE_FPS
+
+    def get_animations(self):
+        if not self.animate or self.in_transition():
+            return []
+        return self.current().get_animations()
+
+    def time_to_frame(self, now=None):
+        """Seconds until an animation frame or a page switch is due."""
+        if now is None:
+            now = time.time()
+        wait = self.animator.time_to_frame(self.get_animations(), now)
+        if self.rotate and not self.held and not self.in_transition():
+            wait = min(wait, max(0, self.next_switch - now))
+        return wait
+
+    def show(self, index):
+        index = index % len(self.pages)
+        if index == self.index:
+            return
+        self.logger.debug('page switch: %s -> %s',
+                          self.current().NAME, self.pages[index].NAME)
+        self.prev_index = self.index
+        self.index = index
+        self.animator.reset()
+        self.trans_start = time.time()
+        self.next_switch = self.trans_start + self.current().DWELL
+
+    def show_page(self, name):
+        for index, page in enumerate(self.pages):
+            if page.NAME == name:
+                self.show(index)
+                return True
+        return False
+
+    def next_page(self):
+        self.show(self.index + 1)
+
+    def prev_page(self):
+        self.show(self.index - 1)
+
+    def invalidate(self):
+        for page in self.pages:
+            page.invalidate()
+        self.animator.reset()
+
+    def prefetch(self):
+        for page in self.pages:
+            page.prefetch()
+
+    def update(self):
+        now = time.time()
+        if (self.rotate and not self.held and not self.in_transition() and
+                now > self.next_switch):
+            self.next_page()
+
+    def hit_test(self, pos):
+        """(name, Rect) of the current page's widget at POS, or None."""
+        return self.current().get_hit_index().find(pos)
+
+    def press(self, display, pos):
+        """Outline the touched widget right away, returns the rect to update."""
+        if self.in_transition():
+            return None
+        hit = self.hit_test(pos)
+        if hit is None:
+            return None
+        self.pressed = hit[1]
+        pg.draw.rect(display, self.app.FGCOLOR, self.pressed, width=3)
+        return self.pressed
+
+    def release(self, display):
+        """Remove the outline again (from the cached page surface)."""
+        rect, self.pressed = self.pressed, None
+        surface = self.current().surface
+        if rect is None or surface is None:
+            return None
+        display.blit(surface, rect, rect)
+        return rect
+
+    def on_gesture(self, gesture):
+        if gesture.kind == Gesture.SWIPE:
+            if gesture.direction == 'left':
+                self.next_page()
+            elif gesture.direction == 'right':
+                self.prev_page()
+        elif gesture.kind == Gesture.LONG_PRESS:
+            self.held = not self.held
+            self.logger.info('Page rotation %s',
+                             'paused' if self.held else 'resumed')
+            self.next_switch = time.time() + self.current().DWELL
+        elif gesture.kind == Gesture.TAP:
+            hit = self.hit_test(gesture.pos)
+            if not self.current().on_tap(hit[0] if hit else None):
+                # tapping any other page goes back to the clock
+                self.show(0)
+
+    def render(self, display):
+        """Blit the current page (or a transition) onto DISPLAY.
+
+        Returns the list of rects of the display that changed.
+        """
+        self.update()
+        now = time.time()
+        new_surf, changed = self.current().get_surface()
+        if not self.in_transition():
+            if changed:
+                display.blit(new_surf, (0, 0))
+            rects = self.animator.render(display, new_surf,
+                                         self.get_animations(), now, changed)
+            return [display.get_rect()] if changed else rects
+
+        progress = (now - self.trans_start) / self.TRANSITION_TIME
+        if progress >= 1.0:
+            self.prev_index = None
+            display.blit(new_surf, (0, 0))
+            self.animator.render(display, new_surf, self.get_animations(),
+                                 now, full=True)
+            return [display.get_rect()]
+
+        old_surf, _ = self.pages[self.prev_index].get_surface()
+        if self.transition == 'fade':
+            display.blit(old_surf, (0, 0))
+            new_surf.set_alpha(int(255 * progress))
+            display.blit(new_surf, (0, 0))
+            new_surf.set_alpha(None)
+        else:
+            offset = int(self.app.WIDTH * progress)
+            display.blit(old_surf, (-offset, 0))
+            display.blit(new_surf, (self.app.WIDTH - offset, 0))
+        return [display.get_rect()]
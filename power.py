@@ -0,0 +1,150 @@
+##
+## Display power management - night dimming, blanking and inactivity timeout
+##
+
+import os
+import glob
+import time
+import datetime
+import logging
+
+
+class Backlight:
+    """Control the panel backlight through sysfs, if the driver exposes it."""
+    SYSFS_GLOB = '/sys/class/backlight/*'
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.path = None
+        self.max_brightness = 0
+        for path in sorted(glob.glob(self.SYSFS_GLOB)):
+            try:
+                with open(os.path.join(path, 'max_brightness')) as f:
+                    self.max_brightness = int(f.read())
+                self.path = path
+                break
+            except (OSError, ValueError):
+                continue
+        if self.path:
+            self.logger.info('Backlight: %s max=%d', self.path, self.max_brightness)
+
+    def is_available(self):
+        return self.path is not None
+
+    def set_level(self, level):
+        """Set brightness as a fraction 0.0 - 1.0 (0 turns the panel off)."""
+        if not self.path:
+            return False
+        try:
+            with open(os.path.join(self.path, 'brightness'), 'w') as f:
+                f.write(str(int(round(level * self.max_brightness))))
+            with open(os.path.join(self.path, 'bl_power'), 'w') as f:
+                # 0 = on, 4 = FB_BLANK_POWERDOWN
+                f.write('0' if level > 0 else '4')
+        except OSError as e:
+            self.logger.warning('Backlight write failed: %s', e)
+            return False
+        return True
+
+
+class PowerManager:
+    """Pick the display power mode from a schedule and user activity.
+
+    Modes are ACTIVE (normal), DIM (reduced brightness and once-a-minute
+    redraws) and BLANK (backlight off, no redraws at all).
+    """
+    ACTIVE = 'active'
+    DIM = 'dim'
+    BLANK = 'blank'
+
+    # (start, end, mode) in local time - ranges may wrap past midnight
+    SCHEDULE = [
+        (datetime.time(22, 30), datetime.time(6, 0), DIM),
+    ]
+    INACTIVITY_TIMEOUT = None   # seconds before dimming, None to disable
+    WAKE_TIME = 60              # seconds to stay ACTIVE after a wake-up
+    DIM_LEVEL = 0.2             # backlight fraction in DIM mode
+    LOWPOWER_WAIT = 60          # max seconds between wakeups when not ACTIVE
+
+    def __init__(self, schedule=None, inactivity_timeout=INACTIVITY_TIMEOUT):
+        self.logger = logging.getLogger(__name__)
+        if schedule is None:
+            schedule = self.SCHEDULE
+        self.schedule = schedule
+        self.inactivity_timeout = inactivity_timeout
+        self.backlight = Backlight()
+        self.last_activity = time.time()
+        self.wake_until = 0
+        self.mode = self.ACTIVE
+
+    def configure(self, schedule, inactivity_timeout, wake_time, dim_level):
+        """Apply new settings (config reload); takes effect immediately."""
+        self.schedule = schedule
+        self.inactivity_timeout = inactivity_timeout
+        self.WAKE_TIME = wake_time
+        self.DIM_LEVEL = dim_level
+        if self.mode == self.DIM:
+            self.backlight.set_level(dim_level)
+
+    def scheduled_mode(self, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+        tod = now.time()
+        for start, end, mode in self.schedule:
+            if start <= end:
+                if start <= tod < end:
+                    return mode
+            elif tod >= start or tod < end:
+                return mode
+        return self.ACTIVE
+
+    def wake(self, reason=''):
+        """Go back to ACTIVE for WAKE_TIME seconds (keypress, data alarm)."""
+        now = time.time()
+        self.last_activity = now
+        self.wake_until = now + self.WAKE_TIME
+        if self.mode != self.ACTIVE:
+            self.logger.info('Display wake-up: %s', reason)
+
+    def update(self):
+        """Re-evaluate the mode, returns True if it changed."""
+        now = time.time()
+        if now < self.wake_until:
+            mode = self.ACTIVE
+        else:
+            mode = self.scheduled_mode()
+            if (mode == self.ACTIVE and self.inactivity_timeout and
+                    now - self.last_activity > self.inactivity_timeout):
+                mode = self.DIM
+        if mode == self.mode:
+            return False
+        self.logger.info('Display power mode: %s -> %s', self.mode, mode)
+        self.mode = mode
+        if mode == self.ACTIVE:
+            self.backlight.set_level(1.0)
+        elif mode == self.DIM:
+            self.backlight.set_level(self.DIM_LEVEL)
+        else:
+            self.backlight.set_level(0)
+        return True
+
+    def is_low_power(self):
+        return self.mode != self.ACTIVE
+
+    def is_blanked(self):
+        return self.mode == self.BLANK
+
+    def needs_software_dim(self):
+        """Without a sysfs backlight, DIM has to be faked when drawing."""
+        return self.mode == self.DIM and not self.backlight.is_available()
+
+    def get_wait_time(self):
+        """Seconds the main loop may sleep in low-power mode.
+
+        Wakes at the next minute boundary, so the clock still flips on
+        time when dimmed.
+        """
+        if self.mode == self.BLANK:
+            return self.LOWPOWER_WAIT
+        now = time.time()
+        return min(self.LOWPOWER_WAIT, 60 - now % 60 + 0.05)
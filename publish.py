@@ -0,0 +1,219 @@
+##
+## Publishers for the indoor readings and alerts - Adafruit IO, Home Assistant
+##
+
+import json
+import socket
+import logging
+
+import paho.mqtt.client as mqtt
+
+import units
+from secrets import secrets
+
+
+class AdafruitPublisher:
+    """Publish to the io.adafruit.com feeds, over the MQTT_Listener's
+    connection (the original, and default, behaviour).
+
+    GET_LISTENER returns the current MQTT_Listener, which is replaced
+    when the server setting changes.
+    """
+    NAME = 'adafruit'               # publisher label for the metrics
+
+    def __init__(self, get_listener):
+        self.get_listener = get_listener
+        self.msgs_out = 0
+
+    def publish_indoor(self, values):
+        self.get_listener().publish_indoor(values)
+        self.msgs_out += len(values)        # one message per feed
+
+    def publish_alert(self, name, level, message, active):
+        self.get_listener().publish_alert(name, level, message, active)
+        self.msgs_out += 1
+
+    def close(self):
+        pass        # the connection belongs to the listener
+
+
+class HomeAssistantPublisher:
+    """Publish to a (LAN) broker, using Home Assistant MQTT discovery.
+
+    Each field gets a retained config topic, published once per connection
+    (and again if Home Assistant restarts); all the values of a cycle go
+    out as one JSON payload on a single state topic.  The availability
+    topic is 'online' while connected, and the broker sets it to 'offline'
+    (the will) if we go away.  The connection is made in paho's thread,
+    so nothing here blocks.
+    """
+    NAME = 'homeassistant'          # publisher label for the metrics
+    PREFIX = 'homeassistant'        # discovery prefix
+    BASE = 'weatherclock'           # our own topics: BASE/NODE_ID/...
+    # units.FIELDS quantity -> Home Assistant device class
+    DEVICE_CLASSES = {'temp': 'temperature', 'humidity': 'humidity',
+                      'pressure': 'atmospheric_pressure',
+                      'light': 'illuminance', 'percent': 'battery'}
+    UNIT_SYMBOLS = {'F': '°F', 'C': '°C', 'ohm': 'Ω', 'lux': 'lx'}
+
+    def __init__(self, host, port=1883, prefix=PREFIX, node_id=None):
+        self.logger = logging.getLogger(__name__)
+        if node_id is None:
+            node_id = socket.gethostname()
+        self.node_id = node_id.replace('-', '_').replace('.', '_')
+        self.prefix = prefix
+        self.state_topic = f'{self.BASE}/{self.node_id}/state'
+        self.avail_topic = f'{self.BASE}/{self.node_id}/availability'
+        self.alert_topic = f'{self.BASE}/{self.node_id}/alerts'
+        self.fields = []                # every field seen
+        self.announced = set()          # fields with a config this connection
+        self.state = {}                 # last values published
+        self.alerts = {}                # active alert name -> message
+        self.msgs_out = 0
+
+        client = mqtt.Client(client_id=f'weatherclock-{self.node_id}',
+                             clean_session=True)
+        username = secrets.get('HA_MQTT_USERNAME')
+        if username:
+            client.username_pw_set(username, secrets.get('HA_MQTT_PASSWORD'))
+        client.will_set(self.avail_topic, 'offline', qos=1, retain=True)
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+        client.connect_async(host, port, keepalive=60)
+        client.loop_start()
+        self.client = client
+
+    def object_id(self, field):
+        return field.lower().replace('-', '_')
+
+    def on_connect(self, client, userdata, flags, reason_code):
+        self.logger.info('Home Assistant MQTT connected (%s)', reason_code)
+        self.publish(self.avail_topic, 'online')
+        # Home Assistant sends 'online' here when it (re)starts
+        client.subscribe(f'{self.prefix}/status', qos=1)
+        self.announce_all()
+
+    def on_message(self, client, userdata, msg):
+        if msg.payload == b'online':
+            self.logger.info('Home Assistant restarted - re-announcing')
+            self.announce_all()
+
+    def announce_all(self):
+        self.announced = set()
+        self.announce_alerts()
+        for field in self.fields:
+            self.announce(field)
+        if self.state:
+            self.publish(self.state_topic, json.dumps(self.state), retain=False)
+
+    def announce(self, field):
+        """Publish the discovery config for FIELD, once per connection."""
+        if field in self.announced:
+            return
+        if field not in self.fields:
+            self.fields.append(field)
+        quantity, unit = units.FIELDS.get(field, (None, None))
+        object_id = self.object_id(field)
+        config = {
+            'name': field.replace('-', ' '),
+            'unique_id': f'{self.node_id}_{object_id}',
+            'object_id': f'{self.node_id}_{object_id}',
+            'state_topic': self.state_topic,
+            'value_template': f'{{{{ value_json.{object_id} }}}}',
+            'availability_topic': self.avail_topic,
+            'state_class': 'measurement',
+            'device': self.device(),
+        }
+        if unit:
+            config['unit_of_measurement'] = self.UNIT_SYMBOLS.get(unit, unit)
+        if quantity in self.DEVICE_CLASSES:
+            config['device_class'] = self.DEVICE_CLASSES[quantity]
+        self.publish(f'{self.prefix}/sensor/{self.node_id}/{object_id}/config',
+                     json.dumps(config))
+        self.announced.add(field)
+
+    def announce_alerts(self):
+        config = {
+            'name': 'Alerts',
+            'unique_id': f'{self.node_id}_alerts',
+            'object_id': f'{self.node_id}_alerts',
+            'device_class': 'problem',
+            'state_topic': self.alert_topic,
+            'value_template': '{{ value_json.state }}',
+            'json_attributes_topic': self.alert_topic,
+            'json_attributes_template': '{{ value_json.alerts | tojson }}',
+            'availability_topic': self.avail_topic,
+            'device': self.device(),
+        }
+        self.publish(f'{self.prefix}/binary_sensor/{self.node_id}/alerts/config',
+                     json.dumps(config))
+        self.publish_alerts()
+
+    def device(self):
+        return {'identifiers': [f'weatherclock_{self.node_id}'],
+                'name': f'WeatherClock {self.node_id}',
+                'model': 'WeatherClock', 'manufacturer': 'ptb99'}
+
+    def publish(self, topic, payload, retain=True):
+        result = self.client.publish(topic, payload, qos=1, retain=retain)
+        self.msgs_out += 1
+        self.logger.debug('HA publish: %s %s -> %s', topic, payload, result.rc)
+
+    def publish_indoor(self, values):
+        for field, _ in values:
+            self.announce(field)
+        self.state.update((self.object_id(field), value)
+                          for field, value in values)
+        self.publish(self.state_topic, json.dumps(self.state), retain=False)
+
+    def publish_alert(self, name, level, message, active):
+        if active:
+            self.alerts[name] = message
+        else:
+            self.alerts.pop(name, None)
+        self.publish_alerts()
+
+    def publish_alerts(self):
+        self.publish(self.alert_topic, json.dumps(
+            {'state': 'ON' if self.alerts else 'OFF', 'alerts': self.alerts}))
+
+    def close(self):
+        # a clean disconnect doesn't trigger the will
+        self.publish(self.avail_topic, 'offline')
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class Publishers:
+    """Fan each publish out to all the configured backends.
+
+    A failing backend is logged, and doesn't stop the others.
+    """
+
+    def __init__(self, backends=()):
+        self.logger = logging.getLogger(__name__)
+        self.backends = list(backends)
+
+    def publish_indoor(self, values):
+        for backend in self.backends:
+            try:
+                backend.publish_indoor(values)
+            except Exception:
+                self.logger.exception('%s publish failed',
+                                      type(backend).__name__)
+
+    def publish_alert(self, name, level, message, active):
+        for backend in self.backends:
+            try:
+                backend.publish_alert(name, level, message, active)
+            except Exception:
+                self.logger.exception('%s alert publish failed',
+                                      type(backend).__name__)
+
+    def sent_counts(self):
+        """Messages published so far, by backend NAME."""
+        return {backend.NAME: backend.msgs_out for backend in self.backends}
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
@@ -0,0 +1,132 @@
+##
+## Text rasterization pool - render text surfaces off the main thread
+##
+
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+import pygame as pg
+
+
+class TextRasterizer:
+    """Render (font slot, text, color) into Surfaces on worker threads.
+
+    prefetch() queues a render as soon as a new value is known; get()
+    returns the finished surface (rendering synchronously only if it was
+    never prefetched).  A Font object isn't safe to use from two threads
+    at once, so each slot has its own lock - different fonts can still be
+    rendered in parallel.
+
+    Surfaces are converted to the display's pixel format once, when they
+    are rendered, so blits never convert per frame.  With a BACKGROUND
+    color (the page background everything is drawn on) the antialiasing
+    is blended against it up front, and the result is an opaque surface
+    with an RLE colorkey - much cheaper to blit than per-pixel alpha, and
+    identical on that background.  Without one, text keeps its alpha.
+    """
+    WORKERS = 2
+    MAX_ENTRIES = 256           # LRU limit on cached surfaces
+
+    def __init__(self, fonts, workers=WORKERS, background=None):
+        self.logger = logging.getLogger(__name__)
+        self.fonts = fonts
+        self.background = tuple(background) if background else None
+        self.locks = {slot: threading.Lock() for slot in fonts}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='raster')
+        self.cache = collections.OrderedDict()  # key -> Surface or Future
+        self.hits = 0
+        self.misses = 0
+
+    def set_background(self, color):
+        """Change the background text is blended against (drops the cache)."""
+        color = tuple(color) if color else None
+        if color != self.background:
+            self.background = color
+            self.cache.clear()
+
+    def render(self, slot, text, color):
+        background = self.background
+        with self.locks[slot]:
+            if background is None:
+                surface = self.fonts[slot].render(text, True, color)
+            else:
+                surface = self.fonts[slot].render(text, True, color, background)
+        return to_display_format(surface, background)
+
+    def prefetch(self, slot, text, color):
+        key = (slot, text, tuple(color))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return
+        self.cache[key] = self.executor.submit(self.render, slot, text, color)
+        self.trim()
+
+    def get(self, slot, text, color):
+        key = (slot, text, tuple(color))
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            surface = self.render(slot, text, color)
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            if isinstance(entry, concurrent.futures.Future):
+                # normally already done - it was queued when the data arrived
+                surface = entry.result()
+            else:
+                surface = entry
+        self.cache[key] = surface
+        self.trim()
+        return surface
+
+    def trim(self):
+        while len(self.cache) > self.MAX_ENTRIES:
+            self.cache.popitem(last=False)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def to_display_format(surface, colorkey=None):
+    """Convert SURFACE to the display's format (if there is a display yet):
+    opaque with an RLE colorkey if COLORKEY is given, else per-pixel alpha."""
+    if not pg.display.get_surface():
+        return surface
+    if colorkey is None:
+        return surface.convert_alpha()
+    surface = surface.convert()
+    surface.set_colorkey(colorkey, pg.RLEACCEL)
+    return surface
+
+
+def blit_cost(target, surface, blits):
+    """Average seconds to blit SURFACE onto TARGET."""
+    pos = ((target.get_width() - surface.get_width()) // 2,
+           (target.get_height() - surface.get_height()) // 2)
+    target.blit(surface, pos)       # (the first blit does the RLE encoding)
+    start = time.perf_counter()
+    for _ in range(blits):
+        target.blit(surface, pos)
+    return (time.perf_counter() - start) / blits
+
+
+def benchmark(target, font, text, fg, bg, blits=500):
+    """Blit cost of TEXT rendered in each surface format, onto TARGET
+    (a display-format surface).  Returns [(format, bits/pixel, seconds)]."""
+    formats = []
+    alpha = font.render(text, True, fg)
+    formats.append(('alpha, unconverted', alpha))
+    formats.append(('alpha, convert_alpha()', alpha.convert_alpha()))
+    opaque = font.render(text, True, fg, bg)
+    formats.append(('opaque, unconverted', opaque))
+    formats.append(('opaque, convert()', opaque.convert()))
+    keyed = opaque.convert()
+    keyed.set_colorkey(bg)
+    formats.append(('colorkey, convert()', keyed))
+    formats.append(('colorkey RLE, convert()', to_display_format(opaque, bg)))
+    return [(name, surface.get_bitsize(), blit_cost(target, surface, blits))
+            for name, surface in formats]
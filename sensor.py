@@ -3,13 +3,21 @@
 ##
 
 import time
+import math
+import array
 import asyncio
 import logging
+import threading
+import contextlib
 
 #import RPi.GPIO as GPIO
-import smbus2
 import bme680
 
+from logsetup import setup_logging
+from i2cbus import I2CBus, I2CDevice, DEVICE_TYPES
+from calibration import CalibrationStore, sensor_id
+import units
+
 ## Use the Pimoroni driver
 # pip install bme680
 ## or
@@ -27,10 +35,23 @@ def avg_last_n(points, n=5):
     return sum(sublist)/len(sublist)
 
 
+def fit_heater_durations(temps, budget, meas_time, min_time=30):
+    """Heater durations (ms) for a sequence of TEMPS that takes about as
+    long as one BUDGET ms heat (each measurement adds MEAS_TIME ms), but
+    no shorter than MIN_TIME - the heater needs 20-30ms to get there.
+    Only as many of TEMPS as fit are used, so the list may be shorter."""
+    count = min(len(temps), int((budget + meas_time) // (min_time + meas_time)))
+    if not count:
+        return []
+    each = (budget - (count - 1) * meas_time) / count
+    return [int(each)] * count
+
+
 class DummyBME680():
     def __init__(self):
-        self.logger = logging.getLogger()
+        self.logger = logging.getLogger(__name__)
         self.gas_enable = False
+        self.nb_profile = 0
         self.data = bme680.FieldData()
         self.logger.info('DummyBME680 called - <either Test env or I2C failure>')
 
@@ -40,28 +61,29 @@ class DummyBME680():
         self.data.pressure = 998.984 # hPa
         if self.gas_enable:
             self.data.heat_stable = True
-            self.data.gas_resistance = 111_000
+            # a little lower at each (hotter) heater step
+            self.data.gas_resistance = 111_000 - 5_000 * (self.nb_profile - 1)
         else:
             self.data.gas_resistance = 0
         self.logger.debug('Dummy BME680 get_sensor_data()')
         return True
 
     def set_temp_offset(self, temp_offset):
-        self.logger.info(f'Dummy BME680 set_temp_offset({temp_offset})')
+        self.logger.info('Dummy BME680 set_temp_offset(%s)', temp_offset)
         return True
 
     def select_gas_heater_profile(self, nb_profile):
-        self.logger.info(f'Dummy BME680 select_gas_heater_profile({nb_profile})')
+        self.logger.debug('Dummy BME680 select_gas_heater_profile(%s)', nb_profile)
+        self.nb_profile = nb_profile
         return True
 
     def set_gas_heater_profile(self, temp, duration, nb_profile=0):
-        self.logger.info(
-            f'Dummy BME680 set_gas_heater_profile({temp}, {duration}, {nb_profile})'
-        )
+        self.logger.info('Dummy BME680 set_gas_heater_profile(%s, %s, %s)',
+                         temp, duration, nb_profile)
         return True
 
     def set_gas_status(self, enable):
-        self.logger.info(f'Dummy BME680 set_gas_status({enable})')
+        self.logger.info('Dummy BME680 set_gas_status(%s)', enable)
         self.gas_enable = enable
         return True             # should return old enable?
 
@@ -72,27 +94,111 @@ class BME_Probe:
     ## Connected via StemmaQT (which is I2C)
     TARGET_ADDR = 0x77   # default seems to be I2C_ADDR_SECONDARY??
 
-    ## Other calibration
-    TEMP_OFFSET = -3.0             # added to temp in C before returning
+    ## Other calibration - temperature offset and per-field corrections
+    ## now come from the per-sensor profiles in calibration.py
     #GAS_BASELINE = 108600         # based on burn-in measurement
     GAS_BASELINE = 400_000          # based on burn-in measurement
 
     # tags for a complete set of measurement results
     FIELDS = ('temperature', 'humidity', 'pressure', 'gas_resistance')
-
-    def __init__(self):
-        self.logger = logging.getLogger()
-
-        try:
-            self.bus = smbus2.SMBus(self.BUS_NUMBER)
-            self.bme = bme680.BME680(i2c_addr=self.TARGET_ADDR, i2c_device=self.bus)
-            self.logger.info(f'BME680 driver: variant={self.bme._variant} '
-                             f'ambient temp={self.bme.ambient_temperature}')
-        except (RuntimeError, IOError, PermissionError):
+    # driver units, and the feed each tag is published as (see units.FIELDS)
+    FEEDS = {'temperature': ('C', 'Indoor-Temp'),
+             'humidity': ('%', 'Indoor-Humidity'),
+             'pressure': ('hPa', 'Indoor-Pressure'),
+             'gas_resistance': ('ohm', 'Indoor-VOC')}
+
+    ## Sampling (read_loop)
+    NUM_PTS = 5                 # measurements to average into a reading
+    INTVL = 2                   # seconds between measurement (0 = back-to-back)
+    PAUSE_TIME = 20             # time between temp and VOC readings
+    HEATER_TEMP = 320           # deg C
+    HEATER_TIME = 500           # msec
+    MEAS_TIME = 0.035           # secs for a T/P/H conversion at 8x/4x/2x
+    # Heater temperatures (deg C) to step through for a gas fingerprint,
+    # e.g. (200, 250, 300, 350, 400).  SEQUENCE_PASSES of the VOC warm-up
+    # measurements (never the ones averaged into the feed) are replaced by
+    # a pass through the sequence, fitted into the same HEATER_TIME, so the
+    # cycle takes as long either way.  Steps get at least SEQUENCE_MIN_TIME
+    # ms of heating; temperatures that don't fit are left out.
+    HEATER_SEQUENCE = ()
+    SEQUENCE_PASSES = 1
+    SEQUENCE_MIN_TIME = 60      # msec
+
+    ## Health checks
+    MAX_FAILURES = 5            # consecutive bad reads before re-probing
+    STALE_AGE = 20 * 60         # seconds without a good reading
+    VALID_RANGES = {            # BME680 operating range
+        'temperature': (-40, 85),
+        'humidity': (0, 100),
+        'pressure': (300, 1100),
+    }
+
+    def __init__(self, bus=None, addr=TARGET_ADDR, calibration=None,
+                 bus_number=None):
+        """BUS is a shared i2cbus.I2CBus; if None, open our own (on
+        BUS_NUMBER, unless given)."""
+        self.logger = logging.getLogger(__name__)
+        self.addr = addr
+        self.bus = bus
+        if calibration is None:
+            calibration = CalibrationStore()
+        self.calibration = calibration
+        if bus is not None:
+            bus_number = bus.bus_number
+        elif bus_number is None:
+            bus_number = self.BUS_NUMBER
+        self.bus_number = bus_number
+        self.sensor_id = sensor_id('bme680', self.bus_number, addr)
+        self.temp_offset = None
+        self.gas_enabled = None     # last gas state written to the chip
+        self.ctrl_meas = None       # cached oversampling/mode register
+        self.heater_profiles = None # (temp, duration) in each profile slot
+        self.gas_profile = None     # selected profile slot
+        # burst results, FIELDS interleaved - allocated once, reused
+        self.samples = array.array('d')
+        # heater sequence results, one resistance per profile per step
+        self.gas_vectors = array.array('d')
+        self.gas_fingerprint = {}   # heater temp -> averaged resistance
+
+        # held while reading, and while the supervisor swaps in a new driver
+        self.lock = threading.RLock()
+        # set to stop a burst early (its read_loop was cancelled)
+        self.abort = threading.Event()
+        self.failures = 0       # consecutive failed reads
+        self.bad_values = False
+
+        self.bme = self.open_driver()
+        if self.bme is None:
             self.bme = DummyBME680()
         # SMBus(1) is the default if i2c_device not specified...
         #self.bme = bme680.BME680()
+        self.configure()
+
+        # Converters from driver units to feed units, looked up once here
+        self.to_feed = {tag: units.get_converter(src, units.FIELDS[feed][1])
+                        for tag, (src, feed) in self.FEEDS.items()}
+
+        # Cache the results of the last multi-sample measurement reading,
+        # both raw and converted (so conversion happens once per sample)
+        self.last_readings = {tag:0 for tag in self.FIELDS}
+        self.last_values = self.convert_readings(self.last_readings)
+        self.last_update = 0
+        self.i2c_errors = 0
 
+    def open_driver(self):
+        """Return a real BME680 driver, or None if it can't be reached."""
+        try:
+            if self.bus is None:
+                self.bus = I2CBus(self.bus_number)
+            bme = bme680.BME680(i2c_addr=self.addr, i2c_device=self.bus)
+            self.logger.info('BME680 driver: variant=%s ambient temp=%s',
+                             bme._variant, bme.ambient_temperature)
+            return bme
+        except (RuntimeError, IOError, PermissionError) as e:
+            self.logger.warning('BME680 not available: %s', e)
+            return None
+
+    def configure(self):
         ## These are the defaults:
         # bme.set_humidity_oversample(bme680.OS_2X)
         # bme.set_pressure_oversample(bme680.OS_4X)
@@ -106,7 +212,8 @@ class BME_Probe:
         # self._filter = 0b010
 
         # calibration adjustment for temperature
-        self.bme.set_temp_offset(self.TEMP_OFFSET)
+        self.temp_offset = None
+        self.apply_temp_offset(self.calibration.get_profile(self.sensor_id))
 
         # These are the "burn-in" settings from the read-all.py example
         # self.bme.set_gas_heater_temperature(320)
@@ -115,140 +222,535 @@ class BME_Probe:
 
         # Up to 10 heater profiles can be configured, each
         # with their own temperature and duration.
-        self.bme.set_gas_heater_profile(320, 500, nb_profile=1)
-        self.bme.select_gas_heater_profile(1)
+        self.heater_profiles = None
+        self.gas_profile = None
+        self.setup_heater()
 
         # Initially, just ignore VOC and read the other measurements
-        self.bme.set_gas_status(bme680.DISABLE_GAS_MEAS)
+        self.gas_enabled = None
+        self.set_gas(False)
+
+        # Oversampling and filter settings don't change after this, so
+        # keep ctrl_meas here: triggering a measurement is then a single
+        # register write, rather than the driver's read-modify-write and
+        # read-back of the mode
+        if self.is_dummy():
+            self.ctrl_meas = None
+        else:
+            with self.transaction():
+                self.ctrl_meas = (self.bme._get_regs(bme680.CONF_T_P_MODE_ADDR, 1)
+                                  & ~bme680.MODE_MSK)
+
+    def apply_temp_offset(self, profile):
+        if profile.temp_offset != self.temp_offset:
+            with self.lock:
+                self.bme.set_temp_offset(profile.temp_offset)
+            self.temp_offset = profile.temp_offset
+
+    def reinit(self):
+        """Re-probe the real driver (called by the SensorSupervisor)."""
+        bme = self.open_driver()
+        if bme is None:
+            return False
+        with self.lock:
+            self.bme = bme
+            try:
+                self.configure()
+            except OSError as e:
+                self.logger.warning('BME680 configure failed: %s', e)
+                return False
+            self.failures = 0
+        self.logger.info('BME680 driver re-initialized')
+        return True
 
-        # Cache the results of the last multi-sample measurement reading
-        self.last_readings = {tag:0 for tag in self.FIELDS}
+    def set_address(self, addr):
+        """Switch to another I2C address; the next reinit() probes it."""
+        with self.lock:
+            self.addr = addr
+            self.sensor_id = sensor_id('bme680', self.bus_number, addr)
+            self.failures = self.MAX_FAILURES
+
+    def is_dummy(self):
+        return isinstance(self.bme, DummyBME680)
+
+    def needs_reinit(self):
+        return self.is_dummy() or self.failures >= self.MAX_FAILURES
+
+    def is_degraded(self):
+        """True if the readings can't be trusted (fake, failing or stale)."""
+        if self.needs_reinit() or self.bad_values:
+            return True
+        return bool(self.last_update and
+                    time.time() - self.last_update > self.STALE_AGE)
+
+    def check_values(self, results):
+        """Reject NaN and physically impossible readings."""
+        for tag, (lo, hi) in self.VALID_RANGES.items():
+            value = results[tag]
+            if math.isnan(value) or not lo <= value <= hi:
+                self.logger.warning('sensor read_data() bad %s: %s', tag, value)
+                return False
+        return True
 
-    def read_data(self, do_voc=False):
-        if do_voc:
-            self.bme.set_gas_status(bme680.ENABLE_GAS_MEAS)
+    def get_heater_profiles(self):
+        """The heater profiles wanted, as {slot: (temp, duration)}."""
+        if self.HEATER_SEQUENCE:
+            durations = fit_heater_durations(
+                self.HEATER_SEQUENCE, self.HEATER_TIME, self.MEAS_TIME * 1000,
+                self.SEQUENCE_MIN_TIME)
+            # slot 0 is the feed's measurement, then the sequence
+            profiles = {0: (self.HEATER_TEMP, self.HEATER_TIME)}
+            for slot, step in enumerate(zip(self.HEATER_SEQUENCE, durations), 1):
+                profiles[slot] = step
+            return profiles
+        # just slot 1, as it always has been
+        return {1: (self.HEATER_TEMP, self.HEATER_TIME)}
+
+    def setup_heater(self):
+        """Write the heater profiles, if they changed (e.g. config reload)."""
+        profiles = self.get_heater_profiles()
+        if profiles == self.heater_profiles:
+            return
+        for slot, (temp, duration) in profiles.items():
+            self.bme.set_gas_heater_profile(temp, duration, nb_profile=slot)
+        self.heater_profiles = profiles
+        self.select_profile(min(profiles))
+        if self.HEATER_SEQUENCE:
+            self.logger.info('sensor heater sequence: %s',
+                             list(profiles.values())[1:])
+            if len(profiles) - 1 < len(self.HEATER_SEQUENCE):
+                self.logger.warning(
+                    'sensor heater sequence: only %d of %d steps fit in %dms',
+                    len(profiles) - 1, len(self.HEATER_SEQUENCE),
+                    self.HEATER_TIME)
+
+    def select_profile(self, slot):
+        if slot != self.gas_profile:
+            self.bme.select_gas_heater_profile(slot)
+            self.gas_profile = slot
+
+    def set_gas(self, enable):
+        """Turn the gas measurement on/off - only written if it changed."""
+        if enable != self.gas_enabled:
+            self.bme.set_gas_status(bme680.ENABLE_GAS_MEAS if enable
+                                    else bme680.DISABLE_GAS_MEAS)
+            self.gas_enabled = enable
+
+    def measure(self, heat_time=0):
+        """One forced-mode measurement into self.bme.data, True if read.
+
+        With a real chip this is one register write to trigger it, a sleep
+        for the expected conversion (plus HEAT_TIME ms for the heater) and
+        normally one block read of the status + data registers.  The bus
+        is only held for the write and the read, not during the sleep.
+        """
+        if self.ctrl_meas is None:
+            return self.bme.get_sensor_data()
+        with self.transaction():
+            self.bme._set_regs(bme680.CONF_T_P_MODE_ADDR,
+                               self.ctrl_meas | bme680.FORCED_MODE)
+        time.sleep(self.MEAS_TIME + heat_time / 1000)
+        fields = range(bme680.FIELD0_ADDR,
+                       bme680.FIELD0_ADDR + bme680.FIELD_LENGTH)
+        for attempt in range(10):
+            with self.transaction():
+                regs = list(self.bus.read_registers(self.addr, fields).values())
+            if regs[0] & bme680.NEW_DATA_MSK:
+                self.decode(regs)
+                return True
+            time.sleep(bme680.POLL_PERIOD_MS / 1000)
+        return False
+
+    def decode(self, regs):
+        """Compensate a raw field block, as BME680.get_sensor_data() does."""
+        bme = self.bme
+        data = bme.data
+        data.status = regs[0] & bme680.NEW_DATA_MSK
+        data.gas_index = regs[0] & bme680.GAS_INDEX_MSK
+        data.meas_index = regs[1]
+        adc_pres = (regs[2] << 12) | (regs[3] << 4) | (regs[4] >> 4)
+        adc_temp = (regs[5] << 12) | (regs[6] << 4) | (regs[7] >> 4)
+        adc_hum = (regs[8] << 8) | regs[9]
+        if bme._variant == bme680.VARIANT_HIGH:
+            gas_regs = regs[15:17]
+            calc_gas = bme._calc_gas_resistance_high
         else:
-            self.bme.set_gas_status(bme680.DISABLE_GAS_MEAS)
-
-        if self.bme.get_sensor_data():
-            # This shouldn't be necessary, as bme.data won't be overwritten
-            # until another get_sensor_data() call is made.
-            data = self.bme.data
-            results = {}
-            results['temperature'] = data.temperature
-            results['pressure'] = data.pressure
-            results['humidity'] = data.humidity
-            if data.heat_stable:
-                results['gas_resistance'] = data.gas_resistance
-            else:
-                if do_voc:
-                    self.logger.warning('sensor read_data() no heat_stable')
-                results['gas_resistance'] = 0
-            self.logger.debug(f'sensor read_data(): {results}')
-            return results
+            gas_regs = regs[13:15]
+            calc_gas = bme._calc_gas_resistance_low
+        data.status |= gas_regs[1] & (bme680.GASM_VALID_MSK | bme680.HEAT_STAB_MSK)
+        data.heat_stable = (data.status & bme680.HEAT_STAB_MSK) > 0
+
+        temperature = bme._calc_temperature(adc_temp)
+        data.temperature = temperature / 100.0
+        bme.ambient_temperature = temperature     # used for heater settings
+        data.pressure = bme._calc_pressure(adc_pres) / 100.0
+        data.humidity = bme._calc_humidity(adc_hum) / 1000.0
+        data.gas_resistance = calc_gas((gas_regs[0] << 2) | (gas_regs[1] >> 6),
+                                       gas_regs[1] & bme680.GAS_RANGE_MSK)
+
+    def get_results(self, do_voc):
+        """Checked results of the last measurement, or None."""
+        data = self.bme.data
+        results = {}
+        results['temperature'] = data.temperature
+        results['pressure'] = data.pressure
+        results['humidity'] = data.humidity
+        if data.heat_stable:
+            results['gas_resistance'] = data.gas_resistance
         else:
+            if do_voc:
+                self.logger.warning('sensor read_data() no heat_stable')
+            results['gas_resistance'] = 0
+        self.logger.debug('sensor read_data(): %s', results)
+        if not self.check_values(results):
+            self.failures += 1
             return None
+        self.failures = 0
+        return results
+
+    def read_data(self, do_voc=False):
+        try:
+            with self.lock:
+                with self.transaction():
+                    self.set_gas(do_voc)
+                ok = self.measure(self.HEATER_TIME if do_voc else 0)
+        except OSError as e:
+            self.i2c_errors += 1
+            self.failures += 1
+            self.logger.warning('sensor read_data() I2C error: %s', e)
+            return None
+        if ok:
+            return self.get_results(do_voc)
+        return None
+
+    def burst(self, count, do_voc=False, interval=None):
+        """Take COUNT measurements with the gas state set once.
+
+        Good results are stored, FIELDS interleaved, in self.samples (which
+        is only re-allocated if it is too small); returns how many.  Runs
+        on an executor thread - it blocks for the whole burst.  The bus is
+        only held for each register access, not across conversions or the
+        INTERVAL waits.
+        """
+        if interval is None:
+            interval = self.INTVL
+        width = len(self.FIELDS)
+        if len(self.samples) < count * width:
+            self.samples = array.array('d', bytes(8 * count * width))
+        samples = self.samples
+        good = 0
+        for n in range(count):
+            if self.abort.is_set() or (n and interval and
+                                       self.abort.wait(interval)):
+                break
+            results = self.read_data(do_voc)
+            if results is None:
+                continue
+            base = good * width
+            for i, tag in enumerate(self.FIELDS):
+                samples[base + i] = results[tag]
+            good += 1
+        return good
+
+    def sequence_slots(self):
+        """Profile slots of the HEATER_SEQUENCE steps (0 is the feed's)."""
+        return [slot for slot in self.heater_profiles if slot]
+
+    def burst_sequence(self, count, interval=None):
+        """Take COUNT passes through the HEATER_SEQUENCE profiles.
+
+        The gas resistance from each step is stored in self.gas_vectors,
+        one row per pass, 0 where the heater didn't stabilize; returns the
+        number of good rows.  The feed's profile is selected again at the
+        end.  Like burst(), this blocks, and only holds the bus per
+        register access.
+        """
+        if interval is None:
+            interval = self.INTVL
+        with self.lock, self.transaction():
+            self.setup_heater()
+            self.set_gas(True)
+        slots = self.sequence_slots()
+        width = len(slots)
+        if len(self.gas_vectors) < count * width:
+            self.gas_vectors = array.array('d', bytes(8 * count * width))
+        vectors = self.gas_vectors
+        good = 0
+        for n in range(count):
+            if self.abort.is_set() or (n and interval and
+                                       self.abort.wait(interval)):
+                break
+            base = good * width
+            ok = True
+            for i, slot in enumerate(slots):
+                try:
+                    with self.lock:
+                        with self.transaction():
+                            self.select_profile(slot)
+                        ok = self.measure(self.heater_profiles[slot][1])
+                except OSError as e:
+                    self.i2c_errors += 1
+                    self.failures += 1
+                    self.logger.warning('sensor burst_sequence() I2C error: %s', e)
+                    ok = False
+                if not ok:
+                    break
+                data = self.bme.data
+                vectors[base + i] = data.gas_resistance if data.heat_stable else 0
+            if ok:
+                good += 1
+        with self.lock, self.transaction():
+            self.select_profile(min(self.heater_profiles))
+        return good
+
+    def get_fingerprint(self, count, n):
+        """Average each sequence step's resistance over the last N of COUNT
+        rows of self.gas_vectors, skipping unstable readings."""
+        slots = self.sequence_slots()
+        width = len(slots)
+        fingerprint = {}
+        for i, slot in enumerate(slots):
+            temp = self.heater_profiles[slot][0]
+            column = [value for value in self.gas_vectors[i:count * width:width]
+                      if value > 0]
+            if column:
+                fingerprint[temp] = avg_last_n(column, n=n)
+        return fingerprint
+
+    def get_samples(self, count, tag):
+        """The TAG column of the first COUNT burst samples."""
+        width = len(self.FIELDS)
+        start = self.FIELDS.index(tag)
+        return self.samples[start:count * width:width].tolist()
+
+    def convert_readings(self, readings):
+        return {tag: self.to_feed[tag](value) for tag, value in readings.items()}
+
+    def transaction(self):
+        if self.bus is None:
+            return contextlib.nullcontext()
+        return self.bus.transaction()
+
+    async def run_burst(self, fn, *args):
+        """Run the blocking burst FN(*ARGS) on an executor thread.
+
+        If we are cancelled meanwhile, the burst is stopped at its next
+        measurement, and waited for, before the cancel goes on - so the
+        next read_loop never has a burst running alongside it.
+        """
+        future = asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self.abort.set()
+            try:
+                await future
+            finally:
+                self.abort.clear()
+            raise
 
     async def read_loop(self):
-        ## these could be optional params??
-        NUM_PTS = 5             # measurements to average into a reading
-        INTVL = 2               # seconds between measurement
-        PAUSE_TIME = 20         # time between temp and VOC readings
+        # (settings may be changed by a config reload while we're running)
+        NUM_PTS = self.NUM_PTS
+        INTVL = self.INTVL
+        PAUSE_TIME = self.PAUSE_TIME
 
         # Track the measurments here:
         points = {tag:[] for tag in self.FIELDS}
 
         # Track our timings
-        #start = time.perf_counter()
         start_reading = time.time()
-        duration_temps = 0
-        elapsed_temps = 0
-
-        # First read temp/humid/pressure w/o VOC
-        for _ in range(2*NUM_PTS):
-            start = time.time()
-            results = self.read_data(do_voc=False)
-            if results:
-                for tag in self.FIELDS:
-                    if tag != 'gas_resistance':
-                        points[tag].append(results[tag])
-            stop = time.time()
-            duration_temps += (stop - start)
-            await asyncio.sleep(INTVL)
+        i2c_start = self.bus.transfers if self.bus else 0
+
+        # First read temp/humid/pressure w/o VOC, as one burst
+        count = await self.run_burst(self.burst, 2*NUM_PTS, False, INTVL)
+        for tag in self.FIELDS:
+            if tag != 'gas_resistance':
+                points[tag] = self.get_samples(count, tag)
 
         elapsed_temps = (time.time() - start_reading)
         # Sleep for a while
         await asyncio.sleep(PAUSE_TIME)
 
+        # Then a burst of VOC measurements
         start_vocs = time.time()
-        duration_vocs = 0
-        elapsed_vocs = 0
-
-        # Then do a bunch of VOC measurement
-        for _ in range(3*NUM_PTS):
-            start = time.time()
-            results = self.read_data(do_voc=True)
-            if results and results['gas_resistance'] > 0:
-                points['gas_resistance'].append(results['gas_resistance'])
-            stop = time.time()
-            duration_vocs += (stop - start)
-            await asyncio.sleep(INTVL)
+        try:
+            with self.lock, self.transaction():
+                self.setup_heater()
+            # sequence passes stand in for the first warm-up measurements
+            passes = 0
+            if self.HEATER_SEQUENCE:
+                passes = min(self.SEQUENCE_PASSES, 2*NUM_PTS)
+            if passes:
+                rows = await self.run_burst(self.burst_sequence, passes, INTVL)
+                self.gas_fingerprint = self.get_fingerprint(rows, NUM_PTS)
+                await asyncio.sleep(INTVL)
+            else:
+                self.gas_fingerprint = {}
+            count = await self.run_burst(
+                self.burst, 3*NUM_PTS - passes, True, INTVL)
+            points['gas_resistance'] = [
+                value for value in self.get_samples(count, 'gas_resistance')
+                if value > 0]
+        finally:
+            # heater off again until next time (also if we were cancelled)
+            with self.lock, self.transaction():
+                self.set_gas(False)
 
         stop_vocs = time.time()
         elapsed_vocs = (stop_vocs - start_vocs)
         duration_total = stop_vocs - start_reading
-        self.logger.info(f'sensor read_loop(): {duration_total:.3f}s = '
-              f'Temps: {len(points["temperature"])} in {duration_temps*1000:.3f}ms for {elapsed_temps:.3f}s, '
-              f'VOCs: {len(points["gas_resistance"])} in {duration_vocs*1000:.3f}ms for {elapsed_vocs:.3f}s'
-            )
+        self.logger.info('sensor read_loop(): %.3fs = '
+              'Temps: %d for %.3fs, VOCs: %d for %.3fs, %d I2C transfers',
+              duration_total, len(points["temperature"]), elapsed_temps,
+              len(points["gas_resistance"]), elapsed_vocs,
+              (self.bus.transfers if self.bus else 0) - i2c_start)
+
+        if not points['temperature']:
+            # nothing usable this cycle - keep the old values, which will
+            # show up as stale (and degraded) if this keeps happening
+            self.bad_values = True
+            self.logger.warning('sensor read_loop(): no valid readings')
+            return None
+        self.bad_values = False
 
-        # average the last 5 points
-        results = {tag: avg_last_n(points[tag], n=NUM_PTS) for tag in self.FIELDS}
+        # correct each field's batch of samples with this sensor's profile
+        # (also picks up calibration changes made while we're running)
+        profile = self.calibration.get_profile(self.sensor_id)
+        points = {tag: profile.apply(tag, points[tag]) for tag in self.FIELDS}
+        self.apply_temp_offset(profile)
+
+        # average the last 5 points (keep the old VOC if it never settled)
+        results = {tag: avg_last_n(points[tag], n=NUM_PTS) if points[tag]
+                   else self.last_readings[tag] for tag in self.FIELDS}
         self.last_readings = results
-        self.logger.info(f'sensor read_loop(): {results}')
+        self.last_values = self.convert_readings(results)
+        self.last_update = time.time()
+        self.logger.info('sensor read_loop(): %s', results)
+        if self.gas_fingerprint:
+            self.logger.info('sensor read_loop(): gas fingerprint %s',
+                             self.gas_fingerprint)
         return results
 
+    def get_curr(self, tag):
+        """Latest single measurement of TAG, in feed units."""
+        return self.to_feed[tag](getattr(self.bme.data, tag))
+
     def get_curr_temp(self):
-        """return temperature in deg-C"""
-        value = self.bme.data.temperature
-        temp = value * 9 / 5 + 32 # convert to F
-        return temp
+        """return temperature in deg-F"""
+        return self.get_curr('temperature')
 
     def get_curr_humidity(self):
         """return relative humidity in percent"""
-        value = self.bme.data.humidity
-        return value            # no conversion
+        return self.get_curr('humidity')
 
     def get_curr_barom(self):
         """return pressure in in-Hg"""
-        # 1 in-Hg = 3,386.388640341 Pa = 33.8638864 hPa
-        value = self.bme.data.pressure
-        return value/ 33.8638864 
+        return self.get_curr('pressure')
 
     def get_curr_voc(self):
         """return resistance in Ohms as a measure of Volatile Organic Compounds"""
-        value = self.bme.data.gas_resistance # in Ohms
-        return value                           # convert to AQI (someday)?
+        return self.get_curr('gas_resistance')  # convert to AQI (someday)?
 
     def get_last_temp(self):
-        """return temperature in deg-C"""
-        value = self.last_readings['temperature']
-        temp = value * 9 / 5 + 32 # convert to F
-        return temp
+        """return temperature in deg-F"""
+        return self.last_values['temperature']
 
     def get_last_humidity(self):
         """return relative humidity in percent"""
-        return  self.last_readings['humidity']
+        return self.last_values['humidity']
 
     def get_last_barom(self):
         """return pressure in in-Hg"""
-        # 1 in-Hg = 3,386.388640341 Pa = 33.8638864 hPa
-        value = self.last_readings['pressure']
-        return value/ 33.8638864
+        return self.last_values['pressure']
 
     def get_last_voc(self):
         """return resistance in Ohms as a measure of Volatile Organic Compounds"""
-        return  self.last_readings['gas_resistance']
+        return self.last_values['gas_resistance']
+
+
+class SensorSupervisor:
+    """Watch a BME_Probe and re-probe the real driver when it fails.
+
+    Runs as a task on the App's bgloop; the (blocking) re-probe itself is
+    done on an executor thread, with exponential backoff between tries.
+    ON_CHANGE is called as fn(healthy) whenever the health state flips.
+    """
+    CHECK_INTERVAL = 30
+    MIN_BACKOFF = 30
+    MAX_BACKOFF = 15 * 60
+
+    def __init__(self, probe, on_change=None):
+        self.logger = logging.getLogger(__name__)
+        self.probe = probe
+        self.on_change = on_change
+        self.healthy = None
+        self.backoff = self.MIN_BACKOFF
+        self.next_attempt = 0
+        self.reinits = 0
+
+    def check(self):
+        healthy = not self.probe.is_degraded()
+        if healthy != self.healthy:
+            self.healthy = healthy
+            if healthy:
+                self.logger.info('Indoor sensor healthy')
+            else:
+                self.logger.warning('Indoor sensor degraded')
+            if self.on_change:
+                self.on_change(healthy)
+
+    def retry_now(self):
+        """Re-probe at the next check, without waiting out the backoff."""
+        self.backoff = self.MIN_BACKOFF
+        self.next_attempt = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.check()
+            now = time.time()
+            if self.probe.needs_reinit() and now >= self.next_attempt:
+                ok = await loop.run_in_executor(None, self.probe.reinit)
+                if ok:
+                    self.reinits += 1
+                    self.backoff = self.MIN_BACKOFF
+                    self.check()
+                else:
+                    self.logger.info('BME680 re-probe failed, retry in %ds',
+                                     self.backoff)
+                    self.next_attempt = now + self.backoff
+                    self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+            await asyncio.sleep(self.CHECK_INTERVAL)
+
+
+class BME680Device(I2CDevice):
+    """An additional BME680 (e.g. at 0x76), polled by the BusScheduler.
+
+    Only reads temperature/humidity/pressure; the gas heater stays off so
+    it doesn't warm up the other sensors nearby.
+    """
+    NAME = 'bme680'
+    ADDR = 0x76
+    INTERVAL = 60
+    PREFIX = 'Aux'
+    to_f = staticmethod(units.get_converter('C', 'F'))
+    to_inhg = staticmethod(units.get_converter('hPa', 'inHg'))
+
+    def setup(self):
+        self.bme = bme680.BME680(i2c_addr=self.addr, i2c_device=self.bus)
+        self.bme.set_gas_status(bme680.DISABLE_GAS_MEAS)
+
+    def poll(self):
+        if not self.bme.get_sensor_data():
+            return []
+        data = self.bme.data
+        return [(f'{self.PREFIX}-Temp', self.to_f(data.temperature)),
+                (f'{self.PREFIX}-Humidity', data.humidity),
+                (f'{self.PREFIX}-Pressure', self.to_inhg(data.pressure))]
+
+
+DEVICE_TYPES['bme680'] = BME680Device
 
 
 def test():
@@ -310,6 +812,5 @@ def test():
 if __name__ == "__main__" :
     level = logging.INFO
     #level = logging.WARNING
-    logging.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s',
-                        level=level)
+    setup_logging(level=level)
     test()
@@ -0,0 +1,350 @@
+##
+## Indoor readings in shared memory - one sensor daemon, any number of readers
+##
+
+import os
+import sys
+import time
+import signal
+import struct
+import asyncio
+import logging
+import argparse
+from multiprocessing import shared_memory, resource_tracker
+
+import config
+from logsetup import setup_logging
+
+
+SHM_NAME = 'weatherclock-sensor'
+# the values kept, in feed units (see units.FIELDS)
+FIELDS = ('Indoor-Temp', 'Indoor-Humidity', 'Indoor-Pressure', 'Indoor-VOC')
+
+## Layout: header, latest record, then a ring of CAPACITY records.
+## header: magic, version, capacity, flags, seq, count, i2c_errors, pid
+HEADER = struct.Struct('<4sIIIQQII')
+MAGIC = b'WCSH'
+VERSION = 1
+# record: timestamp + FIELDS, as float64
+RECORD = struct.Struct('<d' + 'd' * len(FIELDS))
+SEQ_OFFSET = 16             # of the u64 seq in HEADER
+
+FLAG_DEGRADED = 0x1         # the daemon's probe says the values are suspect
+FLAG_DUMMY = 0x2            # ... or fake (no sensor found)
+FLAG_CLOSED = 0x4           # the daemon exited (a new one makes a new segment)
+
+
+def segment_size(capacity):
+    return HEADER.size + RECORD.size * (1 + capacity)
+
+
+class SensorShmWriter:
+    """The daemon's side: publish readings into the shared segment.
+
+    A seqlock guards the contents: seq is made odd before writing and
+    even again afterwards, so readers can copy without any locking and
+    just retry if seq was odd or moved meanwhile.  There is only ever
+    one writer (the daemon).
+    """
+    CAPACITY = 288              # ring of history, 24 hours at 5 minutes
+
+    def __init__(self, name=SHM_NAME, capacity=CAPACITY):
+        self.logger = logging.getLogger(__name__)
+        self.capacity = capacity
+        size = segment_size(capacity)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # left over from a daemon that didn't exit cleanly
+            self.logger.info('Replacing stale shared memory %s', name)
+            old = shared_memory.SharedMemory(name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.seq = 0
+        self.count = 0
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, capacity, 0,
+                         self.seq, self.count, 0, os.getpid())
+
+    def write(self, tstamp, values, flags=0, i2c_errors=0):
+        """Publish one reading; VALUES is {field: value}, in feed units."""
+        record = (tstamp,) + tuple(values.get(f, float('nan')) for f in FIELDS)
+        buf = self.buf
+        self.begin()
+        RECORD.pack_into(buf, HEADER.size, *record)
+        slot = self.count % self.capacity
+        RECORD.pack_into(buf, HEADER.size + RECORD.size * (1 + slot), *record)
+        self.count += 1
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, self.capacity, flags,
+                         self.seq, self.count, i2c_errors, os.getpid())
+        self.end()
+
+    def begin(self):
+        self.seq += 1           # odd: write in progress
+        struct.pack_into('<Q', self.buf, SEQ_OFFSET, self.seq)
+
+    def end(self):
+        # even again only once everything else is written, header included
+        self.seq += 1
+        struct.pack_into('<Q', self.buf, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        header = HEADER.unpack_from(self.buf, 0)
+        self.begin()
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, self.capacity,
+                         header[3] | FLAG_CLOSED, self.seq, self.count,
+                         header[6], os.getpid())
+        self.end()
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def attach(name):
+    """Open an existing segment without taking ownership of it (before
+    Python 3.13 the resource tracker would unlink it when we exit)."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class Snapshot:
+    """One consistent copy of the segment."""
+
+    def __init__(self, data):
+        (magic, version, self.capacity, self.flags, self.seq, self.count,
+         self.i2c_errors, self.pid) = HEADER.unpack_from(data, 0)
+        latest = RECORD.unpack_from(data, HEADER.size)
+        self.tstamp = latest[0]
+        self.values = dict(zip(FIELDS, latest[1:]))
+        self.data = data
+
+    def history(self):
+        """[(tstamp, {field: value}), ...], oldest first."""
+        records = []
+        kept = min(self.count, self.capacity)
+        for n in range(self.count - kept, self.count):
+            slot = n % self.capacity
+            record = RECORD.unpack_from(self.data,
+                                        HEADER.size + RECORD.size * (1 + slot))
+            records.append((record[0], dict(zip(FIELDS, record[1:]))))
+        return records
+
+
+class SensorShmReader:
+    """Read the daemon's segment - lock-free, and never touching I2C."""
+    MAX_TRIES = 100
+
+    def __init__(self, name=SHM_NAME):
+        self.name = name
+        self.shm = None
+
+    def open(self):
+        """Attach to the segment, if the daemon has created it yet."""
+        if self.shm is None:
+            try:
+                shm = attach(self.name)
+            except FileNotFoundError:
+                return False
+            if HEADER.unpack_from(shm.buf, 0)[:2] != (MAGIC, VERSION):
+                shm.close()
+                return False
+            self.shm = shm
+        return True
+
+    def read(self, history=False, reopen=True):
+        """A consistent Snapshot (with the ring too if HISTORY), or None."""
+        if not self.open():
+            return None
+        buf = self.shm.buf
+        capacity = HEADER.unpack_from(buf, 0)[2]
+        size = segment_size(capacity) if history else HEADER.size + RECORD.size
+        for _ in range(self.MAX_TRIES):
+            seq, = struct.unpack_from('<Q', buf, SEQ_OFFSET)
+            if seq & 1:
+                time.sleep(0.001)   # the writer is mid-update
+                continue
+            data = bytes(buf[:size])
+            if struct.unpack_from('<Q', buf, SEQ_OFFSET)[0] == seq:
+                snap = Snapshot(data)
+                if snap.flags & FLAG_CLOSED or not pid_alive(snap.pid):
+                    # a dead daemon's segment - look for its successor's
+                    self.close()
+                    if reopen:
+                        return self.read(history, reopen=False)
+                return snap
+        return None
+
+    def close(self):
+        if self.shm:
+            self.shm.close()
+            self.shm = None
+
+
+class SharedSensor:
+    """Stands in for a BME_Probe in the clock, reading the daemon's
+    segment instead of the bus (sensor.source = "shared").
+
+    Sampling settings and re-probing are the daemon's business, so
+    those parts of the probe interface do nothing here.
+    """
+    STALE_AGE = 20 * 60
+
+    def __init__(self, name=SHM_NAME):
+        self.logger = logging.getLogger(__name__)
+        self.reader = SensorShmReader(name)
+        self.addr = None
+        self.flags = FLAG_DUMMY
+        self.i2c_errors = 0
+        self.gas_fingerprint = {}
+        self.last_values = {field: 0 for field in FIELDS}
+        self.last_readings = self.last_values
+        self.last_update = 0
+        self.refresh()
+
+    def refresh(self):
+        snap = self.reader.read()
+        if snap is None:
+            return False
+        self.flags = snap.flags
+        self.i2c_errors = snap.i2c_errors
+        if snap.count and snap.tstamp != self.last_update:
+            self.last_values = snap.values
+            self.last_readings = snap.values
+            self.last_update = snap.tstamp
+        return True
+
+    async def read_loop(self):
+        """Pick up the daemon's latest reading (the same interface as
+        BME_Probe.read_loop, but nothing to wait for)."""
+        if not self.refresh():
+            self.logger.warning('No sensor daemon (shared memory %s)',
+                                self.reader.name)
+            return None
+        if not self.last_update:
+            return None         # the daemon hasn't got a reading yet
+        return self.last_values
+
+    def get_last_temp(self):
+        return self.last_values['Indoor-Temp']
+
+    def get_last_humidity(self):
+        return self.last_values['Indoor-Humidity']
+
+    def get_last_barom(self):
+        return self.last_values['Indoor-Pressure']
+
+    def get_last_voc(self):
+        return self.last_values['Indoor-VOC']
+
+    def is_dummy(self):
+        return bool(self.flags & FLAG_DUMMY)
+
+    def is_degraded(self):
+        if self.flags & (FLAG_DEGRADED | FLAG_DUMMY):
+            return True
+        return (not self.last_update or
+                time.time() - self.last_update > self.STALE_AGE)
+
+    def needs_reinit(self):
+        return False
+
+    def reinit(self):
+        return False
+
+    def set_address(self, addr):
+        self.logger.warning('sensor.address is set in the sensor daemon')
+
+
+async def run_daemon(probe, writer, interval):
+    """Read the probe every INTERVAL seconds, publishing to WRITER."""
+    import sensor       # (only the daemon needs the driver)
+    loop = asyncio.get_running_loop()
+    # systemd stops us with SIGTERM - unwind, so the segment is removed
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    supervisor = sensor.SensorSupervisor(probe)
+    loop.create_task(supervisor.run())
+    while True:
+        start = time.time()
+        await probe.read_loop()
+        flags = ((FLAG_DUMMY if probe.is_dummy() else 0) |
+                 (FLAG_DEGRADED if probe.is_degraded() else 0))
+        if probe.last_update:
+            writer.write(probe.last_update,
+                         {probe.FEEDS[tag][1]: value
+                          for tag, value in probe.last_values.items()},
+                         flags, probe.i2c_errors)
+        await asyncio.sleep(max(0, start + interval - time.time()))
+
+
+def daemon_main(args):
+    import sensor
+    import i2cbus
+    cfg = config.from_args(args)
+    setup_logging(level=cfg['log.level'], use_json=cfg['log.json'])
+    # the same bus as the in-process sensor (App.init_sensor) would use
+    bus = i2cbus.open_bus(cfg['sensor.bus_number'])
+    probe = sensor.BME_Probe(bus=bus, addr=cfg['sensor.address'],
+                             bus_number=cfg['sensor.bus_number'])
+    probe.NUM_PTS = cfg['sensor.num_points']
+    probe.INTVL = cfg['sensor.sample_interval']
+    probe.PAUSE_TIME = cfg['sensor.pause_time']
+    probe.HEATER_SEQUENCE = tuple(cfg['sensor.heater_sequence'])
+    writer = SensorShmWriter(args.name)
+    try:
+        asyncio.run(run_daemon(probe, writer, cfg['sensor.update_interval']))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+def dump_main(args):
+    reader = SensorShmReader(args.name)
+    snap = reader.read(history=args.history)
+    if snap is None:
+        print(f'no sensor daemon ({args.name})', file=sys.stderr)
+        sys.exit(1)
+    print(f'pid {snap.pid}, {snap.count} readings, flags {snap.flags:#x}, '
+          f'{snap.i2c_errors} I2C errors')
+    records = snap.history() if args.history else [(snap.tstamp, snap.values)]
+    for tstamp, values in records:
+        print(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(tstamp)),
+              '  '.join(f'{field}={value:.2f}' for field, value in values.items()))
+    reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sensor daemon, or show what it is publishing')
+    parser.add_argument('--name', default=SHM_NAME,
+                        help='shared memory name (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    daemon = commands.add_parser('daemon', help='own the BME680 and publish')
+    config.add_arguments(daemon)
+    show = commands.add_parser('show', help='print the latest reading')
+    show.add_argument('--history', action='store_true',
+                      help='... and the ring buffer')
+    args = parser.parse_args()
+    if args.command == 'daemon':
+        daemon_main(args)
+    else:
+        dump_main(args)
+
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,68 @@
+##
+## Startup staging helpers - timed stages and deferred imports
+##
+
+import time
+import logging
+import importlib
+import threading
+import contextlib
+
+
+class StartupProfile:
+    """Record how long each startup stage and deferred import takes.
+
+    Timing is always collected (it's only a few perf_counter() calls);
+    ENABLED just controls whether report() logs the full breakdown.
+    """
+
+    def __init__(self, t0=None, enabled=False):
+        self.logger = logging.getLogger(__name__)
+        if t0 is None:
+            t0 = time.perf_counter()
+        self.t0 = t0
+        self.enabled = enabled
+        self.stages = []        # (name, start offset, duration)
+        self.imports = []       # (module, duration, thread name)
+        self.marks = {}         # name -> offset from t0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stop = time.perf_counter()
+            with self.lock:
+                self.stages.append((name, start - self.t0, stop - start))
+
+    def mark(self, name):
+        """Note a milestone, e.g. 'first-frame'."""
+        self.marks[name] = time.perf_counter() - self.t0
+
+    def import_module(self, name):
+        """importlib.import_module() with the time taken recorded."""
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        duration = time.perf_counter() - start
+        with self.lock:
+            self.imports.append((name, duration,
+                                 threading.current_thread().name))
+        return module
+
+    def report(self):
+        if not self.enabled:
+            first = self.marks.get('first-frame')
+            if first is not None:
+                self.logger.info('Startup: first frame at %.3fs', first)
+            return
+        lines = ['Startup profile (seconds since process start):']
+        for name, offset, duration in self.stages:
+            lines.append(f'  stage  {name:<20} @{offset:7.3f}  {duration:7.3f}')
+        for name, duration, thread in self.imports:
+            lines.append(f'  import {name:<20}           {duration:7.3f}'
+                         f'  [{thread}]')
+        for name, offset in sorted(self.marks.items(), key=lambda m: m[1]):
+            lines.append(f'  mark   {name:<20} @{offset:7.3f}')
+        self.logger.info('\n'.join(lines))
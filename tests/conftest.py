@@ -0,0 +1,8 @@
+import sys
+import types
+
+# mqtt.py and publish.py read the site's secrets.py, which isn't part of
+# the repo - give them one with dummy credentials
+if not hasattr(sys.modules.get('secrets'), 'secrets'):
+    sys.modules['secrets'] = types.SimpleNamespace(secrets={
+        'AIO_USERNAME': 'tester', 'AIO_KEY': 'key'})
@@ -0,0 +1,94 @@
+import pytest
+
+import alerts
+
+
+def threshold(**kwargs):
+    spec = {'name': 'hot', 'type': 'above', 'field': 'Indoor-Temp',
+            'limit': 80, 'hysteresis': 2}
+    spec.update(kwargs)
+    return alerts.make_rule(spec)
+
+
+def make_engine(*rules):
+    engine = alerts.AlertEngine(list(rules))
+    events = []
+    engine.add_listener(lambda rule, active: events.append((rule.name, active)))
+    return engine, events
+
+
+def test_threshold_hysteresis():
+    engine, events = make_engine(threshold())
+    for value in (79, 81, 79, 78.5, 77.5):
+        engine.update('Indoor-Temp', value, 0)
+    # raised at 81, held until below limit - hysteresis
+    assert events == [('hot', True), ('hot', False)]
+    assert engine.version == 2
+
+
+def test_threshold_below_and_debounce():
+    rule = threshold(type='below', limit=55, debounce=2)
+    engine, events = make_engine(rule)
+    engine.update('Indoor-Temp', 54, 0)
+    assert not rule.active
+    engine.update('Indoor-Temp', 60, 0)    # resets the debounce count
+    engine.update('Indoor-Temp', 54, 0)
+    assert not rule.active
+    engine.update('Indoor-Temp', 54, 0)
+    assert rule.active
+    assert events == [('hot', True)]
+
+
+def test_rate_rule():
+    rule = alerts.make_rule({'name': 'falling', 'type': 'rate',
+                             'field': 'pressure', 'limit': -0.06,
+                             'window': 3 * 3600})
+    engine, events = make_engine(rule)
+    engine.update('pressure', 30.0, 0)
+    engine.update('pressure', 29.99, 3600)
+    assert not rule.active
+    engine.update('pressure', 29.8, 7200)
+    assert rule.rate == pytest.approx(-0.1)
+    assert events == [('falling', True)]
+
+
+def test_rate_rule_window():
+    rule = alerts.RateRule('rising', 'pressure', 0.5, window=3600)
+    for tstamp, value in ((0, 0), (1800, 1), (3600, 2), (5400, 2)):
+        rule.evaluate(value, tstamp)
+    # only the samples within the last hour count
+    assert rule.rate == pytest.approx(1.0)     # in-Hg/hr, from 1800 to 5400
+    assert rule.samples[0][0] == 1800
+
+
+def test_stale_rule():
+    rule = alerts.make_rule({'name': 'stale', 'type': 'stale',
+                             'field': 'alt-temp', 'max_age': 60})
+    engine, events = make_engine(rule)
+    assert rule.active          # no data yet
+    engine.update('alt-temp', 40, 1000)
+    engine.check_stale(1030)
+    engine.check_stale(1100)
+    assert events == [('stale', False), ('stale', True)]
+
+
+def test_get_level_picks_worst():
+    warn = threshold(name='warm', limit=75, level='warning')
+    err = threshold(name='hot', limit=85, level='error')
+    engine, _ = make_engine(warn, err)
+    engine.update('Indoor-Temp', 80, 0)
+    assert engine.get_level('Indoor-Temp') == 'warning'
+    engine.update('Indoor-Temp', 90, 0)
+    assert engine.get_level('Indoor-Temp', 'alt-temp') == 'error'
+    assert engine.get_level('alt-temp') is None
+    assert engine.get_active() == [warn, err]
+
+
+def test_default_rules_build():
+    engine = alerts.AlertEngine()
+    assert len(engine.rules) == len(alerts.DEFAULT_RULES)
+
+
+def test_unknown_rule_type():
+    with pytest.raises(ValueError):
+        alerts.make_rule({'name': 'x', 'type': 'sideways', 'field': 'x'})
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import calibration
+
+
+def test_poly():
+    correct = calibration.make_poly([2, 1])         # 2x + 1
+    assert correct([0, 1.5]) == [1.0, 4.0]
+
+
+def test_points_interpolate_and_extend():
+    correct = calibration.make_points([[30, 32], [10, 10], [20, 21]])
+    assert correct([10, 15, 25, 30]) == pytest.approx([10, 15.5, 26.5, 32])
+    # outside the points, the end segments carry on
+    assert correct([0, 40]) == pytest.approx([-1, 43])
+
+
+def test_single_point_is_offset():
+    correct = calibration.make_points([[20, 21.5]])
+    assert correct([0, 20]) == [1.5, 21.5]
+
+
+@pytest.mark.parametrize('spec', [
+    {'points': [[20, 21], [20, 22]]},       # duplicate raw value
+    {'points': []},
+    {'spline': [1, 2]},
+])
+def test_bad_specs(spec):
+    with pytest.raises(ValueError):
+        calibration.make_correction(spec)
+
+
+def test_profile_apply():
+    profile = calibration.Profile({'temp_offset': -2.0,
+                                   'fields': {'humidity': {'poly': [1, 5]}}})
+    assert profile.temp_offset == -2.0
+    assert profile.apply('humidity', [40.0]) == [45.0]
+    assert profile.apply('pressure', [1000.0]) == [1000.0]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return calibration.CalibrationStore(str(tmp_path / 'cal' / 'calibration.json'))
+
+
+def test_default_profile(store):
+    profile = store.get_profile('host/bme680@1:0x77')
+    assert profile.temp_offset == calibration.DEFAULT_PROFILE['temp_offset']
+
+
+def test_set_saves_and_reloads(store):
+    store.set('s', 'humidity', {'poly': [1, 2]})
+    store.set('s', temp_offset=-1.5)
+    fresh = calibration.CalibrationStore(store.path)
+    profile = fresh.get_profile('s')
+    assert profile.temp_offset == -1.5
+    assert profile.apply('humidity', [50.0]) == [52.0]
+    store.set('s', 'humidity', None)
+    fresh = calibration.CalibrationStore(store.path)
+    fresh.reload_if_changed()
+    assert fresh.data['s']['fields'] == {}
+
+
+def test_set_field_on_offset_only_entry(store, tmp_path):
+    path = tmp_path / 'cal' / 'calibration.json'
+    path.parent.mkdir()
+    path.write_text(json.dumps({'s': {'temp_offset': 1.0}}))
+    store.set('s', 'temperature', {'points': [[20, 21], [25, 26]]})
+    assert store.get_profile('s').apply('temperature', [22.0]) == [23.0]
+
+
+def test_set_rejects_bad_spec(store):
+    with pytest.raises(ValueError):
+        store.set('s', 'temperature', {'points': [[20, 21], [20, 22]]})
+
+
+def test_bad_file_uses_default(store, tmp_path):
+    path = tmp_path / 'cal' / 'calibration.json'
+    path.parent.mkdir()
+    path.write_text(json.dumps({'s': {'fields': {'humidity': {'poly': 'x'}}}}))
+    assert store.get_profile('s').temp_offset == -3.0
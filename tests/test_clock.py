@@ -0,0 +1,79 @@
+import os
+import types
+import asyncio
+from multiprocessing import shared_memory
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import clock
+import sensorshm
+from alerts import AlertEngine
+from metrics import Summary
+
+
+class Recorder:
+    """Stands in for the publishers, history and supervisor."""
+
+    def __init__(self):
+        self.published = []
+        self.recorded = []
+        self.checks = 0
+
+    def publish_indoor(self, values):
+        self.published.append(values)
+
+    def add_values(self, values):
+        self.recorded.append(values)
+
+    def check(self):
+        self.checks += 1
+
+
+@pytest.fixture
+def name(monkeypatch):
+    # the writer is in this process too, see test_sensorshm.py
+    monkeypatch.setattr(sensorshm, 'attach', shared_memory.SharedMemory)
+    return f'weatherclock-test-{os.getpid()}'
+
+
+def make_app(name):
+    app = clock.App.__new__(clock.App)
+    recorder = Recorder()
+    app.sensor = sensorshm.SharedSensor(name)
+    app.sensor_stats = Summary()
+    app.sensor_super = recorder
+    app.publishers = recorder
+    app.history = recorder
+    app.alerts = AlertEngine()
+    app.pages = types.SimpleNamespace(prefetch=lambda: None)
+    app.mqtt = types.SimpleNamespace(get_curr_values=lambda: {})
+    app.last_outdoor = 0
+    return app, recorder
+
+
+def test_no_sensor_daemon_publishes_nothing(name):
+    app, recorder = make_app(name)
+    for _ in range(2):              # (past the indoor-cold debounce)
+        asyncio.run(app.update())
+    assert recorder.published == []
+    assert recorder.recorded == []
+    assert not [rule for rule in app.alerts.get_active()
+                if rule.field.startswith('Indoor-')]
+    assert recorder.checks == 2     # the sensor health is still checked
+
+
+def test_sensor_daemon_reading_published(name):
+    writer = sensorshm.SensorShmWriter(name)
+    try:
+        writer.write(1000.0, {'Indoor-Temp': 70.0, 'Indoor-Humidity': 40.0,
+                              'Indoor-Pressure': 30.0, 'Indoor-VOC': 200_000})
+        app, recorder = make_app(name)
+        asyncio.run(app.update())
+    finally:
+        writer.close()
+    assert recorder.published == [[('Indoor-Temp', 70.0),
+                                    ('Indoor-Humidity', 40.0),
+                                    ('Indoor-Pressure', 30.0),
+                                    ('Indoor-VOC', 200_000)]]
+    assert recorder.recorded[0] == recorder.published[0]
@@ -0,0 +1,104 @@
+import datetime
+
+import pytest
+
+import config
+
+
+def make(text=None, overrides=(), environ=None, tmp_path=None):
+    path = None
+    if text is not None:
+        path = tmp_path / 'clock.toml'
+        path.write_text(text)
+        path = str(path)
+    return config.Config(path, overrides, environ=environ or {})
+
+
+def test_defaults():
+    cfg = make()
+    assert cfg['display.width'] == 1024
+    assert cfg['sensor.address'] == 0x77
+    assert cfg['history.path'] == config.HISTORY_FILE
+    assert cfg['mqtt.client_id'] is None
+
+
+def test_sources_in_order(tmp_path):
+    text = '[display]\nwidth = 800\nheight = 480\nunits = "metric"\n'
+    environ = {'CLOCK_DISPLAY_HEIGHT': '400', 'CLOCK_DISPLAY_UNITS': 'imperial'}
+    cfg = make(text, ['display.units=metric'], environ, tmp_path)
+    assert cfg['display.width'] == 800
+    assert cfg['display.height'] == 400
+    assert cfg['display.units'] == 'metric'
+    assert cfg.sources['display.units'] == 'command line'
+
+
+@pytest.mark.parametrize('override, name, value', [
+    ('sensor.address=0x76', 'sensor.address', 0x76),
+    ('clock.use_ampm=off', 'clock.use_ampm', False),
+    ('colors.background=#102030', 'colors.background', (16, 32, 48)),
+    ('sensor.heater_sequence=[200, 300]', 'sensor.heater_sequence', [200, 300]),
+    ('i2c.devices=[["bh1750", 0x23]]', 'i2c.devices', [('bh1750', 0x23)]),
+    ('power.schedule=[["23:00", "07:00", "blank"]]', 'power.schedule',
+     [(datetime.time(23), datetime.time(7), 'blank')]),
+    ('history.path=none', 'history.path', None),
+])
+def test_set_values(override, name, value):
+    assert make(overrides=[override])[name] == value
+
+
+def test_errors_all_reported(tmp_path):
+    text = '[display]\nwidth = "wide"\n[nosuch]\nkey = 1\n'
+    with pytest.raises(config.ConfigError) as e:
+        make(text, ['sensor.num_points=50', 'log.level'], tmp_path=tmp_path)
+    message = str(e.value)
+    assert 'display.width' in message
+    assert 'unknown setting nosuch.key' in message
+    assert 'sensor.num_points (from command line)' in message
+    assert '--set log.level' in message
+
+
+@pytest.mark.parametrize('devices', [
+    '[["bh1705", 0x23]]',           # unknown type
+    '[["bh1750", 0x80]]',           # address out of range
+    '[["bh1750"]]',
+])
+def test_bad_devices(devices):
+    with pytest.raises(config.ConfigError):
+        make(overrides=[f'i2c.devices={devices}'])
+
+
+def test_device_types_match_drivers():
+    i2cbus = pytest.importorskip('i2cbus')
+    pytest.importorskip('sensor')       # adds bme680
+    assert set(config.DEVICE_TYPES) == set(i2cbus.DEVICE_TYPES)
+
+
+def test_reload_and_changed(tmp_path):
+    path = tmp_path / 'clock.toml'
+    path.write_text('[render]\nidle_fps = 5\n')
+    cfg = config.Config(str(path), ['display.units=metric'], environ={})
+    path.write_text('[render]\nidle_fps = 10\n[power]\ndim_level = 0.5\n')
+    new = cfg.reload()
+    assert new['display.units'] == 'metric'
+    assert new.changed(cfg) == {'render.idle_fps', 'power.dim_level'}
+    assert cfg.groups(new.changed(cfg)) == {'render', 'power'}
+
+
+def test_bad_reload_keeps_old(tmp_path):
+    path = tmp_path / 'clock.toml'
+    path.write_text('[render]\nidle_fps = 5\n')
+    cfg = config.Config(str(path), environ={})
+    path.write_text('[render]\nidle_fps = 500\n')
+    with pytest.raises(config.ConfigError):
+        cfg.reload()
+    assert cfg['render.idle_fps'] == 5
+
+
+def test_to_toml_round_trip(tmp_path):
+    cfg = make(overrides=['i2c.devices=[["bme680", 0x76]]',
+                          'sensor.heater_sequence=[250, 350]',
+                          'power.inactivity_timeout=300'])
+    path = tmp_path / 'dump.toml'
+    path.write_text(cfg.to_toml())
+    again = config.Config(str(path), environ={})
+    assert again.changed(cfg) == set()
@@ -0,0 +1,155 @@
+import io
+import csv
+import json
+import math
+import time
+import types
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+import export
+import metrics
+from history import HistoryStore
+
+
+NOW = 1_700_000_000.0
+
+
+@pytest.mark.parametrize('text, seconds', [
+    ('90', 90), ('15m', 900), ('6h', 21600), ('2d', 172800), ('1w', 604800),
+    ('1.5h', 5400),
+])
+def test_parse_duration(text, seconds):
+    assert export.parse_duration(text) == seconds
+
+
+def test_parse_time():
+    assert export.parse_time('1700000000', NOW) == NOW
+    assert export.parse_time('7d', NOW) == NOW - 7 * 86400
+    assert export.parse_time('2023-11-14T22:13:20+00:00') == NOW
+    local = datetime.datetime(2024, 1, 2, 3, 4).timestamp()
+    assert export.parse_time('2024-01-02T03:04') == local
+
+
+@pytest.mark.parametrize('text', ['yesterday', '7x', ''])
+def test_parse_time_errors(text):
+    with pytest.raises(export.ExportError):
+        export.parse_time(text, NOW)
+
+
+def test_parse_query():
+    args = export.parse_query('format=jsonl&fields=Indoor-Temp,alt-temp'
+                              '&start=1d&step=1h', NOW)
+    assert args == {'fmt': 'jsonl', 'fields': ['Indoor-Temp', 'alt-temp'],
+                    'start': NOW - 86400, 'end': None, 'step': 3600}
+    with pytest.raises(export.ExportError):
+        export.parse_query('format=csv&limit=10')
+
+
+RECORDS = [(0, 'a', 1.0), (0, 'b', 10.0), (30, 'a', 3.0),
+           (3600, 'a', 5.0), (3660, 'b', 20.0)]
+
+
+def test_rows():
+    assert list(export.rows(RECORDS)) == [
+        (0, {'a': 1.0, 'b': 10.0}), (30, {'a': 3.0}),
+        (3600, {'a': 5.0}), (3660, {'b': 20.0})]
+
+
+def test_rows_step_averages():
+    assert list(export.rows(RECORDS, step=3600)) == [
+        (0, {'a': 2.0, 'b': 10.0}), (3600, {'a': 5.0, 'b': 20.0})]
+
+
+def test_columns_round_trip():
+    rows = [(float(t), {'a': t * 0.5} if t % 3 else {'a': t, 'b': -t})
+            for t in range(10)]
+    data = b''.join(export.to_columns(iter(rows), ['a', 'b'], chunk=4))
+    columns = export.read_columns(io.BytesIO(data))
+    assert list(columns) == ['timestamp', 'a', 'b']
+    assert columns['timestamp'].tolist() == [float(t) for t in range(10)]
+    assert columns['a'].tolist() == [values['a'] for _, values in rows]
+    b = columns['b'].tolist()
+    assert [t for t in range(10) if not math.isnan(b[t])] == [0, 3, 6, 9]
+
+
+def test_read_columns_rejects_other_data():
+    with pytest.raises(export.ExportError):
+        export.read_columns(io.BytesIO(b'timestamp,a\n'))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    store.add_values([('Indoor-Temp', 70.0), ('alt-temp', 40.0)], NOW)
+    store.add_values([('Indoor-Temp', 71.0)], NOW + 300)
+    store.add_values([('Indoor-Temp', 72.0), ('alt-temp', 41.0)], NOW + 600)
+    yield store
+    store.close()
+
+
+def test_export_csv(store):
+    ctype, chunks = export.export(store, 'csv', start=NOW + 1)
+    assert ctype.startswith('text/csv')
+    lines = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+    assert lines[0] == ['timestamp', 'time', 'Indoor-Temp', 'alt-temp']
+    assert [line[2:] for line in lines[1:]] == [['71.0', ''], ['72.0', '41.0']]
+
+
+def test_export_jsonl_fields(store):
+    _, chunks = export.export(store, 'jsonl', fields=['alt-temp'])
+    lines = b''.join(chunks).decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'timestamp': NOW, 'alt-temp': 40.0},
+        {'timestamp': NOW + 600, 'alt-temp': 41.0}]
+
+
+def test_export_errors(store):
+    with pytest.raises(export.ExportError):
+        export.export(store, 'xml')
+    with pytest.raises(export.ExportError):
+        export.export(store, fields=['nosuch'])
+    with pytest.raises(export.ExportError):
+        export.export(store, step=0)
+
+
+
+class Writer:
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def test_http_export_cancelled_mid_chunk(store, monkeypatch):
+    closed = threading.Event()
+
+    def slow_chunks():
+        try:
+            for _ in range(5):
+                time.sleep(0.2)
+                yield b'chunk\n'
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(export, 'export',
+                        lambda store, **kwargs: ('text/plain', slow_chunks()))
+    app = types.SimpleNamespace(history=types.SimpleNamespace(store=store))
+    server = metrics.MetricsServer(types.SimpleNamespace(app=app))
+
+    async def run():
+        task = asyncio.create_task(server.handle_export(Writer(), ''))
+        await asyncio.sleep(0.3)            # part way into the second chunk
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert closed.is_set()
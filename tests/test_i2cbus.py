@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import pytest
+
+i2cbus = pytest.importorskip('i2cbus')
+
+
+class Device(i2cbus.I2CDevice):
+    NAME = 'test'
+    ADDR = 0x40
+    INTERVAL = 10
+
+    def __init__(self, bus, addr=None, error=None):
+        super().__init__(bus, addr)
+        self.error = error
+        self.threads = []
+
+    def setup(self):
+        if self.error:
+            raise self.error
+
+    def poll(self):
+        self.threads.append(threading.current_thread())
+        return [('Test-Value', 1.0)]
+
+
+@pytest.mark.parametrize('error', [OSError(121, 'Remote I/O error'),
+                                   RuntimeError('BME680 Not Found')])
+def test_bad_device_skipped(error):
+    good = Device(None, 0x41)
+    scheduler = i2cbus.BusScheduler(None, [Device(None, error=error), good])
+    assert scheduler.devices == [good]
+
+
+def test_poll_off_the_loop():
+    device = Device(None)
+    readings = []
+    scheduler = i2cbus.BusScheduler(
+        None, [device], on_reading=lambda device, values: readings.append(values))
+
+    async def poll():
+        return await scheduler.poll_due()
+
+    wait = asyncio.run(poll())
+    assert readings == [[('Test-Value', 1.0)]]
+    assert device.values == {'Test-Value': 1.0}
+    assert device.threads[0] is not threading.main_thread()
+    assert 9 < wait <= 10
@@ -0,0 +1,48 @@
+import logging
+
+import logsetup
+
+
+def record(msg, *args, level=logging.WARNING, created=0.0, **extra):
+    rec = logging.LogRecord('test', level, __file__, 1, msg, args, None)
+    rec.created = created
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_repeats_suppressed_and_counted():
+    limit = logsetup.RateLimitFilter(interval=60)
+    assert limit.filter(record('Task %s failed', 'a'))
+    assert not limit.filter(record('Task %s failed', 'a', created=10))
+    assert not limit.filter(record('Task %s failed', 'a', created=20))
+    rec = record('Task %s failed', 'a', created=61)
+    assert limit.filter(rec)
+    assert rec.suppressed == 2
+    assert rec.getMessage() == 'Task a failed (suppressed 2 similar)'
+
+
+def test_different_args_are_different_messages():
+    limit = logsetup.RateLimitFilter()
+    assert limit.filter(record('Alert %s: %s (%s)', 'raised', 'hot', 'warning'))
+    assert limit.filter(record('Alert %s: %s (%s)', 'raised', 'cold', 'warning'))
+
+
+def test_explicit_key():
+    limit = logsetup.RateLimitFilter()
+    assert limit.filter(record('read failed: %s', 'EIO', key='i2c'))
+    assert not limit.filter(record('read failed: %s', 'ETIMEDOUT', key='i2c'))
+
+
+def test_info_not_limited():
+    limit = logsetup.RateLimitFilter()
+    for _ in range(3):
+        assert limit.filter(record('tick', level=logging.INFO))
+
+
+def test_expired_keys_dropped():
+    limit = logsetup.RateLimitFilter(interval=60)
+    limit.MAX_KEYS = 3
+    for n in range(3):
+        limit.filter(record('message %d', n))
+    limit.filter(record('message %d', 3, created=100))
+    assert len(limit.seen) == 1
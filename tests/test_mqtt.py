@@ -0,0 +1,56 @@
+import json
+import time
+import types
+import logging
+
+import mqtt
+
+
+def make_listener(connected_at=0):
+    listener = mqtt.MQTT_Listener.__new__(mqtt.MQTT_Listener)
+    listener.logger = logging.getLogger(__name__)
+    listener.values = {}
+    listener.on_update = None
+    listener.msgs_in = listener.msgs_dup = 0
+    listener.recent = {}
+    listener.connected_at = connected_at
+    return listener
+
+
+def message(feeds, **fields):
+    payload = json.dumps(dict(feeds=feeds, **fields)).encode()
+    return types.SimpleNamespace(topic='tester/groups/Porch/json',
+                                 payload=payload, retain=False)
+
+
+def test_replay_with_same_stamp_dropped():
+    listener = make_listener()
+    msg = message({'temp': '60.5'}, created_at='2026-10-19T08:00:00Z')
+    listener.on_message(None, None, msg)
+    listener.on_message(None, None, msg)
+    assert listener.msgs_dup == 1
+
+
+def test_same_reading_new_stamp_refreshes(monkeypatch):
+    listener = make_listener()
+    now = time.time()
+    monkeypatch.setattr(mqtt.time, 'time', lambda: now)
+    listener.on_message(None, None, message({'temp': '60.5'}, timestamp=1000))
+    now += 60
+    listener.on_message(None, None, message({'temp': '60.5'}, timestamp=1060))
+    assert listener.msgs_dup == 0
+    assert listener.values == {'temp': 60.5, 'timestamp': now}
+
+
+def test_unstamped_repeat_only_dropped_after_connect(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(mqtt.time, 'time', lambda: now)
+    listener = make_listener(connected_at=now)
+    msg = message({'temp': '60.5'})
+    listener.on_message(None, None, msg)
+    listener.on_message(None, None, msg)        # e.g. queued, and from /get
+    assert listener.msgs_dup == 1
+    now += mqtt.MQTT_Listener.REPLAY_WINDOW
+    listener.on_message(None, None, msg)        # the probe's next publish
+    assert listener.msgs_dup == 1
+    assert listener.values['timestamp'] == now
@@ -0,0 +1,45 @@
+import types
+import logging
+
+import publish
+
+
+class Listener:
+    """Stands in for the MQTT_Listener an AdafruitPublisher sends through."""
+
+    def __init__(self):
+        self.sent = []
+
+    def publish_indoor(self, values):
+        self.sent.extend(values)
+
+    def publish_alert(self, name, level, message, active):
+        self.sent.append(name)
+
+
+def make_ha():
+    ha = publish.HomeAssistantPublisher.__new__(publish.HomeAssistantPublisher)
+    ha.logger = logging.getLogger(__name__)
+    ha.msgs_out = 0
+    ha.alert_topic = 'weatherclock/test/alerts'
+    ha.alerts = {}
+    ha.client = types.SimpleNamespace(
+        publish=lambda *args, **kw: types.SimpleNamespace(rc=0))
+    return ha
+
+
+def test_adafruit_counts_each_feed():
+    listener = Listener()
+    adafruit = publish.AdafruitPublisher(lambda: listener)
+    adafruit.publish_indoor([('Indoor-Temp', 70.0), ('Indoor-Humidity', 40.0)])
+    adafruit.publish_alert('Indoor-Temp', 'warn', 'hot', True)
+    assert adafruit.msgs_out == len(listener.sent) == 3
+
+
+def test_sent_counts_by_publisher():
+    adafruit = publish.AdafruitPublisher(Listener)
+    ha = make_ha()
+    publishers = publish.Publishers([adafruit, ha])
+    publishers.publish_alert('Indoor-Temp', 'warn', 'hot', True)
+    ha.publish('weatherclock/test/availability', 'online')
+    assert publishers.sent_counts() == {'adafruit': 1, 'homeassistant': 2}
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+sensor = pytest.importorskip('sensor')
+from calibration import CalibrationStore
+
+
+class DummyProbe(sensor.BME_Probe):
+    """A probe that never touches the bus."""
+
+    def open_driver(self):
+        return None
+
+
+@pytest.fixture
+def probe(tmp_path):
+    probe = DummyProbe(calibration=CalibrationStore(str(tmp_path / 'cal.json')))
+    probe.INTVL = 0
+    return probe
+
+
+def test_fit_heater_durations():
+    assert sensor.fit_heater_durations([300], 500, 35) == [500]
+    assert sensor.fit_heater_durations([200, 300], 500, 35) == [232, 232]
+    # only as many steps as fit at the minimum duration
+    durations = sensor.fit_heater_durations(list(range(200, 400, 20)), 300, 35)
+    assert len(durations) == 5
+    assert sum(durations) + 35 * (len(durations) - 1) <= 300
+    assert sensor.fit_heater_durations([200], 10, 35) == []
+
+
+def test_single_profile(probe):
+    probe.setup_heater()
+    assert probe.heater_profiles == {1: (probe.HEATER_TEMP, probe.HEATER_TIME)}
+
+
+def test_sequence_keeps_feed_step(probe):
+    probe.HEATER_SEQUENCE = tuple(range(200, 400, 20))
+    probe.setup_heater()
+    profiles = probe.heater_profiles
+    assert profiles[0] == (probe.HEATER_TEMP, probe.HEATER_TIME)
+    steps = list(profiles.values())[1:]
+    assert [temp for temp, _ in steps] == [200, 220, 240, 260, 280]
+    assert all(duration >= probe.SEQUENCE_MIN_TIME for _, duration in steps)
+    # a pass through the sequence takes no longer than one feed measurement
+    meas = probe.MEAS_TIME * 1000
+    assert sum(duration + meas for _, duration in steps) <= probe.HEATER_TIME + meas
+
+
+def test_burst_sequence_and_fingerprint(probe):
+    probe.HEATER_SEQUENCE = (250, 350)
+    count = probe.burst_sequence(4)
+    assert count == 4
+    assert probe.sequence_slots() == [1, 2]
+    assert all(value > 0 for value in probe.gas_vectors[:count * 2])
+    fingerprint = probe.get_fingerprint(count, 2)
+    assert sorted(fingerprint) == [250, 350]
+    assert probe.gas_profile == 0           # back on the feed's profile
+
+
+def heater_time(probe, monkeypatch):
+    """Run a read_loop(), returning the heater durations measured with."""
+    measured = []
+
+    def record(heat_time=0):
+        measured.append(heat_time)
+        return sensor.BME_Probe.measure(probe, heat_time)
+
+    monkeypatch.setattr(probe, 'measure', record)
+    probe.PAUSE_TIME = 0
+    asyncio.run(probe.read_loop())
+    return measured
+
+
+def test_sequence_keeps_cycle_length(probe, monkeypatch):
+    single = heater_time(probe, monkeypatch)
+    probe.HEATER_SEQUENCE = (200, 250, 300, 350, 400)
+    sequence = heater_time(probe, monkeypatch)
+    meas = probe.MEAS_TIME * 1000
+    assert (sum(heat + meas for heat in sequence) <=
+            sum(heat + meas for heat in single))
+    # the feed still gets full-length measurements, all but one of them
+    assert sequence.count(probe.HEATER_TIME) == single.count(probe.HEATER_TIME) - 1
+    assert probe.gas_fingerprint
+
+
+def test_burst_samples(probe):
+    count = probe.burst(3, do_voc=False)
+    assert count == 3
+    assert len(probe.get_samples(count, 'temperature')) == 3
@@ -0,0 +1,107 @@
+import os
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import pytest
+
+import sensorshm
+
+
+@pytest.fixture(autouse=True)
+def same_process_attach(monkeypatch):
+    # attach() unregisters the segment from this process's resource
+    # tracker (it belongs to the daemon) - here the writer is in the same
+    # process, and its registration has to stay
+    monkeypatch.setattr(sensorshm, 'attach', shared_memory.SharedMemory)
+
+
+@pytest.fixture
+def name():
+    return f'weatherclock-test-{os.getpid()}'
+
+
+@pytest.fixture
+def writer(name):
+    writer = sensorshm.SensorShmWriter(name, capacity=4)
+    yield writer
+    if writer.buf is not None:
+        writer.close()
+
+
+def values(n):
+    return {field: n + i for i, field in enumerate(sensorshm.FIELDS)}
+
+
+def test_no_daemon(name):
+    assert sensorshm.SensorShmReader(name).read() is None
+
+
+def test_latest_and_history(name, writer):
+    for n in range(6):
+        writer.write(1000.0 + n, values(n), flags=sensorshm.FLAG_DEGRADED,
+                     i2c_errors=2)
+    reader = sensorshm.SensorShmReader(name)
+    snap = reader.read(history=True)
+    assert snap.tstamp == 1005.0
+    assert snap.values == values(5)
+    assert (snap.count, snap.flags, snap.i2c_errors) == (6, sensorshm.FLAG_DEGRADED, 2)
+    # the ring keeps the last CAPACITY, oldest first
+    assert [tstamp for tstamp, _ in snap.history()] == [1002.0, 1003.0, 1004.0, 1005.0]
+    reader.close()
+
+
+def test_missing_fields_are_nan(name, writer):
+    writer.write(1.0, {'Indoor-Temp': 70.0})
+    snap = sensorshm.SensorShmReader(name).read()
+    assert snap.values['Indoor-Temp'] == 70.0
+    assert snap.values['Indoor-VOC'] != snap.values['Indoor-VOC']
+
+
+def test_write_in_progress(name, writer):
+    writer.write(1.0, values(1))
+    struct.pack_into('<Q', writer.buf, sensorshm.SEQ_OFFSET, writer.seq + 1)
+    reader = sensorshm.SensorShmReader(name)
+    reader.MAX_TRIES = 3
+    assert reader.read() is None        # gave up, rather than a torn copy
+    reader.close()
+
+
+def test_closed_segment(name, writer):
+    writer.write(1.0, values(1), i2c_errors=3)
+    reader = sensorshm.SensorShmReader(name)
+    assert reader.read() is not None
+    buf = reader.shm.buf
+    seq = writer.seq
+    writer.close()
+    header = sensorshm.HEADER.unpack_from(buf, 0)
+    # marking it closed is a seqlock write too, and keeps the counters
+    assert header[4] == seq + 2
+    assert header[3] & sensorshm.FLAG_CLOSED
+    assert header[6] == 3
+    assert reader.read() is None
+
+
+def test_consistent_under_writes(name, writer):
+    stop = threading.Event()
+
+    def write():
+        n = 0
+        while not stop.is_set():
+            n += 1
+            writer.write(float(n), {field: float(n) for field in sensorshm.FIELDS})
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    reader = sensorshm.SensorShmReader(name)
+    try:
+        for _ in range(2000):
+            snap = reader.read()
+            if snap is not None:
+                assert set(snap.values.values()) == {snap.tstamp}
+                # the header goes with the record (the Nth write is at N)
+                assert snap.count == snap.tstamp
+    finally:
+        stop.set()
+        thread.join()
+        reader.close()
@@ -0,0 +1,83 @@
+import os
+import random
+
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame as pg
+
+import touch
+
+
+def brute_force(widgets, pos):
+    hit = None
+    for name, rect in widgets:
+        if rect.collidepoint(pos):
+            hit = (name, rect)
+    return hit
+
+
+def test_hit_index_layout():
+    widgets = [('page', pg.Rect(0, 0, 1024, 600)),
+               ('temp', pg.Rect(50, 120, 400, 140)),
+               ('alert', pg.Rect(300, 200, 300, 100))]
+    index = touch.HitIndex(widgets)
+    assert index.find((10, 10))[0] == 'page'
+    assert index.find((100, 150))[0] == 'temp'
+    assert index.find((350, 220))[0] == 'alert'     # on top of temp
+    assert index.find((1024, 10)) is None           # right edge is outside
+    assert index.find((-1, 10)) is None
+
+
+def test_hit_index_matches_brute_force():
+    rng = random.Random(1)
+    widgets = []
+    for n in range(20):
+        x, y = rng.randrange(0, 900), rng.randrange(0, 500)
+        widgets.append((n, pg.Rect(x, y, rng.randrange(1, 200),
+                                   rng.randrange(1, 200))))
+    index = touch.HitIndex(widgets)
+    for _ in range(2000):
+        pos = (rng.randrange(-10, 1110), rng.randrange(-10, 710))
+        assert index.find(pos) == brute_force(widgets, pos), pos
+
+
+@pytest.fixture
+def gestures():
+    pg.display.init()
+    found = []
+    recognizer = touch.GestureRecognizer(on_gesture=found.append)
+    yield recognizer, found
+    pg.display.quit()
+
+
+def press(recognizer, down, up):
+    recognizer.handle(pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=down))
+    recognizer.handle(pg.event.Event(pg.MOUSEBUTTONUP, button=1, pos=up))
+
+
+def test_tap(gestures):
+    recognizer, found = gestures
+    press(recognizer, (100, 100), (105, 95))
+    assert [(g.kind, g.pos) for g in found] == [('tap', (100, 100))]
+
+
+@pytest.mark.parametrize('end, direction', [
+    ((0, 110), 'left'), ((300, 90), 'right'), ((90, 0), 'up'), ((110, 300), 'down'),
+])
+def test_swipes(gestures, end, direction):
+    recognizer, found = gestures
+    press(recognizer, (150, 150), end)
+    assert [(g.kind, g.direction) for g in found] == [('swipe', direction)]
+
+
+def test_drag_is_neither(gestures):
+    recognizer, found = gestures
+    press(recognizer, (100, 100), (150, 100))      # past the slop, short of a swipe
+    assert found == []
+
+
+def test_other_events(gestures):
+    recognizer, _ = gestures
+    assert recognizer.handle(pg.event.Event(pg.MOUSEBUTTONUP, button=3, pos=(0, 0)))
+    assert not recognizer.handle(pg.event.Event(pg.KEYDOWN, key=pg.K_a))
@@ -0,0 +1,50 @@
+import pytest
+
+import units
+
+
+@pytest.mark.parametrize('src, dst, value, expected', [
+    ('C', 'F', 100, 212),
+    ('F', 'C', 32, 0),
+    ('K', 'C', 273.15, 0),
+    ('K', 'F', 373.15, 212),
+    ('hPa', 'inHg', 1013.25, 29.92),
+    ('ohm', 'kohm', 120_000, 120),
+    ('F', 'F', 70, 70),
+])
+def test_converters(src, dst, value, expected):
+    assert units.get_converter(src, dst)(value) == pytest.approx(expected, abs=0.01)
+
+
+def test_round_trip():
+    to_hpa = units.get_converter('inHg', 'hPa')
+    to_inhg = units.get_converter('hPa', 'inHg')
+    assert to_inhg(to_hpa(29.5)) == pytest.approx(29.5)
+
+
+def test_unknown_conversion():
+    with pytest.raises(ValueError):
+        units.get_converter('F', 'inHg')
+
+
+def test_imperial_formats_feed_units_as_is():
+    system = units.UnitSystem('imperial')
+    assert system.format('Indoor-Temp', 71.6) == '72°'
+    assert system.format('Indoor-Temp', 71.6, 'long') == '71.6°'
+    assert system.format('pressure', 29.92) == '29.9 in'
+    assert system.format('Indoor-VOC', 123_456) == '123 kΩ'
+
+
+def test_metric_converts_from_feed_units():
+    system = units.UnitSystem('metric')
+    assert system.convert('alt-temp', 212) == pytest.approx(100)
+    assert system.format('alt-temp', 50, 'long') == '10.0°'
+    assert system.format('Indoor-Pressure', 29.92) == '1013 hPa'
+    assert system.format('Indoor-Humidity', 45.2) == '45 %'
+    # by quantity, for values already in the display units
+    assert system.formatter('temp')(21.4) == '21°'
+
+
+def test_unknown_system():
+    with pytest.raises(ValueError):
+        units.UnitSystem('nautical')
@@ -0,0 +1,135 @@
+##
+## Touchscreen input - widget hit-testing and tap/long-press/swipe gestures
+##
+
+import time
+import bisect
+import logging
+
+import pygame as pg
+
+
+class HitIndex:
+    """Find the widget under a point with two binary searches.
+
+    The screen is cut into vertical slabs at every widget's left and right
+    edges, and each slab into bands at the top/bottom edges of the widgets
+    crossing it.  Each band remembers the topmost (last listed) widget.
+    Building it is O(n^2), but that only happens when the layout changes.
+    """
+
+    def __init__(self, widgets):
+        """WIDGETS is a list of (name, Rect), bottom to top."""
+        self.xs = sorted({x for _, rect in widgets
+                          for x in (rect.left, rect.right)})
+        self.slabs = []
+        for x0, x1 in zip(self.xs, self.xs[1:]):
+            inside = [(name, rect) for name, rect in widgets
+                      if rect.left <= x0 and rect.right >= x1]
+            ys = sorted({y for _, rect in inside
+                         for y in (rect.top, rect.bottom)})
+            bands = []
+            for y0, y1 in zip(ys, ys[1:]):
+                hit = None
+                for name, rect in inside:
+                    if rect.top <= y0 and rect.bottom >= y1:
+                        hit = (name, rect)
+                bands.append(hit)
+            self.slabs.append((ys, bands))
+
+    def find(self, pos):
+        """Return (name, rect) of the widget at POS, or None."""
+        x, y = pos
+        i = bisect.bisect_right(self.xs, x) - 1
+        if not 0 <= i < len(self.slabs):
+            return None
+        ys, bands = self.slabs[i]
+        j = bisect.bisect_right(ys, y) - 1
+        if not 0 <= j < len(bands):
+            return None
+        return bands[j]
+
+
+class Gesture:
+    TAP = 'tap'
+    LONG_PRESS = 'long-press'
+    SWIPE = 'swipe'
+
+    def __init__(self, kind, pos, direction=None):
+        self.kind = kind
+        self.pos = pos
+        self.direction = direction      # swipes: 'left', 'right', 'up', 'down'
+
+    def __repr__(self):
+        return f'Gesture({self.kind}, {self.pos}, {self.direction})'
+
+
+class GestureRecognizer:
+    """Turn mouse button events into taps, long-presses and swipes.
+
+    SDL turns touches into mouse events too, so only those are handled;
+    motion events are blocked (a swipe only needs the two end points), so
+    a finger dragging across the panel doesn't spin the main loop.  A
+    long-press fires from a one-shot timer event while still held.
+    """
+    LONG_PRESS_TIME = 0.8       # seconds
+    SWIPE_DISTANCE = 80         # pixels
+    TAP_SLOP = 20               # movement still counted as a tap/long-press
+    LONG_PRESS_EVENT = pg.event.custom_type()
+
+    def __init__(self, on_press=None, on_release=None, on_gesture=None):
+        self.logger = logging.getLogger(__name__)
+        self.on_press = on_press            # fn(pos)
+        self.on_release = on_release        # fn()
+        self.on_gesture = on_gesture        # fn(Gesture)
+        self.down_pos = None
+        self.down_time = 0
+        self.long_pressed = False
+        pg.event.set_blocked([pg.MOUSEMOTION, pg.FINGERMOTION])
+
+    def handle(self, event):
+        """Process EVENT, returns True if it was an input event."""
+        if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
+            self.down_pos = event.pos
+            self.down_time = time.time()
+            self.long_pressed = False
+            pg.time.set_timer(self.LONG_PRESS_EVENT,
+                              int(self.LONG_PRESS_TIME * 1000), loops=1)
+            if self.on_press:
+                self.on_press(event.pos)
+        elif event.type == self.LONG_PRESS_EVENT:
+            if self.down_pos and self.near(pg.mouse.get_pos(), self.down_pos):
+                self.long_pressed = True
+                self.emit(Gesture(Gesture.LONG_PRESS, self.down_pos))
+        elif event.type == pg.MOUSEBUTTONUP and event.button == 1:
+            pg.time.set_timer(self.LONG_PRESS_EVENT, 0)
+            if self.down_pos is None:
+                return True
+            start, self.down_pos = self.down_pos, None
+            if self.on_release:
+                self.on_release()
+            dx = event.pos[0] - start[0]
+            dy = event.pos[1] - start[1]
+            if max(abs(dx), abs(dy)) >= self.SWIPE_DISTANCE:
+                if abs(dx) > abs(dy):
+                    direction = 'left' if dx < 0 else 'right'
+                else:
+                    direction = 'up' if dy < 0 else 'down'
+                self.emit(Gesture(Gesture.SWIPE, start, direction))
+            elif not self.long_pressed and self.near(event.pos, start):
+                self.emit(Gesture(Gesture.TAP, start))
+        elif event.type in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP,
+                            pg.FINGERDOWN, pg.FINGERUP):
+            pass        # other buttons, and raw touches (seen as mouse too)
+        else:
+            return False
+        return True
+
+    def near(self, pos, start):
+        return (abs(pos[0] - start[0]) <= self.TAP_SLOP and
+                abs(pos[1] - start[1]) <= self.TAP_SLOP)
+
+    def emit(self, gesture):
+        self.logger.debug('Gesture: %s', gesture)
+        if self.on_gesture:
+            self.on_gesture(gesture)
@@ -0,0 +1,117 @@
+##
+## Unit conversion and value formatting, set up once at config time
+##
+
+# Conversions between the units we deal with.  All of them are simple
+# linear functions, so get_converter() can hand out a closure per pair.
+HPA_PER_INHG = 33.8638864       # 1 in-Hg = 3,386.388640341 Pa
+
+CONVERSIONS = {
+    ('C', 'F'): lambda v: v * 9 / 5 + 32,
+    ('F', 'C'): lambda v: (v - 32) * 5 / 9,
+    ('K', 'C'): lambda v: v - 273.15,
+    ('K', 'F'): lambda v: (v - 273.15) * 9 / 5 + 32,
+    ('hPa', 'inHg'): lambda v: v / HPA_PER_INHG,
+    ('inHg', 'hPa'): lambda v: v * HPA_PER_INHG,
+    ('ohm', 'kohm'): lambda v: v / 1000,
+}
+
+
+def identity(value):
+    return value
+
+
+def get_converter(src, dst):
+    """Return a fn(value) converting SRC units to DST units."""
+    if src == dst:
+        return identity
+    try:
+        return CONVERSIONS[(src, dst)]
+    except KeyError:
+        raise ValueError(f'No conversion from {src} to {dst}')
+
+
+# What each field measures, and the units it is stored/published in.
+# Indoor values are published to the Adafruit feeds (and the outdoor probe
+# sends its values) in imperial units, so that's what the rest of the app
+# (history, alerts, MQTT) works in; only the display converts.
+FIELDS = {
+    'Indoor-Temp': ('temp', 'F'),
+    'Indoor-Humidity': ('humidity', '%'),
+    'Indoor-Pressure': ('pressure', 'inHg'),
+    'Indoor-VOC': ('resistance', 'ohm'),
+    'Indoor-Light': ('light', 'lux'),
+    'Aux-Temp': ('temp', 'F'),
+    'Aux-Humidity': ('humidity', '%'),
+    'Aux-Pressure': ('pressure', 'inHg'),
+    'alt-temp': ('temp', 'F'),
+    'alt-humidity': ('humidity', '%'),
+    'pressure': ('pressure', 'inHg'),
+    'battery-charge': ('percent', '%'),
+}
+
+# display unit, suffix, decimals for the 'short' and 'long' styles
+DISPLAY = {
+    'imperial': {
+        'temp': ('F', '°', 0, 1),
+        'pressure': ('inHg', ' in', 1, 2),
+    },
+    'metric': {
+        'temp': ('C', '°', 0, 1),
+        'pressure': ('hPa', ' hPa', 0, 1),
+    },
+    'common': {
+        'humidity': ('%', ' %', 0, 1),
+        'resistance': ('kohm', ' kΩ', 0, 1),
+        'light': ('lux', ' lx', 0, 0),
+        'percent': ('%', ' %', 0, 0),
+    },
+}
+STYLES = ('short', 'long')
+
+
+def make_formatter(convert, suffix, decimals):
+    fmt = f'{{:.{decimals}f}}{suffix}'
+
+    def format_value(value):
+        return fmt.format(convert(value))
+    return format_value
+
+
+class UnitSystem:
+    """Converters and formatters for every field, for one unit system.
+
+    Everything is worked out once here; after that converting or
+    formatting a value is a dict lookup plus one closure call.
+    """
+    SYSTEMS = ('imperial', 'metric')
+
+    def __init__(self, system='imperial'):
+        if system not in self.SYSTEMS:
+            raise ValueError(f'Unknown unit system: {system}')
+        self.system = system
+        display = dict(DISPLAY['common'])
+        display.update(DISPLAY[system])
+        self.converters = {}
+        self.formatters = {}
+        for field, (quantity, units) in FIELDS.items():
+            self.add_field(field, quantity, units, display[quantity])
+        # also handy for things that aren't named feeds
+        for quantity, spec in display.items():
+            self.add_field(quantity, quantity, spec[0], spec)
+
+    def add_field(self, field, quantity, units, spec):
+        dst, suffix, short, long = spec
+        convert = get_converter(units, dst)
+        self.converters[field] = convert
+        self.formatters[(field, 'short')] = make_formatter(convert, suffix, short)
+        self.formatters[(field, 'long')] = make_formatter(convert, suffix, long)
+
+    def convert(self, field, value):
+        return self.converters[field](value)
+
+    def format(self, field, value, style='short'):
+        return self.formatters[(field, style)](value)
+
+    def formatter(self, field, style='short'):
+        return self.formatters[(field, style)]
@@ -0,0 +1,201 @@
+##
+## Background task supervision, and the systemd watchdog
+##
+
+import os
+import math
+import time
+import socket
+import asyncio
+import logging
+
+
+def sd_notify(state):
+    """Send STATE (e.g. 'READY=1') to systemd, if it gave us a socket
+    for that (Type=notify); returns True if it was sent."""
+    addr = os.environ.get('NOTIFY_SOCKET')
+    if not addr:
+        return False
+    if addr[0] == '@':
+        addr = '\0' + addr[1:]          # abstract namespace
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(addr)
+            sock.sendall(state.encode('utf-8'))
+    except OSError as e:
+        logging.getLogger(__name__).warning('sd_notify(%s) failed: %s',
+                                            state, e)
+        return False
+    return True
+
+
+class TaskState:
+    """What the supervisor knows about one named task."""
+
+    def __init__(self, name, factory, restart, timeout):
+        self.name = name
+        self.factory = factory
+        self.restart = restart
+        self.timeout = timeout
+        self.task = None
+        self.state = 'idle'     # running, done, failed, waiting, cancelled
+        self.started = None     # start of the oldest run not finished yet
+        self.runs = 0
+        self.failures = 0
+        self.restarts = 0
+        self.overlaps = 0
+        self.last_error = None
+        self.backoff = TaskSupervisor.MIN_BACKOFF
+        self.retry = None       # TimerHandle of a pending restart
+
+
+class TaskSupervisor:
+    """Run the App's background tasks by name, so that none of them fails
+    unnoticed or piles up.
+
+    A task still running when it's started again is cancelled, and the
+    new run waits for it to unwind (so two sensor read loops never share
+    the bus).  Exceptions are logged; tasks started with RESTART are run
+    again after a backoff, doubling from MIN_BACKOFF to MAX_BACKOFF (and
+    reset by a success, or by running for MAX_BACKOFF before failing).
+    A run taking longer than its TIMEOUT is reported by stalled().
+    """
+    MIN_BACKOFF = 5
+    MAX_BACKOFF = 5 * 60
+
+    def __init__(self, loop):
+        self.logger = logging.getLogger(__name__)
+        self.loop = loop
+        self.tasks = {}         # name -> TaskState
+
+    def run(self, name, factory, restart=False, timeout=None):
+        """Start FACTORY() (a coroutine function) as task NAME."""
+        state = self.tasks.get(name)
+        if state is None:
+            state = TaskState(name, factory, restart, timeout)
+            self.tasks[name] = state
+        else:
+            state.factory = factory
+            state.restart = restart
+            state.timeout = timeout
+        if state.retry:
+            state.retry.cancel()
+            state.retry = None
+        previous = state.task
+        if previous and not previous.done():
+            state.overlaps += 1
+            self.logger.warning('Task %s still running after %.0fs - '
+                                'cancelling it', name,
+                                time.time() - state.started)
+            previous.cancel()
+        else:
+            previous = None
+            state.started = time.time()
+        state.state = 'running'
+        state.runs += 1
+        state.task = self.loop.create_task(self.supervise(state, previous),
+                                           name=name)
+        return state.task
+
+    async def supervise(self, state, previous):
+        if previous:
+            await asyncio.wait([previous])
+        try:
+            result = await state.factory()
+        except asyncio.CancelledError:
+            if state.task is asyncio.current_task():
+                state.state = 'cancelled'
+                state.started = None
+            raise
+        except Exception as e:
+            if state.task is asyncio.current_task():
+                self.failed(state, e)
+            else:
+                self.logger.error('Task %s failed', state.name, exc_info=e)
+            return None
+        if state.task is asyncio.current_task():
+            state.state = 'done'
+            state.started = None
+            state.backoff = self.MIN_BACKOFF
+        return result
+
+    def failed(self, state, error):
+        state.failures += 1
+        state.last_error = repr(error)
+        if not state.restart:
+            self.logger.error('Task %s failed', state.name, exc_info=error)
+            state.state = 'failed'
+            state.started = None
+            return
+        if time.time() - state.started > self.MAX_BACKOFF:
+            state.backoff = self.MIN_BACKOFF    # it had been working
+        self.logger.error('Task %s failed, restarting in %ds', state.name,
+                          state.backoff, exc_info=error)
+        state.state = 'waiting'
+        state.started = None
+        state.retry = self.loop.call_later(state.backoff, self.restart, state)
+        state.backoff = min(state.backoff * 2, self.MAX_BACKOFF)
+
+    def restart(self, state):
+        state.retry = None
+        state.restarts += 1
+        self.run(state.name, state.factory, state.restart, state.timeout)
+
+    def stalled(self, now=None):
+        """Names of the tasks running for longer than their timeout."""
+        if now is None:
+            now = time.time()
+        return [state.name for state in self.tasks.values()
+                if state.timeout and state.started is not None and
+                now - state.started > state.timeout]
+
+
+class SystemdWatchdog:
+    """Keep systemd's watchdog (WatchdogSec= in clock.service) fed.
+
+    The App calls check() from its main loop, so a hung main loop stops
+    the pings; so does any stalled background task.  Either way systemd
+    then restarts us, rather than the clock sitting there frozen.  Does
+    nothing unless systemd set WATCHDOG_USEC for this process.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.interval = None
+        usec = os.environ.get('WATCHDOG_USEC')
+        pid = os.environ.get('WATCHDOG_PID')
+        if usec and (not pid or int(pid) == os.getpid()):
+            # ping twice per timeout, as sd_watchdog_enabled(3) suggests
+            self.interval = int(usec) / 1e6 / 2
+            self.logger.info('systemd watchdog: ping every %.1fs',
+                             self.interval)
+        self.next_ping = 0
+        self.pings = 0
+        self.stalled = []
+
+    def check(self, stalled, now=None):
+        """Ping, if it's time to and STALLED (task names) is empty."""
+        if self.interval is None:
+            return
+        if stalled != self.stalled:
+            if stalled:
+                self.logger.error('Stalled: %s - holding back watchdog pings',
+                                  ', '.join(stalled))
+            else:
+                self.logger.info('No stalled tasks - watchdog pings resume')
+            self.stalled = stalled
+        if now is None:
+            now = time.time()
+        if stalled or now < self.next_ping:
+            return
+        if sd_notify('WATCHDOG=1'):
+            self.pings += 1
+        self.next_ping = now + self.interval
+
+    def time_to_ping(self, now=None):
+        """Seconds until the next ping is due (inf if not enabled)."""
+        if self.interval is None:
+            return math.inf
+        if now is None:
+            now = time.time()
+        return max(0, self.next_ping - now)
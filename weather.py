@@ -8,6 +8,7 @@ import urllib.request
 import urllib.parse
 
 from secrets import secrets
+from units import get_converter
 
 
 
@@ -42,13 +43,18 @@ class OpenWeather:
     DATA_SOURCE_URL = "http://api.openweathermap.org/data/2.5/weather"
 
     def __init__(self):
-        self.logger = logging.getLogger()
+        self.logger = logging.getLogger(__name__)
         self.temperature = None
         self.city_name = None
         self.main_text = None
         self.description = None
         self.icon = None
-        self.use_celsius = False # set in constructor?
+        self.set_units(use_celsius=False)
+
+    def set_units(self, use_celsius):
+        self.use_celsius = use_celsius
+        self.unit_letter = 'C' if use_celsius else 'F'
+        self.from_kelvin = get_converter('K', self.unit_letter)
 
     def update_weather(self, weather):
         self.city_name = weather["name"] + ", " + weather["sys"]["country"]
@@ -59,12 +65,9 @@ class OpenWeather:
         self.description = d[0].upper() + d[1:]
         # "thunderstorm with heavy drizzle"
 
-        temp = weather["main"]["temp"] - 273.15  # its...in kelvin
-        if self.use_celsius:
-            self.temperature = f'{temp:.1f} °C'
-        else:
-            temp = ((temp * 9 / 5) + 32)
-            self.temperature = f'{temp:.1f} °F'
+        # its...in kelvin
+        temp = self.from_kelvin(weather["main"]["temp"])
+        self.temperature = f'{temp:.1f} °{self.unit_letter}'
 
     def get_weather_info(self):
         # You'll need to get a token from openweathermap.org, put it here:
@@ -87,13 +90,12 @@ class OpenWeather:
             ## urllib will raise an exception if not 200/etc
             if resp.status == 200:
                 value = resp.read().decode('utf-8')
-                self.logger.debug("Weather Response is: {value}")
+                self.logger.debug('Weather Response is: %s', value)
                 weather = json.loads(value)
                 return weather
             else:
-                self.logger.info(
-                    f'Weather fetch failed: status={resp.status}, reason={resp.reason}'
-                )
+                self.logger.info('Weather fetch failed: status=%s, reason=%s',
+                                 resp.status, resp.reason)
                 return None         # ???
 
         # response = urllib.request.urlopen(DATA_SOURCE)